@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+from multiprocessing import Pool
+
+"""
+Download Cache Benchmark for ETO Backup & Restore Application
+
+Several "staging servers" (processes) restore the same archives from the local S3 stand-in at the same time,
+each into its own staging directory, first without and then with a shared `DownloadCache`. A second pass adds
+one more server that only sees the first cache as a read-only shared directory. Reports bytes fetched from S3,
+wall-clock time and how each copy was materialised.
+
+Usage (from the `Scripts` directory):
+    python -m benchmarks.cache_benchmark --size-mb 64 --archives 3 --processes 4 --bandwidth-mbps 100 --work-dir /tmp/eto_cache
+
+Functions:
+1. build_archives(s3_root, archives, size_mb, seed) - Writes the synthetic archives and returns their keys.
+2. restore_server(job) - Fetches every archive into one staging directory (one process per server).
+3. run_pass(args, s3_root, keys, name, cache_directory, shared_directories) - Runs all servers concurrently.
+4. main() - Runs the comparison and prints the results as JSON.
+"""
+
+logging.basicConfig(stream=sys.stderr, level=logging.INFO, format="%(asctime)s - %(processName)s - %(message)s")
+
+from benchmarks.local_s3 import LocalS3Client  # noqa: E402
+from utils.cache_utils import DownloadCache  # noqa: E402
+from utils.s3_utils import download_file  # noqa: E402
+
+MB = 1024 * 1024
+BUCKET = "bench-bucket"
+
+# 1. Build Archives Function
+def build_archives(s3_root, archives, size_mb, seed):
+    """
+    (1) Writes `archives` random archives of `size_mb` MB and returns their keys.
+    """
+    generator = random.Random(seed)
+    keys = []
+    for index in range(archives):
+        key = f"SQLBackups/benchDB_LOG_2025010100{index:02d}00.7z"
+        path = os.path.join(s3_root, BUCKET, *key.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as archive:
+            archive.write(generator.randbytes(size_mb * MB))
+        keys.append(key)
+    return keys
+
+# 2. Restore Server Function
+def restore_server(job):
+    """
+    (2) Fetches every key into `staging_directory`, through the cache when one is configured.
+    Returns the bytes this server fetched from S3 and the materialisation method of each file.
+    """
+    s3_client = LocalS3Client(job["s3_root"], bandwidth_mbps=job["bandwidth_mbps"])
+    cache = (DownloadCache(job["cache_directory"], shared_directories=job["shared_directories"])
+             if job["cache_directory"] else None)
+    os.makedirs(job["staging_directory"], exist_ok=True)
+    methods = []
+    for key in job["keys"]:
+        destination_path = os.path.join(job["staging_directory"], os.path.basename(key))
+        if cache:
+            cache.fetch(s3_client, BUCKET, key, destination_path,
+                        lambda object_path: download_file(key, object_path, bucket_name=BUCKET, s3_client=s3_client))
+            methods.append("hardlink" if os.stat(destination_path).st_nlink > 1 else "copy")
+        else:
+            download_file(key, destination_path, bucket_name=BUCKET, s3_client=s3_client)
+            methods.append("download")
+    return {"fetched_bytes": s3_client.bytes_served, "methods": methods}
+
+# 3. Run Pass Function
+def run_pass(args, s3_root, keys, name, cache_directory=None, shared_directories=(), processes=None):
+    """
+    (3) Runs `processes` servers at once and returns the S3 bytes fetched, seconds and methods used.
+    """
+    processes = processes or args.processes
+    jobs = [{
+        "s3_root": s3_root,
+        "bandwidth_mbps": args.bandwidth_mbps,
+        "cache_directory": cache_directory,
+        "shared_directories": list(shared_directories),
+        "staging_directory": os.path.join(args.work_dir, name, f"server{index}"),
+        "keys": keys,
+    } for index in range(processes)]
+    started = time.monotonic()
+    with Pool(processes) as pool:
+        results = pool.map(restore_server, jobs)
+    methods = {}
+    for result in results:
+        for method in result["methods"]:
+            methods[method] = methods.get(method, 0) + 1
+    return {
+        "servers": processes,
+        "seconds": round(time.monotonic() - started, 2),
+        "fetched_mb": round(sum(result["fetched_bytes"] for result in results) / MB, 1),
+        "methods": methods,
+    }
+
+# 4. Main Function
+def main():
+    """
+    (4) Compares concurrent restores without a cache, with a shared cache and from a read-only shared cache.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the shared download cache across restore servers.")
+    parser.add_argument("--size-mb", type=int, default=64, help="Size of each synthetic archive in MB.")
+    parser.add_argument("--archives", type=int, default=3, help="Number of archives every server restores.")
+    parser.add_argument("--processes", type=int, default=4, help="Number of concurrent servers.")
+    parser.add_argument("--bandwidth-mbps", type=float, default=100, help="Simulated per-connection S3 throughput.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--work-dir", default=os.path.join(os.getcwd(), "eto_cache_bench"))
+    args = parser.parse_args()
+
+    shutil.rmtree(args.work_dir, ignore_errors=True)
+    s3_root = os.path.join(args.work_dir, "s3")
+    keys = build_archives(s3_root, args.archives, args.size_mb, args.seed)
+    cache_directory = os.path.join(args.work_dir, "cache")
+
+    uncached = run_pass(args, s3_root, keys, "uncached")
+    cached = run_pass(args, s3_root, keys, "cached", cache_directory)
+    # Another host: its own local cache, the first cache mounted read-only
+    shared = run_pass(args, s3_root, keys, "shared", os.path.join(args.work_dir, "host2_cache"),
+                      shared_directories=[cache_directory], processes=1)
+
+    results = {
+        "archive_mb": args.size_mb,
+        "archives": args.archives,
+        "bandwidth_mbps": args.bandwidth_mbps,
+        "uncached": uncached,
+        "cached": cached,
+        "shared_read_only": shared,
+        "fetched_mb_saved": round(uncached["fetched_mb"] - cached["fetched_mb"], 1),
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import sys
+import logging
+from datetime import datetime, timedelta
+
+"""
+Restore Chain Checks for ETO Backup & Restore Application
+
+Assertion-based checks of the pure chain planner (`utils.chain_utils`) with synthetic backup headers and an
+in-memory catalog: no S3, SQL Server or 7-Zip needed. Each check raises AssertionError on a wrong decision.
+
+Usage (from the `Scripts` directory):
+    python -m benchmarks.chain_checks
+
+Functions:
+1. make_header(backup_type, first_lsn, last_lsn, ...) - Builds a synthetic BackupHeader.
+2. walk_chain(headers, stop_at=None) - Feeds headers to `check_chain_link` in order, as the restore loop does.
+3. make_catalog(keys) - Builds a BackupCatalog from backup key names.
+4. check_valid_chain() - FULL -> DIFF -> LOGs is restored file by file.
+5. check_log_gap() - A LOG that starts after the chain's LastLSN stops the restore.
+6. check_diff_base_mismatch() - A DIFF of another FULL is rejected and the planner falls back to an older DIFF.
+7. check_log_ordering() - LOGs already covered are skipped; the chain must start with one FULL.
+8. check_empty_log_set() - A chain without LOG backups is FULL (+ DIFF) only.
+9. check_stop_at_log_selection() - `--stop-at` plans and restores up to the LOG that contains the target.
+10. check_stop_at_before_full() - A target before every FULL has no chain; an older FULL is used when there is one.
+11. check_stop_at_after_last_log() - A target after the last LOG is never reached and the restore fails.
+12. main() - Runs every check and prints a summary.
+"""
+
+logging.basicConfig(stream=sys.stderr, level=logging.WARNING, format="%(levelname)s - %(message)s")
+
+from utils.catalog_utils import BackupCatalog, parse_backup_key  # noqa: E402
+from utils.chain_utils import (  # noqa: E402
+    BackupHeader, plan_chain_keys, check_chain_link, reaches_target, stops_at_target
+)
+
+PREFIX = "SQLBackups/"
+DATABASE = "checkDB"
+BASE_TIME = datetime(2025, 3, 1)
+
+# 1. Make Header Function
+def make_header(backup_type, first_lsn, last_lsn, checkpoint_lsn=None, differential_base_lsn=None, finished=None,
+                key=None):
+    """
+    (1) Builds a synthetic BackupHeader; `finished` is minutes after BASE_TIME.
+    """
+    return BackupHeader(
+        path=f"/synthetic/{key or backup_type}.bak",
+        key=key or f"{backup_type}_{first_lsn}_{last_lsn}",
+        backup_type=backup_type,
+        database_name=DATABASE,
+        first_lsn=first_lsn,
+        last_lsn=last_lsn,
+        database_backup_lsn=None,
+        differential_base_lsn=differential_base_lsn,
+        checkpoint_lsn=checkpoint_lsn if checkpoint_lsn is not None else first_lsn,
+        backup_start=None,
+        backup_finish=None if finished is None else BASE_TIME + timedelta(minutes=finished),
+    )
+
+# 2. Walk Chain Function
+def walk_chain(headers, stop_at=None):
+    """
+    (2) Returns the `check_chain_link` step of every header, appending restored ones to the chain.
+    Stops at "done" like the restore loop.
+    """
+    chain, steps = [], []
+    for header in headers:
+        step = check_chain_link(chain, header, stop_at)
+        steps.append(step)
+        if step == "restore":
+            chain.append(header)
+        if step == "done":
+            break
+    return steps
+
+# 3. Make Catalog Function
+def make_catalog(keys):
+    """
+    (3) Builds a BackupCatalog from `<database>_<TYPE>_<timestamp>.7z` names (no S3 listing).
+    """
+    catalog = BackupCatalog("check-bucket", PREFIX, s3_client=object())
+    for name in keys:
+        catalog.add(parse_backup_key(PREFIX + name))
+    return catalog
+
+def _planned(catalog, **kwargs):
+    return [entry.key[len(PREFIX):] for entry in plan_chain_keys(catalog, database=DATABASE, **kwargs)]
+
+# 4. Check Valid Chain Function
+def check_valid_chain():
+    """
+    (4) The newest FULL, the newest DIFF after it and the LOGs after the DIFF are planned, and each file
+    extends the chain.
+    """
+    catalog = make_catalog([
+        "checkDB_FULL_20250220000000.7z", "checkDB_DIFF_20250221000000.7z", "checkDB_LOG_20250221010000.7z",
+        "checkDB_FULL_20250301000000.7z", "checkDB_DIFF_20250301060000.7z", "checkDB_DIFF_20250301120000.7z",
+        "checkDB_LOG_20250301110000.7z", "checkDB_LOG_20250301130000.7z", "checkDB_LOG_20250301140000.7z",
+    ])
+    assert _planned(catalog) == [
+        "checkDB_FULL_20250301000000.7z", "checkDB_DIFF_20250301120000.7z",
+        "checkDB_LOG_20250301130000.7z", "checkDB_LOG_20250301140000.7z",
+    ], _planned(catalog)
+
+    headers = [
+        make_header("FULL", 100, 150, checkpoint_lsn=120),
+        make_header("DIFF", 300, 400, differential_base_lsn=120),
+        make_header("LOG", 400, 500),
+        make_header("LOG", 500, 600),
+    ]
+    assert walk_chain(headers) == ["restore"] * 4, walk_chain(headers)
+
+# 5. Check Log Gap Function
+def check_log_gap():
+    """
+    (5) A LOG whose FirstLSN is past the chain's LastLSN cannot be restored: a LOG backup is missing.
+    """
+    chain = [make_header("FULL", 100, 150, checkpoint_lsn=120), make_header("LOG", 150, 200)]
+    try:
+        check_chain_link(chain, make_header("LOG", 250, 300))
+    except ValueError as e:
+        assert "gap" in str(e), e
+    else:
+        raise AssertionError("a LOG gap was not detected")
+    # Overlapping is fine: the next LOG may start before the chain's LastLSN
+    assert check_chain_link(chain, make_header("LOG", 180, 260)) == "restore"
+
+# 6. Check DIFF Base Mismatch Function
+def check_diff_base_mismatch():
+    """
+    (6) A DIFF based on another FULL is rejected; re-planning without it picks the previous DIFF.
+    """
+    full = make_header("FULL", 100, 150, checkpoint_lsn=120)
+    assert check_chain_link([full], make_header("DIFF", 300, 400, differential_base_lsn=999)) == "reject"
+    assert check_chain_link([full], make_header("DIFF", 300, 400, differential_base_lsn=120)) == "restore"
+    # Only one DIFF per chain, straight after the FULL
+    chain = [full, make_header("LOG", 150, 200)]
+    assert check_chain_link(chain, make_header("DIFF", 300, 400, differential_base_lsn=120)) == "reject"
+
+    catalog = make_catalog([
+        "checkDB_FULL_20250301000000.7z", "checkDB_DIFF_20250301060000.7z", "checkDB_DIFF_20250301120000.7z",
+        "checkDB_LOG_20250301130000.7z",
+    ])
+    assert _planned(catalog, exclude={PREFIX + "checkDB_DIFF_20250301120000.7z"}) == [
+        "checkDB_FULL_20250301000000.7z", "checkDB_DIFF_20250301060000.7z", "checkDB_LOG_20250301130000.7z",
+    ], _planned(catalog, exclude={PREFIX + "checkDB_DIFF_20250301120000.7z"})
+
+# 7. Check Log Ordering Function
+def check_log_ordering():
+    """
+    (7) LOGs are planned in timestamp order; a LOG already covered by the chain is skipped, and the chain
+    must start with exactly one FULL.
+    """
+    catalog = make_catalog([
+        "checkDB_LOG_20250301030000.7z", "checkDB_FULL_20250301000000.7z", "checkDB_LOG_20250301010000.7z",
+        "checkDB_LOG_20250301020000.7z",
+    ])
+    assert _planned(catalog) == [
+        "checkDB_FULL_20250301000000.7z", "checkDB_LOG_20250301010000.7z", "checkDB_LOG_20250301020000.7z",
+        "checkDB_LOG_20250301030000.7z",
+    ], _planned(catalog)
+
+    headers = [
+        make_header("FULL", 100, 300, checkpoint_lsn=120),
+        make_header("LOG", 90, 250),  # taken during the FULL: already covered
+        make_header("LOG", 250, 400),
+        make_header("LOG", 400, 500),
+    ]
+    assert walk_chain(headers) == ["restore", "skip", "restore", "restore"], walk_chain(headers)
+
+    for first, message in ((make_header("LOG", 100, 200), "must start with a FULL"),
+                           (make_header("DIFF", 300, 400, differential_base_lsn=120), "must start with a FULL")):
+        try:
+            check_chain_link([], first)
+        except ValueError as e:
+            assert message in str(e), e
+        else:
+            raise AssertionError(f"a chain starting with {first.backup_type} was accepted")
+    try:
+        check_chain_link([headers[0]], make_header("FULL", 600, 700))
+    except ValueError as e:
+        assert "second FULL" in str(e), e
+    else:
+        raise AssertionError("a second FULL was accepted")
+
+# 8. Check Empty Log Set Function
+def check_empty_log_set():
+    """
+    (8) Without LOG backups the chain is the FULL and its newest DIFF (or the FULL alone).
+    """
+    catalog = make_catalog(["checkDB_FULL_20250301000000.7z", "checkDB_DIFF_20250301120000.7z"])
+    assert _planned(catalog) == ["checkDB_FULL_20250301000000.7z", "checkDB_DIFF_20250301120000.7z"], \
+        _planned(catalog)
+    assert _planned(make_catalog(["checkDB_FULL_20250301000000.7z"])) == ["checkDB_FULL_20250301000000.7z"]
+    assert _planned(make_catalog(["checkDB_LOG_20250301010000.7z"])) == []
+
+    headers = [make_header("FULL", 100, 150, checkpoint_lsn=120),
+               make_header("DIFF", 300, 400, differential_base_lsn=120)]
+    assert walk_chain(headers) == ["restore", "restore"], walk_chain(headers)
+
+# 9. Check Stop At Log Selection Function
+def check_stop_at_log_selection():
+    """
+    (9) With `stop_at` the chain ends with the first LOG taken at or after the target (it contains the target);
+    that LOG alone is restored WITH STOPAT and the chain is done once it is restored.
+    """
+    catalog = make_catalog([
+        "checkDB_FULL_20250301000000.7z", "checkDB_LOG_20250301050000.7z", "checkDB_DIFF_20250301060000.7z",
+        "checkDB_LOG_20250301070000.7z", "checkDB_LOG_20250301080000.7z", "checkDB_LOG_20250301090000.7z",
+    ])
+    head = ["checkDB_FULL_20250301000000.7z", "checkDB_DIFF_20250301060000.7z", "checkDB_LOG_20250301070000.7z"]
+    assert _planned(catalog, stop_at=datetime(2025, 3, 1, 7, 30)) == head + ["checkDB_LOG_20250301080000.7z"]
+    # A target exactly at a LOG's time needs no later LOG
+    assert _planned(catalog, stop_at=datetime(2025, 3, 1, 8)) == head + ["checkDB_LOG_20250301080000.7z"]
+    assert _planned(catalog, stop_at=datetime(2025, 3, 1, 7)) == head
+    # Before the DIFF: the DIFF is skipped and the LOGs from the FULL lead to the target
+    assert _planned(catalog, stop_at=datetime(2025, 3, 1, 5, 30)) == [
+        "checkDB_FULL_20250301000000.7z", "checkDB_LOG_20250301050000.7z", "checkDB_LOG_20250301070000.7z",
+    ], _planned(catalog, stop_at=datetime(2025, 3, 1, 5, 30))
+
+    stop_at = BASE_TIME + timedelta(minutes=450)  # 07:30
+    full = make_header("FULL", 100, 150, checkpoint_lsn=120, finished=10)
+    logs = [make_header("LOG", 150, 200, finished=420),   # 07:00, before the target
+            make_header("LOG", 200, 250, finished=480),   # 08:00, contains the target
+            make_header("LOG", 250, 300, finished=540)]   # 09:00, not needed
+    assert walk_chain([full] + logs, stop_at) == ["restore", "restore", "restore", "done"], \
+        walk_chain([full] + logs, stop_at)
+    assert [stops_at_target(log, stop_at) for log in logs] == [False, True, True]
+    assert not stops_at_target(full, stop_at) and not stops_at_target(logs[1], None)
+    assert not reaches_target([full, logs[0]], stop_at)
+    assert reaches_target([full, logs[0], logs[1]], stop_at)
+    # A LOG finishing exactly at the target contains it
+    assert reaches_target([full, logs[0]], BASE_TIME + timedelta(minutes=420))
+
+# 10. Check Stop At Before FULL Function
+def check_stop_at_before_full():
+    """
+    (10) A target before every FULL backup plans no chain (the restore stops with "No FULL backup");
+    with an older FULL the chain is built from it, and a FULL alone never reaches a target.
+    """
+    catalog = make_catalog(["checkDB_FULL_20250301000000.7z", "checkDB_LOG_20250301010000.7z"])
+    assert _planned(catalog, stop_at=datetime(2025, 2, 28, 23, 59)) == []
+
+    catalog = make_catalog([
+        "checkDB_FULL_20250220000000.7z", "checkDB_LOG_20250220010000.7z", "checkDB_LOG_20250220020000.7z",
+        "checkDB_FULL_20250301000000.7z", "checkDB_LOG_20250301010000.7z",
+    ])
+    assert _planned(catalog, stop_at=datetime(2025, 2, 20, 1, 30)) == [
+        "checkDB_FULL_20250220000000.7z", "checkDB_LOG_20250220010000.7z", "checkDB_LOG_20250220020000.7z",
+    ], _planned(catalog, stop_at=datetime(2025, 2, 20, 1, 30))
+
+    full = make_header("FULL", 100, 150, checkpoint_lsn=120, finished=600)
+    assert not reaches_target([full], BASE_TIME + timedelta(minutes=30))
+    assert not reaches_target([], BASE_TIME)
+
+# 11. Check Stop At After Last LOG Function
+def check_stop_at_after_last_log():
+    """
+    (11) A target after the last LOG plans every LOG, but the chain never reaches it: the restore loop never
+    sees "done", the last file is restored WITH STOPAT and the final check rejects the chain.
+    """
+    catalog = make_catalog([
+        "checkDB_FULL_20250301000000.7z", "checkDB_LOG_20250301010000.7z", "checkDB_LOG_20250301020000.7z",
+    ])
+    assert _planned(catalog, stop_at=datetime(2025, 3, 1, 12)) == [
+        "checkDB_FULL_20250301000000.7z", "checkDB_LOG_20250301010000.7z", "checkDB_LOG_20250301020000.7z",
+    ], _planned(catalog, stop_at=datetime(2025, 3, 1, 12))
+
+    stop_at = BASE_TIME + timedelta(hours=12)
+    chain = [make_header("FULL", 100, 150, checkpoint_lsn=120, finished=10),
+             make_header("LOG", 150, 200, finished=60),
+             make_header("LOG", 200, 250, finished=120)]
+    assert walk_chain(chain, stop_at) == ["restore"] * 3, walk_chain(chain, stop_at)
+    assert not stops_at_target(chain[-1], stop_at) and stops_at_target(chain[-1], stop_at, last=True)
+    assert not reaches_target(chain, stop_at)
+
+CHECKS = [
+    check_valid_chain, check_log_gap, check_diff_base_mismatch, check_log_ordering, check_empty_log_set,
+    check_stop_at_log_selection, check_stop_at_before_full, check_stop_at_after_last_log,
+]
+
+# 12. Main Function
+def main():
+    """
+    (12) Runs every check; exits non-zero on the first failure.
+    """
+    for check in CHECKS:
+        check()
+        print(f"ok   {check.__name__}")
+    print(f"{len(CHECKS)} chain checks passed")
+
+if __name__ == "__main__":
+    main()
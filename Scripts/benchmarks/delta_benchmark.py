@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+
+"""
+Delta Sync Benchmark for ETO Backup & Restore Application
+
+Serves two consecutive "nightly" archives from the local S3 stand-in: a previous archive and a new one that
+shares most of its bytes (a few inserted and overwritten regions). The previous archive is downloaded first,
+then the new one is downloaded twice: whole, and with `delta=True` reusing the previous archive's chunks.
+Reports bytes fetched from S3, wall-clock time and chunking throughput. The fallback checks then corrupt the
+previous archive and fail a ranged GET, and assert the delta download still produces the new archive.
+
+Usage (from the `Scripts` directory):
+    python -m benchmarks.delta_benchmark --size-mb 512 --change-percent 5 --bandwidth-mbps 100 --work-dir /tmp/eto_delta
+
+Functions:
+1. build_archives(s3_root, size_mb, change_percent, seed) - Writes the previous and new synthetic archives.
+2. publish_manifest(s3_client, archive_path, key) - Chunks an archive and uploads `<key>.chunks.json`.
+3. timed_download(s3_client, key, destination_path, delta) - Downloads one key and returns time and bytes fetched.
+4. check_chain_keys(s3_client) - Asserts the chain planner picks archives, not their chunk manifests.
+5. FlakyS3Client(root_directory, key, failures=1, ...) - Local S3 stand-in whose next ranged GETs of one key fail.
+6. check_delta_fallback(s3_root, work_dir, new_path, bandwidth_mbps) - Corrupt source chunks and a failed GET.
+7. main() - Runs the comparison and prints the results as JSON.
+"""
+
+logging.basicConfig(stream=sys.stderr, level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+from benchmarks.local_s3 import LocalS3Client  # noqa: E402
+from utils.delta_utils import build_chunk_manifest, CHUNK_MANIFEST_SUFFIX  # noqa: E402
+from utils.s3_utils import download_file  # noqa: E402
+from utils.catalog_utils import BackupCatalog  # noqa: E402
+from utils.chain_utils import plan_chain_keys  # noqa: E402
+
+MB = 1024 * 1024
+BUCKET = "bench-bucket"
+PREVIOUS_KEY = "SQLBackups/benchDB_FULL_20250101000000.7z"
+NEW_KEY = "SQLBackups/benchDB_FULL_20250102000000.7z"
+
+# 1. Build Archives Function
+def build_archives(s3_root, size_mb, change_percent, seed):
+    """
+    (1) Writes a random previous archive of `size_mb` MB and a new archive derived from it: `change_percent`
+    of the bytes are rewritten in a handful of regions, half of them as insertions (which shift everything after
+    them) and half as in-place overwrites. Returns both paths.
+    """
+    generator = random.Random(seed)
+    # randbytes() is limited to 256 MB per call
+    previous = bytearray(b"".join(generator.randbytes(MB) for _ in range(size_mb)))
+    new = bytearray(previous)
+    regions = 8
+    region_size = max(1, int(size_mb * MB * change_percent / 100 / regions))
+    for index in range(regions):
+        offset = generator.randrange(0, max(1, len(new) - region_size))
+        if index % 2:
+            new[offset:offset + region_size] = generator.randbytes(region_size)
+        else:
+            new[offset:offset] = generator.randbytes(region_size)
+
+    paths = []
+    for key, data in ((PREVIOUS_KEY, previous), (NEW_KEY, new)):
+        path = os.path.join(s3_root, BUCKET, *key.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as archive:
+            archive.write(data)
+        paths.append(path)
+    return paths
+
+# 2. Publish Manifest Function
+def publish_manifest(s3_client, archive_path, key):
+    """
+    (2) Chunks `archive_path` as the producer would and uploads the manifest as `<key>.chunks.json`.
+    Returns the chunking throughput in MB/s.
+    """
+    started = time.perf_counter()
+    manifest = build_chunk_manifest(archive_path)
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    s3_client.put_object(Bucket=BUCKET, Key=key + CHUNK_MANIFEST_SUFFIX, Body=json.dumps(manifest).encode("utf-8"))
+    return round(manifest["size"] / MB / elapsed, 1)
+
+# 3. Timed Download Function
+def timed_download(s3_client, key, destination_path, delta):
+    """
+    (3) Downloads `key` to `destination_path` and returns wall-clock seconds and bytes served by S3.
+    """
+    served = s3_client.bytes_served
+    started = time.monotonic()
+    download_file(key, destination_path, bucket_name=BUCKET, s3_client=s3_client, delta=delta)
+    return {
+        "seconds": round(time.monotonic() - started, 2),
+        "fetched_mb": round((s3_client.bytes_served - served) / MB, 1),
+    }
+
+# 4. Check Chain Keys Function
+def check_chain_keys(s3_client):
+    """
+    (4) Lists the bucket (archives and their `.chunks.json` manifests) into a catalog and asserts that
+    `plan_chain_keys` selects the newest archive. Returns the planned keys.
+    """
+    catalog = BackupCatalog(BUCKET, "SQLBackups/", s3_client=s3_client)
+    catalog.refresh()
+    keys = [entry.key for entry in plan_chain_keys(catalog, database="benchDB")]
+    assert keys == [NEW_KEY], f"chain planner picked {keys}, expected [{NEW_KEY}]"
+    return keys
+
+# 5. Flaky S3 Client
+class FlakyS3Client(LocalS3Client):
+    """
+    (5) LocalS3Client whose next `failures` ranged GETs of `key` raise, as a dropped connection would.
+    """
+    def __init__(self, root_directory, key, failures=1, **kwargs):
+        super().__init__(root_directory, **kwargs)
+        self.key = key
+        self.failures = failures
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        with self.lock:
+            fail = Key == self.key and Range is not None and self.failures > 0
+            self.failures -= fail
+        if fail:
+            raise ConnectionError(f"Connection reset while reading {Key} ({Range})")
+        return super().get_object(Bucket, Key, Range=Range, **kwargs)
+
+# 6. Check Delta Fallback Function
+def check_delta_fallback(s3_root, work_dir, new_path, bandwidth_mbps):
+    """
+    (6) Downloads the previous archive as a delta source, then the new archive with `delta=True`:
+
+    - after overwriting part of the previous archive on disk, so its chunks no longer match their hashes;
+    - with the first ranged GET of the new archive failing, so the delta rebuild itself fails.
+
+    Asserts each result equals the new archive and leaves no `.temp` file. Returns the MB fetched by each case.
+    """
+    with open(new_path, "rb") as new_file:
+        expected = new_file.read()
+    fetched = {}
+    for case in ("corrupt_source", "failed_range_get"):
+        directory = os.path.join(work_dir, "fallback", case)
+        os.makedirs(directory)
+        s3_client = FlakyS3Client(s3_root, NEW_KEY, failures=0, bandwidth_mbps=bandwidth_mbps)
+        previous_path = os.path.join(directory, os.path.basename(PREVIOUS_KEY))
+        download_file(PREVIOUS_KEY, previous_path, bucket_name=BUCKET, s3_client=s3_client, delta=True)
+        if case == "corrupt_source":
+            with open(previous_path, "r+b") as previous_file:
+                previous_file.seek(os.path.getsize(previous_path) // 3)
+                previous_file.write(bytes(4 * MB))
+        else:
+            s3_client.failures = 1
+
+        destination_path = os.path.join(directory, os.path.basename(NEW_KEY))
+        fetched[case] = timed_download(s3_client, NEW_KEY, destination_path, True)["fetched_mb"]
+        with open(destination_path, "rb") as result_file:
+            assert result_file.read() == expected, f"{case}: delta download does not match the new archive"
+        assert not os.path.exists(destination_path + ".temp"), f"{case}: {destination_path}.temp was left behind"
+    return fetched
+
+# 7. Main Function
+def main():
+    """
+    (7) Downloads the new archive whole and as a delta against the previous one, and prints a JSON comparison.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark delta vs full download of a nightly archive.")
+    parser.add_argument("--size-mb", type=int, default=256, help="Size of the synthetic archives in MB.")
+    parser.add_argument("--change-percent", type=float, default=5, help="Share of the new archive that changed.")
+    parser.add_argument("--bandwidth-mbps", type=float, default=100, help="Simulated per-connection S3 throughput.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--work-dir", default=os.path.join(os.getcwd(), "eto_delta_bench"))
+    args = parser.parse_args()
+
+    shutil.rmtree(args.work_dir, ignore_errors=True)
+    s3_root = os.path.join(args.work_dir, "s3")
+    previous_path, new_path = build_archives(s3_root, args.size_mb, args.change_percent, args.seed)
+    s3_client = LocalS3Client(s3_root, bandwidth_mbps=args.bandwidth_mbps)
+    chunking_mbps = publish_manifest(s3_client, previous_path, PREVIOUS_KEY)
+    publish_manifest(s3_client, new_path, NEW_KEY)
+    chain_keys = check_chain_keys(s3_client)
+
+    full_dir = os.path.join(args.work_dir, "full")
+    delta_dir = os.path.join(args.work_dir, "delta")
+    os.makedirs(full_dir)
+    os.makedirs(delta_dir)
+    full = timed_download(s3_client, NEW_KEY, os.path.join(full_dir, os.path.basename(NEW_KEY)), False)
+    # Last night's archive (downloaded with its chunk list) is what the delta download reuses
+    timed_download(s3_client, PREVIOUS_KEY, os.path.join(delta_dir, os.path.basename(PREVIOUS_KEY)), True)
+    delta = timed_download(s3_client, NEW_KEY, os.path.join(delta_dir, os.path.basename(NEW_KEY)), True)
+
+    with open(os.path.join(full_dir, os.path.basename(NEW_KEY)), "rb") as full_file, \
+            open(os.path.join(delta_dir, os.path.basename(NEW_KEY)), "rb") as delta_file:
+        identical = full_file.read() == delta_file.read()
+    fallback = check_delta_fallback(s3_root, args.work_dir, new_path, args.bandwidth_mbps)
+
+    results = {
+        "archive_mb": round(os.path.getsize(new_path) / MB, 1),
+        "change_percent": args.change_percent,
+        "bandwidth_mbps": args.bandwidth_mbps,
+        "chunking_mb_per_second": chunking_mbps,
+        "chain_keys": chain_keys,
+        "full": full,
+        "delta": delta,
+        "identical": identical,
+        "fetched_mb_saved": round(full["fetched_mb"] - delta["fetched_mb"], 1),
+        "seconds_saved": round(full["seconds"] - delta["seconds"], 2),
+        "fallback_fetched_mb": fallback,
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
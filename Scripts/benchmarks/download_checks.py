@@ -0,0 +1,194 @@
+import os
+import sys
+import shutil
+import logging
+import argparse
+import tempfile
+
+"""
+Download Checkpoint Checks for ETO Backup & Restore Application
+
+Assertion-based checks of the resumable downloader (`utils.s3_utils.download_file`) against the local S3
+stand-in: no AWS credentials needed. Each check raises AssertionError on a wrong decision.
+
+Usage (from the `Scripts` directory):
+    python -m benchmarks.download_checks
+
+Functions:
+1. InterruptedS3Client(root_directory, fail_after=None, ...) - Local S3 stand-in that drops the connection after N ranged GETs.
+2. put_object(s3_root, data) - Writes the checked object into the local bucket.
+3. interrupted_download(s3_client, destination_path, fail_after) - Runs a download that fails part way.
+4. check_resume_after_interruption(work_dir) - A rerun fetches only the parts not checkpointed.
+5. check_etag_change_restarts(work_dir) - A partial download of an overwritten key is discarded and restarted.
+6. check_checkpoint_writes(work_dir) - The manifest is saved every few parts, not after each one.
+7. main() - Runs every check and prints a summary.
+"""
+
+# The interrupted downloads log expected errors
+logging.basicConfig(stream=sys.stderr, level=logging.CRITICAL, format="%(levelname)s - %(message)s")
+
+from benchmarks.local_s3 import LocalS3Client  # noqa: E402
+import utils.s3_utils as s3_utils  # noqa: E402
+from utils.s3_utils import download_file, load_download_manifest  # noqa: E402
+
+KB = 1024
+BUCKET = "check-bucket"
+KEY = "SQLBackups/checkDB_FULL_20250301000000.7z"
+PART_KB = 64
+PARTS = 64
+
+# 1. Interrupted S3 Client
+class InterruptedS3Client(LocalS3Client):
+    """
+    (1) LocalS3Client whose ranged GETs fail once `fail_after` of them have been served, as a dropped
+    connection would. `fail_after=None` never fails.
+    """
+    def __init__(self, root_directory, fail_after=None, **kwargs):
+        super().__init__(root_directory, **kwargs)
+        self.fail_after = fail_after
+        self.ranged_gets = 0
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        if Range is not None:
+            with self.lock:
+                self.ranged_gets += 1
+                fail = self.fail_after is not None and self.ranged_gets > self.fail_after
+            if fail:
+                raise ConnectionError(f"Connection reset while reading {Key} ({Range})")
+        return super().get_object(Bucket, Key, Range=Range, **kwargs)
+
+# 2. Put Object Function
+def put_object(s3_root, data):
+    """
+    (2) Writes `data` as KEY in the local bucket (a new ETag whenever the bytes change).
+    """
+    path = os.path.join(s3_root, BUCKET, *KEY.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as target:
+        target.write(data)
+
+def _download(s3_client, destination_path):
+    return download_file(KEY, destination_path, bucket_name=BUCKET, s3_client=s3_client,
+                         part_size_mb=PART_KB / KB, max_workers=1)
+
+def _read(path):
+    with open(path, "rb") as source:
+        return source.read()
+
+# 3. Interrupted Download Function
+def interrupted_download(s3_client, destination_path, fail_after):
+    """
+    (3) Downloads KEY with one worker until the connection drops after `fail_after` parts.
+    Returns the manifest checkpointed when the download stopped.
+    """
+    s3_client.fail_after = fail_after
+    try:
+        _download(s3_client, destination_path)
+    except RuntimeError as e:
+        assert "Connection reset" in str(e), e
+    else:
+        raise AssertionError("the interrupted download did not fail")
+    s3_client.fail_after = None
+    assert os.path.exists(destination_path + ".temp"), "the partial download was not kept for resuming"
+    return load_download_manifest(destination_path)
+
+# 4. Check Resume After Interruption Function
+def check_resume_after_interruption(work_dir):
+    """
+    (4) Parts completed before the connection dropped are in the manifest even though they were not a multiple
+    of the checkpoint interval; the rerun fetches only the rest and produces the object.
+    """
+    s3_root = os.path.join(work_dir, "s3")
+    data = os.urandom(PARTS * PART_KB * KB)
+    put_object(s3_root, data)
+    s3_client = InterruptedS3Client(s3_root)
+    destination_path = os.path.join(work_dir, "staging", os.path.basename(KEY))
+    os.makedirs(os.path.dirname(destination_path))
+
+    manifest = interrupted_download(s3_client, destination_path, fail_after=10)
+    assert len(manifest["completed"]) == 10 and not manifest["complete"], manifest["completed"]
+
+    served = s3_client.bytes_served
+    _download(s3_client, destination_path)
+    assert s3_client.bytes_served - served == (PARTS - 10) * PART_KB * KB, s3_client.bytes_served - served
+    assert _read(destination_path) == data
+    assert load_download_manifest(destination_path)["complete"]
+
+# 5. Check ETag Change Restarts Function
+def check_etag_change_restarts(work_dir):
+    """
+    (5) A partial download whose key was overwritten in S3 (new ETag) is not resumed: the checkpointed parts
+    belong to the old object, so the whole new object is fetched and the manifest records the new ETag.
+    """
+    s3_root = os.path.join(work_dir, "s3")
+    put_object(s3_root, os.urandom(PARTS * PART_KB * KB))
+    s3_client = InterruptedS3Client(s3_root)
+    destination_path = os.path.join(work_dir, "staging", os.path.basename(KEY))
+    os.makedirs(os.path.dirname(destination_path))
+    old_etag = interrupted_download(s3_client, destination_path, fail_after=20)["etag"]
+
+    new_data = os.urandom(PARTS * PART_KB * KB)
+    put_object(s3_root, new_data)
+    new_etag = s3_client.head_object(Bucket=BUCKET, Key=KEY)["ETag"]
+    assert new_etag != old_etag
+
+    served = s3_client.bytes_served
+    _download(s3_client, destination_path)
+    assert s3_client.bytes_served - served == len(new_data), s3_client.bytes_served - served
+    assert _read(destination_path) == new_data, "parts of the old object were kept"
+    manifest = load_download_manifest(destination_path)
+    assert manifest["complete"] and manifest["etag"] == new_etag, manifest["etag"]
+
+# 6. Check Checkpoint Writes Function
+def check_checkpoint_writes(work_dir):
+    """
+    (6) Downloading PARTS parts saves the manifest about PARTS / download_checkpoint_parts times
+    (plus the initial and final saves), not once per part.
+    """
+    s3_root = os.path.join(work_dir, "s3")
+    data = os.urandom(PARTS * PART_KB * KB)
+    put_object(s3_root, data)
+    destination_path = os.path.join(work_dir, "staging", os.path.basename(KEY))
+    os.makedirs(os.path.dirname(destination_path))
+
+    saves = []
+    save_download_manifest = s3_utils.save_download_manifest
+
+    def counting_save(path, manifest):
+        saves.append(len(manifest["completed"]))
+        save_download_manifest(path, manifest)
+
+    s3_utils.save_download_manifest = counting_save
+    try:
+        _download(InterruptedS3Client(s3_root), destination_path)
+    finally:
+        s3_utils.save_download_manifest = save_download_manifest
+    expected = -(-PARTS // s3_utils.download_checkpoint_parts) + 2
+    assert len(saves) <= expected, f"{len(saves)} manifest writes for {PARTS} parts (expected at most {expected})"
+    assert _read(destination_path) == data
+
+CHECKS = [check_resume_after_interruption, check_etag_change_restarts, check_checkpoint_writes]
+
+# 7. Main Function
+def main():
+    """
+    (7) Runs every check in its own scratch directory; exits non-zero on the first failure.
+    """
+    parser = argparse.ArgumentParser(description="Check resumable download checkpoints against a local S3.")
+    parser.add_argument("--work-dir", default=None, help="Scratch directory (a temporary one by default).")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="eto_download_checks_")
+    try:
+        for check in CHECKS:
+            check_dir = os.path.join(work_dir, check.__name__)
+            shutil.rmtree(check_dir, ignore_errors=True)
+            check(check_dir)
+            print(f"ok   {check.__name__}")
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"{len(CHECKS)} download checks passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import os
+import re
+import json
+import time
+import threading
+from datetime import datetime
+
+"""
+Fake SQL Server for ETO Backup & Restore Benchmarks
+
+A pyodbc-compatible connection/cursor pair that understands the statements issued by `utils.db_utils`
+and `restore_script.py`, so the restore orchestration can be benchmarked on Linux without SQL Server.
+
+- RESTORE DATABASE/LOG statements sleep for `restore_latency_ms` plus the backup size at `restore_mbps`,
+  emit `WITH STATS` messages and move the database through RESTORING and ONLINE.
+- RESTORE HEADERONLY / FILELISTONLY read the JSON header written at the start of synthetic `.bak` files
+  (`write_synthetic_backup`).
+- `sys.dm_exec_requests` reports the progress of a running restore to monitor connections.
+- `ALTER DATABASE ... SET SINGLE_USER|RESTRICTED_USER` leaves one other session connected for `drain_seconds`
+  (sessions rolling back), reported by the draining query on `sys.dm_exec_sessions`.
+- The permissions diff query finds nothing, so every restore sends the full permissions batch.
+- Completed RESTOREs from disk are recorded in `history` and returned by the `msdb.dbo.restorehistory` query.
+
+Classes / Functions:
+1. FakeSqlServer(restore_mbps=400, restore_latency_ms=200, recovery_seconds=0.5, initial_state=None, drain_seconds=0) - Shared server state; `connect(dsn)` opens a FakeConnection.
+2. write_synthetic_backup(path, header, size_mb, database_files=None) - Writes a `.bak` with a JSON header the fake server can read.
+"""
+
+MB = 1024 * 1024
+HEADER_MAGIC = b"ETO-SYNTHETIC-BAK\n"
+HEADER_SIZE = 4096
+
+class FakeSqlError(Exception):
+    pass
+
+# 1. Fake SQL Server
+class FakeSqlServer:
+    """
+    (1) Shared state of the fake instance: database states, running requests and session ids.
+    """
+    def __init__(self, restore_mbps=400, restore_latency_ms=200, recovery_seconds=0.5, initial_state=None,
+                 drain_seconds=0):
+        self.restore_mbps = restore_mbps
+        self.restore_latency_ms = restore_latency_ms
+        self.recovery_seconds = recovery_seconds
+        self.initial_state = initial_state
+        self.drain_seconds = drain_seconds
+        self.user_access = {}
+        self.history = []
+        self.states = {}
+        self.requests = {}
+        self.statements = []
+        self.next_session_id = 51
+        self.lock = threading.Lock()
+
+    def connect(self, dsn, autocommit=True):
+        with self.lock:
+            session_id = self.next_session_id
+            self.next_session_id += 1
+        return FakeConnection(self, session_id)
+
+    def state(self, database_name):
+        with self.lock:
+            return self.states.get(database_name, self.initial_state)
+
+    def set_state(self, database_name, state):
+        with self.lock:
+            self.states[database_name] = state
+
+class FakeConnection:
+    def __init__(self, server, session_id):
+        self.server = server
+        self.session_id = session_id
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+class FakeCursor:
+    """
+    pyodbc-like cursor: execute(), fetchone(), fetchall(), nextset(), description and messages.
+    """
+    DISK_PATTERN = re.compile(r"DISK\s*=\s*N'((?:[^']|'')*)'", re.IGNORECASE)
+    NAME_PATTERN = re.compile(r"(?:DATABASE|LOG)\s+\[((?:[^\]]|\]\])*)\]", re.IGNORECASE)
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.server = connection.server
+        self.rows = []
+        self.description = None
+        self.messages = []
+
+    def _result(self, columns, rows):
+        self.description = [(column, None, None, None, None, None, True) for column in columns]
+        self.rows = list(rows)
+
+    def execute(self, sql, *params):
+        self.rows = []
+        self.description = None
+        self.messages = []
+        with self.server.lock:
+            self.server.statements.append(sql)
+        statement = " ".join(sql.split())
+        upper = statement.upper()
+
+        if upper.startswith("SELECT 1"):
+            self._result([""], [(1,)])
+        elif upper.startswith("SELECT @@SPID"):
+            self._result(["spid"], [(self.connection.session_id,)])
+        elif upper.startswith("SELECT STATE_DESC FROM SYS.DATABASES"):
+            name = re.search(r"name\s*=\s*'((?:[^']|'')*)'", statement, re.IGNORECASE).group(1).replace("''", "'")
+            state = self.server.state(name)
+            self._result(["state_desc"], [(state,)] if state else [])
+        elif upper.startswith("SELECT D.USER_ACCESS_DESC"):
+            name = re.search(r"d\.name\s*=\s*N'((?:[^']|'')*)'", statement, re.IGNORECASE).group(1).replace("''", "'")
+            access, since = self.server.user_access.get(name, ("MULTI_USER", 0))
+            sessions = 1 if time.monotonic() - since < self.server.drain_seconds else 0
+            self._result(["user_access_desc", ""], [(access, sessions)] if self.server.state(name) else [])
+        elif upper.startswith("ALTER DATABASE") and re.search(r"SET (SINGLE|RESTRICTED|MULTI)_USER", upper):
+            name = self.NAME_PATTERN.search(statement).group(1).replace("]]", "]")
+            access = re.search(r"SET ((?:SINGLE|RESTRICTED|MULTI)_USER)", upper).group(1)
+            with self.server.lock:
+                self.server.user_access[name] = (access, time.monotonic())
+        elif upper.startswith("SELECT PERCENT_COMPLETE"):
+            request = self.server.requests.get(params[0] if params else None)
+            if request:
+                elapsed = time.monotonic() - request["started"]
+                percent = min(99.9, 100 * elapsed / request["duration"]) if request["duration"] else 0
+                remaining_ms = max(0, (request["duration"] - elapsed) * 1000)
+                self._result(["percent_complete", "estimated_completion_time"], [(percent, remaining_ms)])
+            else:
+                self._result(["percent_complete", "estimated_completion_time"], [])
+        elif upper.startswith("SELECT TOP (1) RH.RESTORE_DATE"):
+            database_name = re.search(r"destination_database_name = N'((?:[^']|'')*)'", statement).group(1)
+            with self.server.lock:
+                rows = [row[1:] for row in self.server.history if row[0] == database_name.replace("''", "'")]
+            self._result(["restore_date", "restore_type", "first_lsn", "last_lsn", "checkpoint_lsn"], rows[-1:])
+        elif upper.startswith("SELECT 'LOGIN'"):
+            # permissions_utils diff query: the fake instance has no principals, grants or role members
+            self._result(["kind", "principal", "item"], [])
+        elif upper.startswith(("KILL", "ALTER DATABASE", "USE ", "SET XACT_ABORT")):
+            pass
+        elif upper.startswith("RESTORE HEADERONLY"):
+            header = read_synthetic_header(self._disks(statement)[0])
+            columns = ["BackupType", "DatabaseName", "FirstLSN", "LastLSN", "DatabaseBackupLSN",
+                       "DifferentialBaseLSN", "CheckpointLSN", "BackupStartDate", "BackupFinishDate"]
+            row = [header.get(column) for column in columns]
+            row[7:9] = [datetime.fromisoformat(value) if value else None for value in row[7:9]]
+            self._result(columns, [tuple(row)])
+        elif upper.startswith("RESTORE FILELISTONLY"):
+            header = read_synthetic_header(self._disks(statement)[0])
+            columns = ["LogicalName", "PhysicalName", "Type", "Size"]
+            self._result(columns, [tuple(database_file[column] for column in columns)
+                                   for database_file in header.get("database_files", [])])
+        elif upper.startswith("RESTORE VERIFYONLY"):
+            for path in self._disks(statement):
+                read_synthetic_header(path)
+            self._simulate(sum(os.path.getsize(path) for path in self._disks(statement)), stats=0)
+        elif upper.startswith(("RESTORE DATABASE", "RESTORE LOG")):
+            self._restore(statement, upper)
+        else:
+            raise FakeSqlError(f"Statement not supported by the fake SQL Server: {statement[:120]}")
+        return self
+
+    def _disks(self, statement):
+        disks = [path.replace("''", "'") for path in self.DISK_PATTERN.findall(statement)]
+        if not disks:
+            raise FakeSqlError(f"No DISK clause in: {statement[:120]}")
+        for path in disks:
+            if not os.path.exists(path):
+                raise FakeSqlError(f"Cannot open backup device '{path}'. Operating system error 2.")
+        return disks
+
+    def _restore(self, statement, upper):
+        database_name = self.NAME_PATTERN.search(statement).group(1).replace("]]", "]")
+        if " FROM " not in upper:
+            # RESTORE DATABASE [x] WITH RECOVERY
+            if self.server.state(database_name) != "RESTORING":
+                raise FakeSqlError(f"The database '{database_name}' is not in RESTORING state.")
+            time.sleep(self.server.recovery_seconds)
+            self.server.set_state(database_name, "ONLINE")
+            return
+
+        state = self.server.state(database_name)
+        is_full = upper.startswith("RESTORE DATABASE")
+        if state == "ONLINE" and not (is_full and "REPLACE" in upper):
+            raise FakeSqlError(f"The tail of the log for the database '{database_name}' has not been backed up.")
+        if not is_full and state != "RESTORING":
+            raise FakeSqlError(f"The database '{database_name}' is not in RESTORING state.")
+
+        stats_match = re.search(r"STATS\s*=\s*(\d+)", upper)
+        self.server.set_state(database_name, "RESTORING")
+        if is_full:
+            # The restored database takes the access mode stored in the backup
+            with self.server.lock:
+                self.server.user_access.pop(database_name, None)
+        self._simulate(sum(os.path.getsize(path) for path in self._disks(statement)),
+                       stats=int(stats_match.group(1)) if stats_match else 0)
+        header = read_synthetic_header(self._disks(statement)[0])
+        with self.server.lock:
+            self.server.history.append((database_name, datetime.now(), {1: "D", 5: "I", 2: "L"}[header["BackupType"]],
+                                        header["FirstLSN"], header["LastLSN"], header["CheckpointLSN"]))
+        if re.search(r"\bRECOVERY\b", upper.replace("NORECOVERY", "")):
+            self.server.set_state(database_name, "ONLINE")
+
+    def _simulate(self, total_bytes, stats=0):
+        duration = self.server.restore_latency_ms / 1000 + total_bytes / (self.server.restore_mbps * MB)
+        request = {"started": time.monotonic(), "duration": duration}
+        with self.server.lock:
+            self.server.requests[self.connection.session_id] = request
+        try:
+            time.sleep(duration)
+        finally:
+            with self.server.lock:
+                self.server.requests.pop(self.connection.session_id, None)
+        if stats:
+            self.messages = [("[01000] (3211)", f"{percent} percent processed.")
+                             for percent in range(stats, 100, stats)]
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def nextset(self):
+        return False
+
+    def close(self):
+        pass
+
+# 2. Synthetic Backup Functions
+def write_synthetic_backup(path, header, size_mb, database_files=None):
+    """
+    (2) Writes a `.bak` of `size_mb` MB (half random, half zero pages) that starts with a JSON header
+    (BackupType, LSNs, dates, database files) readable by the fake RESTORE HEADERONLY / FILELISTONLY.
+    """
+    data = dict(header, database_files=database_files or [])
+    block = HEADER_MAGIC + json.dumps(data, default=str).encode("utf-8") + b"\n"
+    if len(block) > HEADER_SIZE:
+        raise ValueError("Synthetic backup header is too large.")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "wb") as bak_file:
+        bak_file.write(block.ljust(HEADER_SIZE, b"\0"))
+        for index in range(max(0, size_mb)):
+            bak_file.write(os.urandom(MB) if index % 2 == 0 else bytes(MB))
+
+def read_synthetic_header(path):
+    with open(path, "rb") as bak_file:
+        block = bak_file.read(HEADER_SIZE)
+    if not block.startswith(HEADER_MAGIC):
+        raise FakeSqlError(f"The media family on device '{path}' is incorrectly formed.")
+    return json.loads(block[len(HEADER_MAGIC):].split(b"\n", 1)[0])
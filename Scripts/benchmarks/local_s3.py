@@ -0,0 +1,183 @@
+import os
+import io
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+"""
+Local S3 Stand-in for ETO Backup & Restore Benchmarks
+
+Serves objects from a local directory through the subset of the boto3 S3 client API used by `utils`,
+so download and streaming code can be benchmarked on Linux without AWS.
+
+Classes:
+1. LocalS3Client(root_directory, bandwidth_mbps=0, latency_ms=0, multipart_part_size_mb=0) - boto3-compatible client backed by `root_directory/<bucket>/<key>`.
+"""
+
+MB = 1024 * 1024
+
+# 1. Local S3 Client
+class LocalS3Client:
+    """
+    (1) boto3-compatible S3 client backed by `root_directory/<bucket>/<key>`.
+
+    - `bandwidth_mbps` caps the throughput of each GET to simulate per-connection S3 throughput (0 = unlimited).
+    - `latency_ms` is added to every request to simulate request round-trips.
+    - `multipart_part_size_mb` makes ETags look like multipart uploads with parts of that size (0 = single-part ETags).
+    - Supports head_object (PartNumber), get_object (Range, IfMatch), put_object, list_objects_v2
+      (Prefix, StartAfter, ContinuationToken, MaxKeys) and get_paginator("list_objects_v2").
+    """
+    def __init__(self, root_directory, bandwidth_mbps=0, latency_ms=0, multipart_part_size_mb=0):
+        self.root_directory = root_directory
+        self.bandwidth_mbps = bandwidth_mbps
+        self.latency_ms = latency_ms
+        self.multipart_part_size = int(multipart_part_size_mb * MB)
+        self.bytes_served = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.etags = {}
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root_directory, bucket, *key.split("/"))
+
+    def _request(self):
+        with self.lock:
+            self.requests += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def _etag(self, path):
+        stat = os.stat(path)
+        cache_key = (path, stat.st_size, stat.st_mtime_ns)
+        if cache_key not in self.etags:
+            part_size = self.multipart_part_size or max(stat.st_size, 1)
+            part_digests = []
+            with open(path, "rb") as source:
+                for part in iter(lambda: source.read(part_size), b""):
+                    part_digests.append(hashlib.md5(part).digest())
+            if self.multipart_part_size:
+                etag = f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+            else:
+                etag = part_digests[0].hex() if part_digests else hashlib.md5().hexdigest()
+            self.etags[cache_key] = f'"{etag}"'
+        return self.etags[cache_key]
+
+    def head_object(self, Bucket, Key, PartNumber=None, **kwargs):
+        self._request()
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"NoSuchKey: {Key}")
+        stat = os.stat(path)
+        size = stat.st_size
+        if PartNumber and self.multipart_part_size:
+            size = max(0, min(self.multipart_part_size, stat.st_size - (PartNumber - 1) * self.multipart_part_size))
+        return {"ContentLength": size, "ETag": self._etag(path), "LastModified": stat.st_mtime}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        head = self.head_object(Bucket, Key)
+        if IfMatch and IfMatch != head["ETag"]:
+            raise RuntimeError(f"PreconditionFailed: {Key}")
+        start, end = 0, head["ContentLength"] - 1
+        if Range:
+            first, last = Range.replace("bytes=", "").split("-")
+            start, end = int(first), min(int(last), end)
+        return {"Body": _ThrottledBody(self, self._path(Bucket, Key), start, end),
+                "ContentLength": end - start + 1, "ETag": head["ETag"]}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._request()
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as target:
+            target.write(Body if isinstance(Body, bytes) else Body.read())
+        return {"ETag": self._etag(path)}
+
+    def list_objects_v2(self, Bucket, Prefix="", StartAfter=None, ContinuationToken=None, MaxKeys=1000, **kwargs):
+        self._request()
+        bucket_root = os.path.join(self.root_directory, Bucket)
+        keys = []
+        for directory, _, names in os.walk(bucket_root):
+            for name in names:
+                key = os.path.relpath(os.path.join(directory, name), bucket_root).replace(os.sep, "/")
+                if key.startswith(Prefix):
+                    keys.append(key)
+        keys.sort()
+        after = ContinuationToken or StartAfter
+        if after:
+            keys = [key for key in keys if key > after]
+
+        page = keys[:MaxKeys]
+        contents = []
+        for key in page:
+            path = self._path(Bucket, key)
+            stat = os.stat(path)
+            contents.append({
+                "Key": key,
+                "Size": stat.st_size,
+                "ETag": self._etag(path),
+                "LastModified": datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            })
+        response = {"Contents": contents, "KeyCount": len(contents), "IsTruncated": len(keys) > MaxKeys}
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+    def get_paginator(self, operation_name):
+        if operation_name != "list_objects_v2":
+            raise NotImplementedError(f"LocalS3Client has no paginator for {operation_name}")
+        return _ListPaginator(self)
+
+    def _throttle(self, amount, started, served):
+        with self.lock:
+            self.bytes_served += amount
+        if self.bandwidth_mbps:
+            expected = (served + amount) / (self.bandwidth_mbps * MB)
+            delay = expected - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+class _ListPaginator:
+    """
+    Minimal stand-in for the boto3 `list_objects_v2` paginator.
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            response = self.client.list_objects_v2(**kwargs, **({"ContinuationToken": token} if token else {}))
+            yield response
+            if not response.get("IsTruncated"):
+                return
+            token = response["NextContinuationToken"]
+
+class _ThrottledBody(io.RawIOBase):
+    """
+    Streaming body for one ranged GET, throttled to the client's bandwidth.
+    """
+    def __init__(self, client, path, start, end):
+        super().__init__()
+        self.client = client
+        self.source = open(path, "rb")
+        self.source.seek(start)
+        self.remaining = max(0, end - start + 1)
+        self.started = time.monotonic()
+        self.served = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.remaining
+        if not self.remaining:
+            return b""
+        data = self.source.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        self.client._throttle(len(data), self.started, self.served)
+        self.served += len(data)
+        if not self.remaining:
+            self.source.close()
+        return data
+
+    def readable(self):
+        return True
@@ -0,0 +1,345 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timedelta
+
+"""
+End-to-End Pipeline Benchmark for ETO Backup & Restore Application
+
+Runs the real listing, download, extraction and restore code against the local S3 stand-in (`local_s3`) and
+the fake SQL Server (`fake_sql`), so the whole pipeline can be measured on Linux without AWS or SQL Server.
+
+- Builds a synthetic bucket with one FULL, one DIFF and `--logs` LOG backups with a consistent LSN chain,
+  plus `--extra-keys` unrelated keys to make listing realistic.
+- Measures `get_latest_s3_keys`, `download_file`, `extract_file` (when 7-Zip is installed) and
+  `restore_database` cold (empty staging directory) and warm (archives, backups and caches reused), and a
+  point-in-time restore (`stop_at` inside the middle LOG backup) when there are at least two logs.
+- Measures `plan_database` (`--plan`) on a cold staging directory, with the cold restore's stage timings as
+  history, and records its expected duration next to the measured cold restore.
+- Per-stage timings come from the same spans as the production run report (`timing_utils`).
+- Every run is appended to `--history` with the git commit, so results can be compared across commits;
+  the change against the previous run with the same parameters is printed.
+
+Usage (from the `Scripts` directory):
+    python -m benchmarks.pipeline_benchmark --full-mb 1024 --logs 24 --bandwidth-mbps 200 --work-dir /tmp/eto_pipeline_bench
+
+Functions:
+1. build_synthetic_bucket(work_dir, args) - Creates (or reuses) the synthetic backup chain as `.7z` objects.
+2. write_benchmark_config(work_dir, args, mode) - Writes the `config.ini` used by the run and loads it as Settings.
+3. measure(name, function, byte_count=0) - Runs one measurement in its own RunRecorder.
+4. git_revision() - Returns the current commit and whether the tree is dirty.
+5. compare_with_history(history, run) - Returns the change against the last run with the same parameters.
+6. main() - Runs every measurement and writes the results.
+"""
+
+from benchmarks.local_s3 import LocalS3Client
+from benchmarks.fake_sql import FakeSqlServer, write_synthetic_backup
+from utils.timing_utils import start_run
+
+MB = 1024 * 1024
+BUCKET = "bench-bucket"
+PREFIX = "SQLBackups/"
+DATABASE = "benchDB"
+BASE_TIME = datetime(2025, 1, 1)
+REPO_CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Config")
+
+# 1. Build Synthetic Bucket Function
+def build_synthetic_bucket(work_dir, args):
+    """
+    (1) Writes synthetic `.bak`/`.trn` files with fake-SQL headers and packs each into a `.7z` object.
+    The bucket is reused by later runs with the same parameters (marker file outside the bucket).
+    Returns the chain keys in restore order.
+    """
+    import py7zr
+
+    bucket_root = os.path.join(work_dir, "s3", BUCKET)
+    marker_path = os.path.join(work_dir, f"bucket.{args.full_mb}.{args.diff_mb}.{args.log_mb}."
+                                         f"{args.logs}.{args.extra_keys}.{args.codec}.built")
+    database_files = [
+        {"LogicalName": DATABASE, "PhysicalName": os.path.join(work_dir, "data", f"{DATABASE}.mdf"),
+         "Type": "D", "Size": args.full_mb * MB},
+        {"LogicalName": f"{DATABASE}_log", "PhysicalName": os.path.join(work_dir, "data", f"{DATABASE}_log.ldf"),
+         "Type": "L", "Size": args.log_mb * MB},
+    ]
+
+    backups = [("FULL", BASE_TIME, args.full_mb, 1, 1000, 2000, 1500, 0),
+               ("DIFF", BASE_TIME + timedelta(hours=12), args.diff_mb, 5, 3000, 4000, 3500, 1500)]
+    for index in range(args.logs):
+        backups.append(("LOG", BASE_TIME + timedelta(hours=12, minutes=15 * (index + 1)), args.log_mb, 2,
+                        4000 + 100 * index, 4000 + 100 * (index + 1), 4000 + 100 * index, 1500))
+
+    keys = [f"{PREFIX}{DATABASE}_{backup[0]}_{backup[1]:%Y%m%d%H%M%S}.7z" for backup in backups]
+    if os.path.exists(marker_path):
+        return keys
+
+    shutil.rmtree(bucket_root, ignore_errors=True)
+    os.makedirs(os.path.join(bucket_root, PREFIX), exist_ok=True)
+    filters = [{"id": py7zr.FILTER_LZMA2, "preset": 1}] if args.codec == "lzma2" else [{"id": py7zr.FILTER_COPY}]
+    source_dir = os.path.join(work_dir, "source")
+    for key, (backup_type, taken, size_mb, type_code, first_lsn, last_lsn, checkpoint_lsn, base_lsn) \
+            in zip(keys, backups):
+        name = os.path.basename(key)[:-3] + (".trn" if backup_type == "LOG" else ".bak")
+        bak_path = os.path.join(source_dir, name)
+        write_synthetic_backup(bak_path, {
+            "BackupType": type_code, "DatabaseName": DATABASE, "FirstLSN": first_lsn, "LastLSN": last_lsn,
+            "DatabaseBackupLSN": 1500 if backup_type != "FULL" else 0, "DifferentialBaseLSN": base_lsn or None,
+            "CheckpointLSN": checkpoint_lsn, "BackupStartDate": taken.isoformat(),
+            "BackupFinishDate": (taken + timedelta(minutes=5)).isoformat(),
+        }, size_mb, database_files)
+        with py7zr.SevenZipFile(os.path.join(bucket_root, *key.split("/")), "w", filters=filters) as archive:
+            archive.write(bak_path, name)
+        os.remove(bak_path)
+
+    for index in range(args.extra_keys):
+        extra_path = os.path.join(bucket_root, PREFIX, f"otherDB_LOG_{BASE_TIME + timedelta(minutes=index):%Y%m%d%H%M%S}.7z")
+        open(extra_path, "wb").close()
+    shutil.rmtree(source_dir, ignore_errors=True)
+    open(marker_path, "w").close()
+    return keys
+
+# 2. Write Benchmark Config Function
+def write_benchmark_config(work_dir, args, mode):
+    """
+    (2) Writes a `config.ini` for the benchmark run and returns it loaded as Settings.
+    """
+    from utils.config_utils import load_settings
+
+    staging_dir = os.path.join(work_dir, "staging")
+    config_path = os.path.join(work_dir, "config.ini")
+
+    # The shipped permissions mapping, applied to the benchmark database instead of ETO/ETOHSS
+    with open(os.path.join(REPO_CONFIG_DIR, "permissions.json"), "r", encoding="utf-8") as handle:
+        permissions = json.load(handle)
+    permissions["databases"] = {DATABASE: {}}
+    with open(os.path.join(work_dir, "permissions.json"), "w", encoding="utf-8") as handle:
+        json.dump(permissions, handle, indent=2)
+
+    with open(config_path, "w", encoding="utf-8") as config_file:
+        config_file.write(f"""[Paths]
+backup_directory = {staging_dir}
+seven_zip_path = {args.seven_zip or ""}
+s3_bucket_name = {BUCKET}
+s3_backup_prefix = {PREFIX}
+
+[Download]
+part_size_mb = {args.part_size_mb}
+parts = 0
+max_workers = {args.max_workers}
+max_bandwidth_mbps = 0
+
+[Staging]
+reserve_gb = 0
+keep_archives = true
+compression_ratio = 1
+retention_max_age_days = 0
+retention_max_total_gb = 0
+
+[Verify]
+checksums = {str(args.checksums).lower()}
+verifyonly = {str(args.verifyonly).lower()}
+verifyonly_checksum = false
+
+[Extract]
+mode = {mode}
+stream_window_mb = 256
+threads = 0
+
+[Catalog]
+cache_path = {os.path.join(work_dir, "backup_catalog.sqlite")}
+ttl_minutes = 30
+full_sync_hours = 24
+header_cache_path = {os.path.join(work_dir, "backup_headers.json")}
+
+[Restore]
+stats = 10
+
+[Permissions]
+enabled = true
+file = permissions.json
+""")
+    return load_settings(config_path)
+
+# 3. Measure Function
+def measure(name, function, byte_count=0):
+    """
+    (3) Runs `function` under a fresh RunRecorder and returns its wall-clock seconds, throughput
+    and the per-stage aggregates recorded by the pipeline's spans.
+    """
+    recorder = start_run()
+    started = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - started
+    result = {
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(byte_count / MB / elapsed, 1) if byte_count and elapsed else None,
+        "stages": recorder.stages(),
+    }
+    logging.warning(f"{name}: {result['seconds']}s"
+                    + (f", {result['mb_per_second']} MB/s" if result["mb_per_second"] else ""))
+    return result
+
+# 4. Git Revision Function
+def git_revision():
+    """
+    (4) Returns {"commit", "dirty"} for the working tree, or None values outside a git checkout.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                    text=True, check=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+# 5. Compare With History Function
+def compare_with_history(history, run):
+    """
+    (5) Returns {measurement: percent change in seconds} against the last run with the same parameters.
+    """
+    previous = next((item for item in reversed(history) if item["params"] == run["params"]), None)
+    if previous is None:
+        return {}
+    changes = {"previous_commit": previous["git"]["commit"]}
+    for name, result in run["results"].items():
+        before = (previous["results"].get(name) or {}).get("seconds")
+        if before and result:
+            changes[name] = f"{(result['seconds'] - before) / before * 100:+.1f}%"
+    return changes
+
+# 6. Main Function
+def main():
+    """
+    (6) Builds the synthetic bucket, runs every measurement, appends the run to `--history` and prints it.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the restore pipeline against local S3 and SQL stand-ins.")
+    parser.add_argument("--full-mb", type=int, default=512, help="Size of the synthetic FULL .bak in MB.")
+    parser.add_argument("--diff-mb", type=int, default=64, help="Size of the synthetic DIFF .bak in MB.")
+    parser.add_argument("--log-mb", type=int, default=8, help="Size of each synthetic LOG .trn in MB.")
+    parser.add_argument("--logs", type=int, default=12, help="Number of LOG backups after the DIFF.")
+    parser.add_argument("--extra-keys", type=int, default=2000, help="Unrelated keys in the bucket (listing cost).")
+    parser.add_argument("--codec", choices=["lzma2", "copy"], default="copy", help="7z codec for the archives.")
+    parser.add_argument("--bandwidth-mbps", type=float, default=200, help="Simulated per-connection S3 throughput.")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Simulated S3 request latency.")
+    parser.add_argument("--part-size-mb", type=float, default=64)
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--checksums", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--verifyonly", action="store_true", help="Run RESTORE VERIFYONLY on each fetched file.")
+    parser.add_argument("--restore-mbps", type=float, default=400, help="Simulated RESTORE throughput.")
+    parser.add_argument("--restore-latency-ms", type=float, default=200, help="Simulated per-RESTORE overhead.")
+    parser.add_argument("--drain-seconds", type=float, default=0.3,
+                        help="Simulated time for other sessions to roll back before a warm restore.")
+    parser.add_argument("--mode", choices=["auto", "file", "stream"], default="auto",
+                        help="Extract mode for restore_database (auto = file if 7-Zip is installed).")
+    parser.add_argument("--seven-zip", default=shutil.which("7z") or shutil.which("7za"), help="7-Zip executable.")
+    parser.add_argument("--work-dir", default=os.path.join(os.getcwd(), "eto_pipeline_bench"))
+    parser.add_argument("--history", default="pipeline_benchmark.json", help="JSON file the run is appended to.")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, level=args.log_level.upper(),
+                        format="%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s")
+
+    from utils.s3_utils import get_latest_s3_keys, download_file, extract_file
+    from utils.scheduler_utils import RestoreTarget, StageLimits
+    import restore_script
+
+    work_dir = os.path.abspath(args.work_dir)
+    keys = build_synthetic_bucket(work_dir, args)
+    mode = args.mode if args.mode != "auto" else ("file" if args.seven_zip else "stream")
+    settings = write_benchmark_config(work_dir, args, mode)
+    staging_dir = settings.paths.backup_directory
+
+    s3_client = LocalS3Client(os.path.join(work_dir, "s3"), bandwidth_mbps=args.bandwidth_mbps,
+                              latency_ms=args.latency_ms)
+    server = FakeSqlServer(restore_mbps=args.restore_mbps, restore_latency_ms=args.restore_latency_ms,
+                           drain_seconds=args.drain_seconds)
+    target = RestoreTarget(name=DATABASE, database_name=DATABASE, dsn="DSN=FAKE", instance="FAKE",
+                           s3_bucket_name=BUCKET, s3_backup_prefix=PREFIX, s3_database_name=DATABASE,
+                           backup_directory=staging_dir)
+    full_key = keys[0]
+    full_size = s3_client.head_object(Bucket=BUCKET, Key=full_key)["ContentLength"]
+    chain_size = sum(s3_client.head_object(Bucket=BUCKET, Key=key)["ContentLength"] for key in keys)
+    download_dir = os.path.join(work_dir, "download")
+    download_path = os.path.join(download_dir, os.path.basename(full_key))
+
+    def reset(*directories):
+        for directory in directories:
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+        for path in (os.path.join(work_dir, "backup_catalog.sqlite"), os.path.join(work_dir, "backup_headers.json")):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def restore(stop_at=None):
+        restore_script.restore_database(target, StageLimits(), connect=server.connect, s3_client=s3_client,
+                                        settings=settings, stop_at=stop_at)
+
+    reset(download_dir, staging_dir)
+    results = {
+        "list": measure("list", lambda: get_latest_s3_keys(BUCKET, s3_client=s3_client, prefix=PREFIX,
+                                                            database=DATABASE)),
+        "download": measure("download", lambda: download_file(
+            full_key, download_path, bucket_name=BUCKET, s3_client=s3_client, part_size_mb=args.part_size_mb,
+            max_workers=args.max_workers, verify_checksum=args.checksums), full_size),
+        "extract": measure("extract", lambda: extract_file(download_path, "FULL", seven_zip=args.seven_zip),
+                              full_size)
+                   if args.seven_zip else None,
+    }
+    reset(download_dir, staging_dir)
+    results["restore_cold"] = measure("restore_cold", restore, chain_size)
+    server.set_state(DATABASE, "ONLINE")
+    results["restore_warm"] = measure("restore_warm", restore, chain_size)
+    if args.logs >= 2:
+        # Stop one minute before the middle log was taken: FULL + DIFF + logs up to and including that one
+        middle = args.logs // 2
+        stop_at = BASE_TIME + timedelta(hours=12, minutes=15 * (middle + 1) - 1)
+        pitr_size = sum(s3_client.head_object(Bucket=BUCKET, Key=key)["ContentLength"] for key in keys[:middle + 3])
+        server.set_state(DATABASE, "ONLINE")
+        results["restore_pitr"] = measure("restore_pitr", lambda: restore(stop_at), pitr_size)
+
+    # Plan a cold restore from the cold run's own stage timings, as `--plan` would from its run reports
+    reset(staging_dir)
+    plans = []
+    history = {name: {"mb_per_second": round(stage["bytes"] / MB / stage["seconds"], 1)
+                      if stage["bytes"] and stage["seconds"] else None,
+                      "seconds_per_run": stage["seconds"], "runs": 1}
+               for name, stage in results["restore_cold"]["stages"].items()}
+    results["plan"] = measure("plan", lambda: plans.append(restore_script.plan_database(
+        target, s3_client, settings, history=history)))
+    results["plan"].update(expected_seconds=plans[0]["expected_seconds"],
+                           restore_cold_seconds=results["restore_cold"]["seconds"],
+                           download_bytes=plans[0]["download_bytes"], disk_peak_bytes=plans[0]["disk_peak_bytes"])
+    shutil.rmtree(download_dir, ignore_errors=True)
+
+    run = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            name: value for name, value in sorted(vars(args).items())
+            if name not in ("work_dir", "history", "log_level", "seven_zip")
+        } | {"mode": mode, "seven_zip": bool(args.seven_zip)},
+        "results": results,
+    }
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history, "r", encoding="utf-8") as history_file:
+            history = json.load(history_file)
+    run["change"] = compare_with_history(history, run)
+    history.append(run)
+    with open(args.history, "w", encoding="utf-8") as history_file:
+        json.dump(history, history_file, indent=2)
+
+    print(json.dumps(run, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import itertools
+
+"""
+RESTORE Options Benchmark for ETO Backup & Restore Application
+
+Restores the same backup into a scratch database once per combination of BUFFERCOUNT, MAXTRANSFERSIZE and
+BLOCKSIZE, records the duration of every run and appends the results to a JSON file, so the fastest settings
+for a host can be copied into [Restore] in `config.ini`.
+
+Usage (from the `Scripts` directory, against a test SQL Server instance):
+    python -m benchmarks.restore_options_benchmark --dsn "DSN=ETO_DSN" --backup E:\\Bench\\ETO_FULL_1.bak E:\\Bench\\ETO_FULL_2.bak
+        --data-dir E:\\Bench\\Data --log-dir E:\\Bench\\Logs --buffercount 0 64 128 --maxtransfersize 0 1048576 4194304
+
+Functions:
+1. option_grid(args) - Builds every combination of the requested option values.
+2. run_option_set(cursor, database_name, backup_paths, move, options) - Restores once and returns the duration.
+3. main() - Runs the grid and writes the results.
+"""
+
+logging.basicConfig(stream=sys.stderr, level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+from utils.db_utils import connect_to_database, build_restore_command, read_file_list, quote_identifier  # noqa: E402
+
+# 1. Option Grid Function
+def option_grid(args):
+    """
+    (1) Returns a list of option dicts, one per combination of the requested values (0 = server default).
+    """
+    names = ("buffercount", "maxtransfersize", "blocksize")
+    values = [getattr(args, name) for name in names]
+    return [dict(zip(names, combination), stats=0) for combination in itertools.product(*values)]
+
+# 2. Run Option Set Function
+def run_option_set(cursor, database_name, backup_paths, move, options):
+    """
+    (2) Restores `backup_paths` into `database_name` WITH RECOVERY using `options`, drops the database again
+    and returns the restore duration in seconds.
+    """
+    command = build_restore_command(database_name, backup_paths, recovery=True, replace=True,
+                                    options=dict(options, move=move))
+    started = time.monotonic()
+    cursor.execute(command)
+    while cursor.nextset():
+        pass
+    duration = time.monotonic() - started
+    cursor.execute(f"DROP DATABASE {quote_identifier(database_name)};")
+    return duration
+
+# 3. Main Function
+def main():
+    """
+    (3) Runs every option set `--repeat` times and appends the results to `--output`.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark RESTORE throughput options.")
+    parser.add_argument("--dsn", required=True)
+    parser.add_argument("--backup", nargs="+", required=True, help="Backup file (or all stripe files).")
+    parser.add_argument("--database", default="ETO_RestoreBenchmark", help="Scratch database name.")
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument("--log-dir", required=True)
+    parser.add_argument("--buffercount", nargs="+", type=int, default=[0, 64, 128])
+    parser.add_argument("--maxtransfersize", nargs="+", type=int, default=[0, 1048576, 4194304])
+    parser.add_argument("--blocksize", nargs="+", type=int, default=[0])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", default="restore_options_benchmark.json")
+    args = parser.parse_args()
+
+    conn = connect_to_database(args.dsn)
+    cursor = conn.cursor()
+
+    move = {}
+    for database_file in read_file_list(cursor, args.backup):
+        directory = args.log_dir if database_file["Type"] == "L" else args.data_dir
+        extension = os.path.splitext(database_file["PhysicalName"])[1]
+        move[database_file["LogicalName"]] = os.path.join(directory, f"{args.database}_{database_file['LogicalName']}{extension}")
+    backup_bytes = sum(os.path.getsize(path) for path in args.backup if os.path.exists(path))
+
+    results = []
+    for options in option_grid(args):
+        for attempt in range(args.repeat):
+            duration = run_option_set(cursor, args.database, args.backup, move, options)
+            result = {
+                "options": options,
+                "attempt": attempt + 1,
+                "seconds": round(duration, 2),
+                "mb_per_second": round(backup_bytes / 1048576 / duration, 1) if backup_bytes else None,
+            }
+            logging.info(f"{result}")
+            results.append(result)
+
+    results.sort(key=lambda result: result["seconds"])
+    run = {
+        "host": socket.gethostname(),
+        "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "backup": args.backup,
+        "stripes": len(args.backup),
+        "results": results,
+    }
+    history = []
+    if os.path.exists(args.output):
+        with open(args.output, "r", encoding="utf-8") as output_file:
+            history = json.load(output_file)
+    history.append(run)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(history, output_file, indent=2)
+
+    print(json.dumps(results[0], indent=2))
+
+if __name__ == "__main__":
+    main()
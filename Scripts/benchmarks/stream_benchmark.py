@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import threading
+
+"""
+Streaming Restore Benchmark for ETO Backup & Restore Application
+
+Compares the serial path (download the whole `.7z`, then extract it) with the streaming path
+(`stream_utils.stream_extract_file`) on a synthetic archive served by the local S3 stand-in.
+Reports wall-clock time and peak staging disk use for both modes.
+
+Usage (from the `Scripts` directory):
+    python -m benchmarks.stream_benchmark --size-mb 4096 --bandwidth-mbps 200 --work-dir /tmp/eto_bench
+
+Functions:
+1. build_synthetic_archive(work_dir, size_mb, password, codec) - Creates (or reuses) a synthetic FULL backup archive.
+2. measure(mode_function, staging_dir) - Runs one mode and samples peak disk use of the staging directory.
+3. main() - Runs both modes and prints the results as JSON.
+"""
+
+logging.basicConfig(stream=sys.stderr, level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+from benchmarks.local_s3 import LocalS3Client  # noqa: E402
+from utils.s3_utils import download_file  # noqa: E402
+from utils.stream_utils import stream_extract_file  # noqa: E402
+
+MB = 1024 * 1024
+BUCKET = "bench-bucket"
+KEY = "SQLBackups/benchDB_FULL_20250101000000.7z"
+
+# 1. Build Synthetic Archive Function
+def build_synthetic_archive(work_dir, size_mb, password, codec):
+    """
+    (1) Creates a synthetic `.bak` of `size_mb` MB (half random, half zero pages) and packs it into a `.7z`.
+    The archive is cached under `work_dir` and reused by later runs with the same parameters.
+    """
+    import py7zr
+
+    archive_path = os.path.join(work_dir, "s3", BUCKET, *KEY.split("/"))
+    marker_path = archive_path + f".{size_mb}.{codec}.built"
+    if os.path.exists(archive_path) and os.path.exists(marker_path):
+        return archive_path
+
+    os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+    bak_path = os.path.join(work_dir, "benchDB_FULL_20250101000000.bak")
+    with open(bak_path, "wb") as bak_file:
+        for index in range(size_mb):
+            bak_file.write(os.urandom(MB) if index % 2 == 0 else bytes(MB))
+
+    filters = [{"id": py7zr.FILTER_LZMA2, "preset": 1}] if codec == "lzma2" else [{"id": py7zr.FILTER_COPY}]
+    if password:
+        filters.append({"id": py7zr.FILTER_CRYPTO_AES256_SHA256})
+    with py7zr.SevenZipFile(archive_path, "w", password=password or None, filters=filters) as archive:
+        archive.write(bak_path, os.path.basename(bak_path))
+    os.remove(bak_path)
+    open(marker_path, "w").close()
+    return archive_path
+
+# 2. Measure Function
+def measure(mode_function, staging_dir):
+    """
+    (2) Runs `mode_function` while sampling the allocated bytes in `staging_dir` every 50 ms.
+    Returns wall-clock seconds and peak allocated bytes.
+    """
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    peak = [0]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            used = 0
+            for entry in os.scandir(staging_dir):
+                if entry.is_file():
+                    stat = entry.stat()
+                    used += getattr(stat, "st_blocks", stat.st_size // 512) * 512
+            peak[0] = max(peak[0], used)
+            done.wait(0.05)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.monotonic()
+    try:
+        mode_function()
+    finally:
+        elapsed = time.monotonic() - started
+        done.set()
+        sampler.join()
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    return {"seconds": round(elapsed, 2), "peak_disk_mb": round(peak[0] / MB, 1)}
+
+# 3. Main Function
+def main():
+    """
+    (3) Runs the serial and streaming modes against the same archive and prints a JSON comparison.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark serial vs streaming download+extract.")
+    parser.add_argument("--size-mb", type=int, default=2048, help="Size of the synthetic .bak in MB.")
+    parser.add_argument("--bandwidth-mbps", type=float, default=200, help="Simulated per-connection S3 throughput.")
+    parser.add_argument("--codec", choices=["lzma2", "copy"], default="lzma2", help="7z codec for the archive.")
+    parser.add_argument("--password", default="benchmark", help="Archive password ('' for none).")
+    parser.add_argument("--work-dir", default=os.path.join(os.getcwd(), "eto_stream_bench"))
+    args = parser.parse_args()
+
+    import py7zr
+
+    archive_path = build_synthetic_archive(args.work_dir, args.size_mb, args.password, args.codec)
+    s3_client = LocalS3Client(os.path.join(args.work_dir, "s3"), bandwidth_mbps=args.bandwidth_mbps)
+    staging_dir = os.path.join(args.work_dir, "staging")
+
+    def serial():
+        local_archive = os.path.join(staging_dir, os.path.basename(KEY))
+        download_file(KEY, local_archive, bucket_name=BUCKET, s3_client=s3_client)
+        with py7zr.SevenZipFile(local_archive, "r", password=args.password or None) as archive:
+            archive.extractall(path=staging_dir)
+
+    def streaming():
+        stream_extract_file(KEY, staging_dir, "FULL", bucket_name=BUCKET, s3_client=s3_client,
+                            password=args.password)
+
+    results = {
+        "archive_mb": round(os.path.getsize(archive_path) / MB, 1),
+        "bak_mb": args.size_mb,
+        "bandwidth_mbps": args.bandwidth_mbps,
+        "serial": measure(serial, staging_dir),
+        "stream": measure(streaming, staging_dir),
+    }
+    results["seconds_saved"] = round(results["serial"]["seconds"] - results["stream"]["seconds"], 2)
+    results["peak_disk_saved_mb"] = round(results["serial"]["peak_disk_mb"] - results["stream"]["peak_disk_mb"], 1)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,152 +1,761 @@
 import logging
 import os
+import sys
+import json
 import time
-from utils.s3_utils import get_latest_s3_keys, download_file, extract_file, clear_old_backups
+import argparse
+import threading
+import importlib.util
+from utils.config_utils import get_settings
+from utils.s3_utils import (
+    download_file, extract_file, clear_old_backups, discard_download, ChecksumMismatchError,
+    list_archive_contents, select_backup_members
+)
+from utils.catalog_utils import load_catalog, create_s3_client
+from utils.chain_utils import plan_chain_keys, check_chain_link, parse_stop_at, reaches_target, stops_at_target
+from utils.header_utils import HeaderCache, header_cache_name
+from utils.stream_utils import stream_extract_file, list_remote_archive
+from utils.staging_utils import StagedFile, plan_staging, check_database_files_space
+from utils.scheduler_utils import RestoreTarget, StageLimits, Prefetcher, StageCancelled, run_restore_targets
 from utils.db_utils import (
-    connect_to_database, restore_full_backup, restore_diff_backup, 
-    wait_for_database, validate_backup_lsn
+    connect_to_database, check_database_state, restore_full_backup, restore_diff_backup,
+    restore_log_backup, read_backup_header, wait_for_database, build_restore_command,
+    execute_with_messages, get_session_id, verify_backup, read_file_list, drain_connections, read_last_restore
 )
+from utils.progress_utils import RestoreMonitor
+from utils.connection_utils import ConnectionPool, get_pool
+from utils.permissions_utils import load_permissions, apply_permissions
+from utils.cache_utils import DownloadCache
+from utils.journal_utils import RestoreJournal, resume_chain, journal_path
+from utils.plan_utils import load_stage_history, estimate_chain, combine_estimates
+from utils.timing_utils import span, start_run, write_run_report, write_prometheus_textfile
 
 # ======================
 # Required Functions Checklist
-# 1. configure_logging() - Configures logging for the script
-# 2. force_restore_mode(cursor, database_name, backup_path) - Ensures no active connections before transitioning to RESTORING mode
-# 3. restore_database() - Orchestrates the database restoration process
+# 1. configure_logging(settings) - Configures logging for the script
+# 2. force_restore_mode(cursor, database_name, backup_path, restore_options, on_message) - Ensures no active connections before transitioning to RESTORING mode
+# 3. restore_database(target, stage_limits, ..., settings, stop_at) - Orchestrates the restoration of one database target (optionally to a point in time)
+# 4. restore_all_databases(..., settings, stop_at) - Restores every configured target concurrently
+# 5. write_run_reports(recorder, results, settings) - Writes the JSON run report and optional Prometheus textfile
+# 6. plan_database(target, s3_client, settings, stop_at, history) - Plans one restore and estimates its cost without changing anything
+# 7. plan_all_databases(s3_client, settings, stop_at) - Builds the `--plan` JSON for every configured target
 # ======================
 
-# Load configuration
-backup_directory = "E:\\Eto_Backup_Restore\\Backups\\ETO"
-log_file_path = "E:\\Eto_Backup_Restore\\Logs\\restore_process.log"
-dsn = "DSN=ETO_DSN"
-database_name = "ETO"
-s3_bucket_name = "ssg-etobphc"
-
 # 1 Configure Logging Function
-def configure_logging():
+def configure_logging(settings=None):
     """
-    Configures logging for the script.
+    Configures logging for the script, writing to [Logging] log_file_path.
     """
+    settings = settings or get_settings()
+    os.makedirs(os.path.dirname(os.path.abspath(settings.paths.log_file_path)), exist_ok=True)
     logging.basicConfig(
-        filename=log_file_path,
+        filename=settings.paths.log_file_path,
         level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s"
+        format="%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s"
     )
-    logging.info("? Logging initialized successfully.")
+    logging.info("Logging initialized successfully.")
 
 # 2 Force Restore Mode Function
-def force_restore_mode(cursor, database_name, backup_path):
+def force_restore_mode(cursor, database_name, backup_path, restore_options=None, on_message=None):
     """
     Ensures no active connections exist before transitioning the database into RESTORING mode.
-    If connections exist, they are forcibly terminated before proceeding.
+    Other sessions are rolled back and disconnected in one statement ([Restore] drain_mode), and the
+    restore starts as soon as none remain, or fails after drain_timeout_seconds.
     """
+    restore_options = restore_options or {}
     try:
-        logging.info(f"?? Checking if database {database_name} is stuck in SINGLE_USER mode...")
+        with span("drain", database=database_name) as timer:
+            drained = drain_connections(cursor, database_name, restore_options.get("drain_mode") or "SINGLE_USER",
+                                        restore_options.get("drain_timeout_seconds") or 60)
+            timer.set(drain_seconds=round(drained, 3))
 
-        for attempt in range(3):  # Retry up to 3 times
-            cursor.execute(f"SELECT state_desc FROM sys.databases WHERE name = '{database_name}'")
-            db_state = cursor.fetchone()[0]
+        # Restore database into RESTORING mode
+        logging.info(f"Restoring FULL backup from {backup_path}...")
+        execute_with_messages(cursor, build_restore_command(database_name, backup_path, replace=True,
+                                                            options=restore_options), on_message)
 
-            if db_state == "SINGLE_USER":
-                logging.warning(f"?? Attempt {attempt + 1}/3: Database {database_name} is in SINGLE_USER mode but may have an active connection.")
-                logging.info(f"?? Terminating all active connections before retrying SINGLE_USER mode...")
+        # Ensure the database transitions correctly
+        if not wait_for_database(cursor, database_name, expected_state="RESTORING"):
+            raise RuntimeError(f"Database {database_name} did not transition to RESTORING state after FULL restore.")
 
-                # Fetch and kill all active session IDs for the database
-                cursor.execute(f"SELECT spid FROM sys.sysprocesses WHERE dbid = DB_ID('{database_name}');")
-                active_sessions = cursor.fetchall()
+        logging.info(f"Database {database_name} is now in RESTORING mode. Continuing restore process...")
 
-                for session in active_sessions:
-                    spid = session[0]
-                    logging.info(f"?? Killing session {spid}...")
-                    cursor.execute(f"KILL {spid};")
+    except Exception as e:
+        logging.error(f"Failed to transition database into RESTORING mode: {e}")
+        raise
 
-                time.sleep(5)  # Allow SQL Server to process kill commands
+# Download Options Helper
+def get_download_options(settings=None):
+    """
+    Returns the [Download] tuning settings as keyword arguments for `download_file`.
+    """
+    settings = settings or get_settings()
+    return {
+        "part_size_mb": settings.download.part_size_mb,
+        "parts": settings.download.parts or None,
+        "max_workers": settings.download.max_workers,
+        "max_bandwidth_mbps": settings.download.max_bandwidth_mbps,
+        "verify_checksum": settings.verify.checksums,
+        "delta": settings.download.delta_sync,
+    }
 
-            logging.info(f"?? Switching database {database_name} to SINGLE_USER mode for restore...")
-            cursor.execute(f"ALTER DATABASE [{database_name}] SET SINGLE_USER WITH ROLLBACK IMMEDIATE;")
-            time.sleep(2)
+# Download Cache Helper
+_download_cache = None
+_download_cache_lock = threading.Lock()
 
-            # print this line to check error checkpoint
-            print("Checkpoint 1")
+def get_download_cache(settings=None):
+    """
+    Returns the process-wide DownloadCache from [Cache], shared by all targets, or None when it is disabled.
+    """
+    global _download_cache
+    settings = settings or get_settings()
+    if not settings.cache.directory:
+        return None
+    with _download_cache_lock:
+        if _download_cache is None or _download_cache.directory != settings.cache.directory:
+            _download_cache = DownloadCache(settings.cache.directory, max_gb=settings.cache.max_gb,
+                                            shared_directories=settings.cache.shared_directories)
+        return _download_cache
 
-            # Verify if SINGLE_USER mode was successfully set
-            cursor.execute(f"SELECT state_desc FROM sys.databases WHERE name = '{database_name}'")
-            new_state = cursor.fetchone()[0]
-            if new_state == "SINGLE_USER":
-                break  # Exit loop if successful
-            # print this line to check error checkpoint
-            print("Checkpoint 2") 
+# Verify Options Helper
+def get_verify_options(settings=None):
+    """
+    Returns the RESTORE VERIFYONLY settings from [Verify].
+    """
+    settings = settings or get_settings()
+    return {
+        "verifyonly": settings.verify.verifyonly,
+        "verifyonly_checksum": settings.verify.verifyonly_checksum,
+    }
 
-        # Restore database into RESTORING mode
-        logging.info(f"?? Restoring FULL backup from {backup_path}...")
-        cursor.execute(f"RESTORE DATABASE [{database_name}] FROM DISK = '{backup_path}' WITH NORECOVERY, REPLACE;")
+# Extract Options Helper
+def get_extract_options(settings=None):
+    """
+    Returns the [Extract] settings (`file` or `stream` mode) plus the 7-Zip path and archive password.
+    """
+    settings = settings or get_settings()
+    return dict(settings.extract._asdict(), seven_zip=settings.paths.seven_zip_path,
+                password=settings.paths.zip_password)
 
-        # print this line to check error checkpoint
-        print("Checkpoint 3")
+# Staging Options Helper
+def get_staging_options(settings=None):
+    """
+    Returns the [Staging] disk-space and retention settings.
+    """
+    settings = settings or get_settings()
+    return settings.staging._asdict()
 
-        # Ensure the database transitions correctly
-        if not wait_for_database(cursor, database_name, expected_state="RESTORING"):
-            raise RuntimeError(f"? Database {database_name} did not transition to RESTORING state after FULL restore.")
+# Catalog Options Helper
+def get_catalog_options(directory=None, settings=None):
+    """
+    Returns the [Catalog] cache settings as keyword arguments for `load_catalog`.
+    """
+    settings = settings or get_settings()
+    return {
+        "cache_path": settings.catalog.cache_path
+                      or os.path.join(directory or settings.paths.backup_directory, "backup_catalog.sqlite"),
+        "ttl_minutes": settings.catalog.ttl_minutes,
+        "full_sync_hours": settings.catalog.full_sync_hours,
+    }
 
-        logging.info(f"? Database {database_name} is now in RESTORING mode. Continuing restore process...")
+# Restore Options Helper
+def get_restore_options(settings=None):
+    """
+    Returns the [Restore] tuning options and `move` map for `build_restore_command`, plus the drain settings.
+    """
+    settings = settings or get_settings()
+    options = settings.restore._asdict()
+    options["move"] = dict(options["move"])
+    return options
 
-    except Exception as e:
-        logging.error(f"? Failed to transition database into RESTORING mode: {e}")
-        raise
+# Header Cache Path Helper
+def get_header_cache_path(directory=None, settings=None):
+    """
+    Returns the header cache location from [Catalog] (blank = next to the backups).
+    """
+    settings = settings or get_settings()
+    return (settings.catalog.header_cache_path
+            or os.path.join(directory or settings.paths.backup_directory, header_cache_name))
+
+# Connection Pool Helper
+def create_pool(connect=None, settings=None):
+    """
+    Creates a ConnectionPool over `connect` with the [Database] pool and reconnect settings.
+    """
+    settings = settings or get_settings()
+    return ConnectionPool(connect or connect_to_database, max_idle=settings.database.pool_max_idle,
+                          health_check_seconds=settings.database.health_check_seconds,
+                          retries=settings.database.connect_retries,
+                          backoff=settings.database.connect_backoff_seconds)
+
+# Permissions Helper
+def get_permissions(settings=None):
+    """
+    Loads the [Permissions] mapping, or returns None when disabled or when the file is missing.
+    """
+    settings = settings or get_settings()
+    if not settings.permissions.enabled:
+        return None
+    if not os.path.exists(settings.permissions.file):
+        logging.warning(f"Permissions file not found: {settings.permissions.file}. Skipping permissions.")
+        return None
+    return load_permissions(settings.permissions.file)
 
-# 3?? Restore Database Function
-def restore_database():
+# Default Target Helper
+def get_default_target(settings=None):
+    """
+    Builds the RestoreTarget for the single database configured in [Database] and [Paths].
+    """
+    settings = settings or get_settings()
+    return RestoreTarget(
+        name=settings.database.database_name, database_name=settings.database.database_name,
+        dsn=settings.database.dsn, instance=settings.database.dsn, s3_bucket_name=settings.paths.s3_bucket_name,
+        s3_backup_prefix=settings.paths.s3_backup_prefix, s3_database_name=None,
+        backup_directory=settings.paths.backup_directory,
+    )
+
+# 3. Restore Database Function
+def restore_database(target=None, stage_limits=None, connect=None, s3_client=None, progress_callback=None,
+                     settings=None, pool=None, stop_at=None, cancel_event=None):
     """
     Main function to orchestrate the database restoration process.
     Automatically handles missing backups and ensures correct restore state.
+
+    - Plans the shortest FULL -> DIFF -> LOG chain from the S3 catalog and fetches only those files.
+    - Files are restored strictly in order, while the next [Scheduler] prefetch_files files are downloaded,
+      extracted and have their headers read on other threads, so wall time approaches max(download, restore).
+    - Each file is checked against the chain restored so far (`check_chain_link`); a DIFF that does not belong
+      to the FULL is dropped and the rest of the chain re-planned.
+    - `target` is a RestoreTarget (defaults to the single database configured in this script).
+    - `stage_limits` bounds concurrent downloads, extractions and per-instance restores across targets.
+    - `connect` and `s3_client` allow a fake pyodbc connection and a local S3 stand-in to be injected.
+    - `progress_callback(event)` receives ProgressEvents (percent, throughput, ETA) while files are restored.
+    - `settings` (config_utils.Settings) defaults to the settings loaded once for this process.
+    - Restore commands, the progress monitor, header reads and RESTORE VERIFYONLY each borrow their own
+      connection from `pool` (a ConnectionPool over `connect`, created for this restore if not given).
+    - `stop_at` (datetime) restores the database as of that time: only the backups covering it are fetched
+      and the final LOG is restored WITH STOPAT.
+    - `cancel_event` (threading.Event) stops the restore before its next file. When the restore stops for any
+      reason, fetches still running are stopped at their next chunk and their partial files deleted.
+    - After RECOVERY, the missing logins, users, roles and grants from [Permissions] are applied in one batch.
+    - Every step is recorded in the target's restore journal (`journal_utils`). After a crash, a database still
+      RESTORING whose msdb restore history ends with the journal's last restored file continues with the next
+      file instead of restoring the FULL backup again; files already extracted are reused.
     """
+    settings = settings or get_settings()
+    target = target or get_default_target(settings)
+    stage_limits = stage_limits or StageLimits()
+    own_pool = pool is None
+    pool = pool or create_pool(connect, settings)
+    conn = None
+    prefetcher = None
+    database_name = target.database_name
+    staging_options = get_staging_options(settings)
+    started = time.time()
+
     try:
-        logging.info("?? Starting the database restoration process...")
-        clear_old_backups(backup_directory)
+        logging.info(f"Starting the database restoration process for {database_name}...")
 
-        # Connect to the database
-        conn = connect_to_database(dsn)
+        # Borrow the connection that runs the restore commands
+        conn = pool.connect(target.dsn)
         cursor = conn.cursor()
+        restore_options = get_restore_options(settings)
+        session_id = get_session_id(cursor)
 
-        # Check the database state
-        logging.info("?? Checking database state...")
-        cursor.execute(f"SELECT state_desc FROM sys.databases WHERE name = '{database_name}'")
-        db_state = cursor.fetchone()[0]
+        # Plan the restore chain from the S3 catalog
+        logging.info("Fetching backup catalog from S3...")
+        catalog = load_catalog(target.s3_bucket_name, target.s3_backup_prefix, s3_client=s3_client,
+                               database=target.s3_database_name,
+                               **get_catalog_options(target.backup_directory, settings))
+        header_cache = HeaderCache(get_header_cache_path(target.backup_directory, settings))
+        journal = RestoreJournal(journal_path(target.backup_directory, database_name), database_name)
+        staged_files = {}
+        exclude = set()
 
-        # If database is ONLINE, force it into RESTORING mode
-        if db_state == "ONLINE":
-            logging.warning(f"?? Database {database_name} is already ONLINE. Automatically forcing restore...")
+        def plan():
+            entries = plan_chain_keys(catalog, database=target.s3_database_name, stop_at=stop_at, exclude=exclude)
+            if not entries:
+                logging.critical("No FULL backup found in S3! Restore process cannot continue.")
+                raise RuntimeError("No FULL backup available in S3.")
+            logging.info(f"Planned restore chain: {[entry.key for entry in entries]}")
+            return entries, plan_chain_staging(entries, target, s3_client, staged_files, settings)
 
-            force_restore_mode(cursor, database_name, f"{backup_directory}\\etoBPHC_FULL_20250207210004.bak")
+        entries, staging = plan()
 
-        elif db_state != "RESTORING":
-            logging.error(f"? Database {database_name} is in unexpected state: {db_state}. Restore cannot proceed.")
-            raise RuntimeError(f"Database {database_name} is in an unexpected state: {db_state}. Reset it before running the restore.")
+        # Continue an interrupted run only if SQL Server agrees with the journal about what was restored
+        chain = []
+        consumed = []
+        resumed = None
+        if journal.running:
+            resumed = resume_chain(journal, check_database_state(cursor, database_name),
+                                   read_last_restore(cursor, database_name), stop_at)
+        if resumed and [entry.key for entry in entries[:len(resumed[0])]] == resumed[0]:
+            consumed, chain = resumed
+            logging.info(f"Resuming the restore of {database_name} after {consumed[-1]} "
+                         f"({len(chain)} file(s) already restored).")
+        else:
+            if resumed:
+                logging.warning(f"The restore chain of {database_name} changed since the interrupted run; "
+                                f"starting over from the FULL backup.")
+            journal.begin(stop_at)
 
-        # Get latest FULL and DIFF backup keys from S3
-        logging.info("?? Fetching latest backups from S3...")
-        full_backup_key, diff_backup_keys = get_latest_s3_keys(s3_bucket_name)
+        prefetcher = Prefetcher(
+            lambda item, cancelled: prefetch_chain_file(item[0], target, stage_limits, s3_client, item[1], header_cache,
+                                                        pool, settings, journal, cancelled),
+            lookahead=settings.scheduler.prefetch_files, retries=settings.scheduler.stage_retries,
+            backoff=settings.scheduler.stage_retry_backoff_seconds, name=f"prefetch-{target.name}",
+        )
 
-        if not full_backup_key:
-            logging.critical("? No FULL backup found in S3! Restore process cannot continue.")
-            raise RuntimeError("No FULL backup available in S3.")
+        # Restore the chain WITH NORECOVERY, one file at a time, while the next files are fetched
+        while len(consumed) < len(entries):
+            if cancel_event is not None and cancel_event.is_set():
+                raise StageCancelled(f"Restore of {database_name} was cancelled.")
+            pending = entries[len(consumed):]
+            entry = pending[0]
+            prefetcher.schedule((pending_entry.key, (pending_entry, staging)) for pending_entry in pending)
 
-        # Download FULL backup
-        full_backup_path = os.path.join(backup_directory, os.path.basename(full_backup_key))
-        logging.info(f"?? Downloading FULL backup: {full_backup_key}")
-        full_backup_path = download_file(full_backup_key, full_backup_path)
+            # A cached header can rule a file out before it is downloaded
+            header = header_cache.get(etag=entry.etag) if entry.etag else None
+            step = check_chain_link(chain, header._replace(key=entry.key), stop_at) if header else "restore"
+            if step == "restore":
+                header = prefetcher.result(entry.key, (entry, staging))
+                step = check_chain_link(chain, header, stop_at)
 
-        # Restore FULL backup
-        extracted_full_path = extract_file(full_backup_path, expected_type="FULL")
-        restore_full_backup(cursor, database_name, extracted_full_path)
+            if step == "done":
+                prefetcher.discard(pending_entry.key for pending_entry in pending)
+                break
+            if step == "skip":
+                prefetcher.discard([entry.key])
+                journal.mark(entry.key, "skipped")
+                consumed.append(entry.key)
+                continue
+            if step == "reject":
+                logging.warning(f"DIFF backup does not match the FULL backup, re-planning without it: {entry.key}")
+                prefetcher.discard(pending_entry.key for pending_entry in pending)
+                exclude.add(entry.key)
+                entries, staging = plan()
+                if [planned.key for planned in entries[:len(consumed)]] != consumed:
+                    raise RuntimeError("The re-planned restore chain no longer starts with the files already restored.")
+                continue
 
-        logging.info("? Finalizing database recovery...")
-        cursor.execute(f"RESTORE DATABASE [{database_name}] WITH RECOVERY;")
-        logging.info("? Database restoration completed successfully.")
+            journal.mark(entry.key, "restoring", header=header)
+            if not chain:
+                restore_first_file(cursor, target, header, stage_limits, pool, session_id, restore_options,
+                                   progress_callback, staging_options)
+            else:
+                final = stops_at_target(header, stop_at, last=entry is entries[-1])
+                with stage_limits.stage("restore", target.instance), \
+                        monitor_restore(pool.connect, target, session_id, header.path, progress_callback) as monitor:
+                    restore_chain_file(cursor, database_name, header, restore_options, monitor.on_message,
+                                       stop_at=stop_at if final else None)
+            journal.mark(entry.key, "restored")
+            chain.append(header)
+            consumed.append(entry.key)
+
+        if stop_at is not None and not reaches_target(chain, stop_at):
+            raise RuntimeError(f"Log chain ends at LSN {chain[-1].last_lsn} before the target time {stop_at}; "
+                               f"a LOG backup is missing.")
+        logging.info(f"Restore chain: {[header.key for header in chain]}")
+
+        logging.info("Finalizing database recovery...")
+        with stage_limits.stage("restore", target.instance), span("recovery", database=database_name):
+            cursor.execute(f"RESTORE DATABASE [{database_name}] WITH RECOVERY;")
+        journal.complete()
+        logging.info(f"Database restoration of {database_name} completed successfully.")
+
+        # Re-apply logins, users, roles and grants that the backup's source server did not carry over
+        permissions = get_permissions(settings)
+        if permissions is not None:
+            with span("permissions", database=database_name) as timer:
+                with pool.connection(target.dsn) as permissions_conn:
+                    changes = apply_permissions(permissions_conn.cursor(), database_name, permissions)
+                timer.set(changes=len(changes))
+
+        # Only now evict archives and backups that are not part of this chain
+        keep = []
+        for header in chain:
+            keep += [header.path] if isinstance(header.path, str) else list(header.path)
+            keep.append(os.path.join(target.backup_directory, os.path.basename(header.key)))
+        clear_old_backups(target.backup_directory, keep, staging_options["retention_max_age_days"],
+                          staging_options["retention_max_total_gb"], older_than=started)
 
     except Exception as e:
-        logging.error(f"? An error occurred during the restoration process: {e}")
+        logging.error(f"An error occurred during the restoration process: {e}")
         raise
+    finally:
+        if prefetcher is not None:
+            prefetcher.cancel()
+        if conn is not None:
+            conn.close()
+        if own_pool:
+            pool.close_all()
+
+# 3a Restore First File Function
+def restore_first_file(cursor, target, header, stage_limits, pool, session_id, restore_options, progress_callback=None,
+                       staging_options=None):
+    """
+    Restores the FULL backup that starts the chain, after checking the data/log volumes and the database state.
+    An ONLINE database has its connections drained and is overwritten (`force_restore_mode`).
+    """
+    database_name = target.database_name
+
+    # Check the data/log volumes before touching the database
+    check_database_files_space(read_file_list(cursor, header.path), database_name, restore_options["move"],
+                               (staging_options or {}).get("reserve_gb", 0))
+
+    # Check the database state
+    logging.info("Checking database state...")
+    db_state = check_database_state(cursor, database_name)
+    if db_state not in (None, "RESTORING", "ONLINE"):
+        logging.error(f"Database {database_name} is in unexpected state: {db_state}. Restore cannot proceed.")
+        raise RuntimeError(f"Database {database_name} is in an unexpected state: {db_state}. Reset it before running the restore.")
+
+    with stage_limits.stage("restore", target.instance), \
+            monitor_restore(pool.connect, target, session_id, header.path, progress_callback) as monitor:
+        # If database is ONLINE, force it into RESTORING mode with the FULL backup of the chain
+        if db_state == "ONLINE":
+            logging.warning(f"Database {database_name} is already ONLINE. Automatically forcing restore...")
+            with span("restore", byte_count=backup_size(header.path), database=database_name,
+                      key=header.key, backup_type=header.backup_type):
+                force_restore_mode(cursor, database_name, header.path, restore_options, monitor.on_message)
+        else:
+            restore_chain_file(cursor, database_name, header, restore_options, monitor.on_message)
+
+# 3b Prefetch Chain File Function
+def prefetch_chain_file(entry, target, stage_limits, s3_client=None, staging=None, header_cache=None, pool=None,
+                        settings=None, journal=None, cancel_event=None):
+    """
+    Fetch stage of the restore pipeline for one planned file, run on a Prefetcher thread while the
+    previous file is restored: download and extract it, run RESTORE VERIFYONLY ([Verify] verifyonly) and
+    read its header (through the header cache) on a connection borrowed from `pool`.
+    With a `journal`, a file an earlier run already extracted (and verified) for the same ETag is reused.
+    `cancel_event` is the Prefetcher's: setting it stops the download or extraction at its next chunk.
+    Returns the BackupHeader with the local path of the file.
+    """
+    settings = settings or get_settings()
+    pool = pool or get_pool()
+    verify_options = get_verify_options(settings)
+
+    path = journal.extracted_paths(entry.key, entry.etag) if journal else None
+    if path:
+        logging.info(f"Reusing {entry.key} extracted by an earlier run: {path}")
+        verified = "verified" in journal.record(entry.key)
+    else:
+        path = fetch_backup(entry, target, stage_limits, s3_client, staging=staging, settings=settings, journal=journal,
+                            cancel_event=cancel_event)
+        verified = False
+    if verify_options["verifyonly"] and not verified:
+        if not verify_backup_file(pool.connect, target, path, verify_options["verifyonly_checksum"]):
+            logging.warning(f"{entry.key} failed RESTORE VERIFYONLY, fetching it again...")
+            path = fetch_backup(entry, target, stage_limits, s3_client, refetch=True, staging=staging,
+                                settings=settings, journal=journal, cancel_event=cancel_event)
+            if not verify_backup_file(pool.connect, target, path, verify_options["verifyonly_checksum"]):
+                raise RuntimeError(f"Backup {entry.key} failed RESTORE VERIFYONLY after being fetched again.")
+        if journal:
+            journal.mark(entry.key, "verified", etag=entry.etag)
+
+    with pool.connection(target.dsn) as conn:
+        header = read_backup_header(conn.cursor(), path, entry.key, etag=entry.etag, header_cache=header_cache)
+    return header._replace(path=path, key=entry.key)
+
+# 3c Fetch Backup Function
+def fetch_backup(entry, target, stage_limits, s3_client=None, refetch=False, staging=None, settings=None,
+                 journal=None, cancel_event=None):
+    """
+    Downloads and extracts (or streams) one catalog entry and returns the extracted `.bak` path
+    (or the list of stripe files for a striped backup).
+
+    - Downloads are checked against the S3 ETag while they run (`download_file`); 7-Zip and py7zr check the
+      CRC of every extracted file while decoding.
+    - A CRC failure during extraction discards only this archive and fetches it once more.
+    - `refetch` discards the local archive first, e.g. after the file failed RESTORE VERIFYONLY.
+    - `staging` (StagingPlan) overrides the configured extract mode and decides whether the archive is kept.
+    - `journal` (RestoreJournal) records the downloaded and extracted steps.
+    - `cancel_event` (threading.Event) stops the download, stream or extraction at its next chunk; the partial
+      files are deleted and StageCancelled raised.
+    - With [Cache] directory set, archives come from the shared download cache (`DownloadCache.fetch`), which
+      downloads each object once for all targets and runs; a refetch drops the cached object too.
+    """
+    settings = settings or get_settings()
+    extract_options = get_extract_options(settings)
+    mode = staging.mode if staging else extract_options["mode"]
+    archive_path = os.path.join(target.backup_directory, os.path.basename(entry.key))
+    if refetch:
+        discard_download(archive_path)
+
+    try:
+        if mode == "stream":
+            # Stream backup from S3 straight into the decoder
+            logging.info(f"Streaming {entry.backup_type} backup: {entry.key}")
+            with stage_limits.stage("download"), stage_limits.stage("extract"):
+                backup_paths = stream_extract_file(entry.key, target.backup_directory, expected_type=entry.backup_type,
+                                                   bucket_name=target.s3_bucket_name, s3_client=s3_client,
+                                                   password=extract_options["password"],
+                                                   window_mb=extract_options["stream_window_mb"],
+                                                   cancel_event=cancel_event)
+            if journal:
+                journal.mark(entry.key, "downloaded", etag=entry.etag)
+        else:
+            # Download and extract backup
+            logging.info(f"Downloading {entry.backup_type} backup: {entry.key}")
+            cache = get_download_cache(settings)
+            download_options = get_download_options(settings)
+            with stage_limits.stage("download"):
+                if cache:
+                    s3_client = s3_client or create_s3_client()
+                    archive_path = cache.fetch(
+                        s3_client, target.s3_bucket_name, entry.key, archive_path,
+                        lambda object_path: download_file(entry.key, object_path, bucket_name=target.s3_bucket_name,
+                                                          s3_client=s3_client, cancel_event=cancel_event,
+                                                          **download_options),
+                        refresh=refetch)
+                else:
+                    archive_path = download_file(entry.key, archive_path, bucket_name=target.s3_bucket_name,
+                                                 s3_client=s3_client, cancel_event=cancel_event, **download_options)
+            if journal:
+                journal.mark(entry.key, "downloaded", etag=entry.etag)
+            with stage_limits.stage("extract"):
+                backup_paths = extract_file(archive_path, expected_type=entry.backup_type,
+                                            threads=extract_options["threads"] or None, password=extract_options["password"],
+                                            seven_zip=extract_options["seven_zip"], cancel_event=cancel_event)
+            if staging and not staging.keep_archives:
+                discard_download(archive_path)
+            else:
+                # Mark the archive as recently used for LRU retention
+                os.utime(archive_path)
+    except ChecksumMismatchError as e:
+        if refetch:
+            raise
+        logging.warning(f"{entry.key} failed its integrity check, fetching the archive again: {e}")
+        return fetch_backup(entry, target, stage_limits, s3_client, refetch=True, staging=staging, settings=settings,
+                            journal=journal, cancel_event=cancel_event)
+
+    if journal:
+        journal.mark(entry.key, "extracted", etag=entry.etag, paths=backup_paths)
+    # Striped backups are restored from every extracted file
+    return backup_paths[0] if len(backup_paths) == 1 else backup_paths
+
+# 3d Plan Chain Staging Function
+def plan_chain_staging(entries, target, s3_client=None, staged_files=None, settings=None, check=True):
+    """
+    Estimates the disk footprint of the planned chain files and picks how to stage them (`plan_staging`).
+
+    - Extracted sizes come from the archive listing: `7z l` for archives already on disk, otherwise the
+      archive headers in S3 (py7zr); without either, the catalog size times [Staging] compression_ratio.
+    - `staged_files` caches the estimates across re-planning passes.
+    - `check=False` returns the smallest footprint instead of raising when the chain does not fit (`--plan`).
+    """
+    settings = settings or get_settings()
+    staging_options = get_staging_options(settings)
+    extract_options = get_extract_options(settings)
+    staged_files = {} if staged_files is None else staged_files
+    stream_available = importlib.util.find_spec("py7zr") is not None
+
+    for entry in entries:
+        if entry.key in staged_files:
+            continue
+        archive_path = os.path.join(target.backup_directory, os.path.basename(entry.key))
+        members = None
+        try:
+            if os.path.exists(archive_path):
+                members = list_archive_contents(archive_path, extract_options["password"], extract_options["seven_zip"])
+            elif stream_available:
+                members = list_remote_archive(entry.key, target.s3_bucket_name, s3_client, extract_options["password"])
+        except Exception as e:
+            logging.warning(f"Could not list {entry.key}, estimating its extracted size: {e}")
+
+        backup_members = select_backup_members(members, entry.backup_type) if members else []
+        if backup_members:
+            extracted_paths = [os.path.join(target.backup_directory, *member["path"].replace("\\", "/").split("/"))
+                               for member in backup_members]
+            extracted_bytes = sum(member["size"] for member in backup_members)
+        else:
+            extracted_paths = []
+            extracted_bytes = int((entry.size or 0) * staging_options["compression_ratio"])
+        staged_files[entry.key] = StagedFile(entry.key, archive_path, entry.size or 0, extracted_paths, extracted_bytes)
+
+    return plan_staging([staged_files[entry.key] for entry in entries], target.backup_directory,
+                        mode=extract_options["mode"], keep_archives=staging_options["keep_archives"],
+                        reserve_gb=staging_options["reserve_gb"], stream_available=stream_available, check=check)
+
+# 3e Verify Backup File Function
+def verify_backup_file(connect, target, backup_path, checksum=False):
+    """
+    Runs RESTORE VERIFYONLY for one fetched file on its own connection, so it overlaps the next download.
+    """
+    conn = connect(target.dsn)
+    try:
+        return verify_backup(conn.cursor(), backup_path, checksum)
+    finally:
+        conn.close()
+
+# 3f Restore Chain File Function
+def restore_chain_file(cursor, database_name, header, restore_options=None, on_message=None, stop_at=None):
+    """
+    Restores one file of the chain WITH NORECOVERY using the restore function for its backup type.
+    `stop_at` is applied as STOPAT when the file is a LOG backup (the last one of a point-in-time chain).
+    """
+    with span("restore", byte_count=backup_size(header.path), database=database_name, key=header.key,
+              backup_type=header.backup_type):
+        if header.backup_type == "FULL":
+            restore_full_backup(cursor, database_name, header.path, restore_options, on_message)
+        elif header.backup_type == "DIFF":
+            restore_diff_backup(cursor, database_name, header.path, False, restore_options, on_message)
+        else:
+            if stop_at is not None:
+                logging.info(f"Stopping LOG restore at {stop_at:%Y-%m-%d %H:%M:%S}.")
+                restore_options = dict(restore_options or {}, stop_at=stop_at)
+            restore_log_backup(cursor, database_name, header.path, False, restore_options, on_message)
+
+# Backup Size Helper
+def backup_size(backup_path):
+    """
+    Returns the size in bytes of a backup file, or the total of its stripe files.
+    """
+    backup_paths = [backup_path] if isinstance(backup_path, str) else backup_path
+    return sum(os.path.getsize(path) for path in backup_paths if os.path.exists(path))
+
+# 3g Monitor Restore Function
+def monitor_restore(connect, target, session_id, backup_path, progress_callback=None):
+    """
+    Creates a RestoreMonitor for one restore statement, watching it from a second connection.
+    """
+    return RestoreMonitor(connect, target.dsn, session_id, target.database_name, total_bytes=backup_size(backup_path),
+                          callback=progress_callback)
+
+# 4. Restore All Databases Function
+def restore_all_databases(connect=None, s3_client=None, progress_callback=None, settings=None, stop_at=None):
+    """
+    Restores every target from `config.ini` concurrently with per-stage concurrency limits.
+    A failure in one target does not abort the others. Returns the per-target results.
+    All targets borrow SQL Server connections from one pool.
+    """
+    settings = settings or get_settings()
+    targets = list(settings.targets)
+    stage_limits = StageLimits(
+        download=settings.scheduler.download_concurrency,
+        extract=settings.scheduler.extract_concurrency,
+        restore_per_instance=settings.scheduler.restore_concurrency_per_instance,
+    )
+    pool = create_pool(connect, settings)
+    logging.info(f"Scheduling restores for targets: {[target.name for target in targets]}")
+    try:
+        return run_restore_targets(
+            targets,
+            lambda target, limits: restore_database(target, limits, s3_client=s3_client,
+                                                    progress_callback=progress_callback, settings=settings, pool=pool,
+                                                    stop_at=stop_at),
+            stage_limits,
+            max_parallel_targets=settings.scheduler.max_parallel_targets or None,
+        )
+    finally:
+        pool.close_all()
+
+# 5. Write Run Reports Function
+def write_run_reports(recorder, results, settings=None):
+    """
+    Writes the JSON run report next to the log (or to [Report] directory) and, if configured,
+    the Prometheus textfile with per-stage timings.
+    """
+    settings = settings or get_settings()
+    report_path = os.path.join(get_report_directory(settings), f"restore_report_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    try:
+        write_run_report(recorder, report_path, results)
+        textfile_path = settings.report.prometheus_textfile
+        if textfile_path:
+            write_prometheus_textfile(recorder, textfile_path, results)
+    except OSError as e:
+        logging.error(f"Could not write the run report: {e}")
+
+# Report Directory Helper
+def get_report_directory(settings=None):
+    """
+    Returns where run reports are written (and read back for `--plan` estimates): [Report] directory or the log directory.
+    """
+    settings = settings or get_settings()
+    return settings.report.directory or os.path.dirname(settings.paths.log_file_path)
+
+# 6. Plan Database Function
+def plan_database(target=None, s3_client=None, settings=None, stop_at=None, history=None):
+    """
+    Plans the restore of one target the way `restore_database` would and estimates its cost, without writing
+    anything: no SQL Server connection, no downloads, and the catalog cache is refreshed in memory only.
+
+    - The chain comes from `plan_chain_keys` and the disk footprint from `plan_chain_staging` (archive listings).
+    - Durations use `history` (`load_stage_history`); a chain that does not fit on disk is reported, not raised.
+    """
+    settings = settings or get_settings()
+    target = target or get_default_target(settings)
+    history = load_stage_history(get_report_directory(settings)) if history is None else history
+
+    catalog = load_catalog(target.s3_bucket_name, target.s3_backup_prefix, s3_client=s3_client, read_only=True,
+                           database=target.s3_database_name, **get_catalog_options(target.backup_directory, settings))
+    entries = plan_chain_keys(catalog, database=target.s3_database_name, stop_at=stop_at)
+    if not entries:
+        raise RuntimeError("No FULL backup available in S3.")
+    staged_files = {}
+    staging = plan_chain_staging(entries, target, s3_client, staged_files, settings, check=False)
+    estimate = estimate_chain([staged_files[entry.key] for entry in entries], staging, history,
+                              settings.scheduler.prefetch_files)
+    for file_estimate, entry in zip(estimate["files"], entries):
+        file_estimate.update(backup_type=entry.backup_type, timestamp=entry.timestamp.isoformat())
+
+    reserve_bytes = int(settings.staging.reserve_gb * 2**30)
+    return dict(
+        target=target.name, database=target.database_name, backup_directory=target.backup_directory,
+        fits=staging.peak_bytes + reserve_bytes <= staging.free_bytes, **estimate,
+    )
+
+# 7. Plan All Databases Function
+def plan_all_databases(s3_client=None, settings=None, stop_at=None):
+    """
+    Returns the `--plan` document: the chain and estimates of every target, the totals for running them
+    under [Scheduler] max_parallel_targets, and the stage history the estimates were based on.
+    A target that cannot be planned is reported with its error instead of failing the others.
+    """
+    settings = settings or get_settings()
+    history = load_stage_history(get_report_directory(settings))
+    targets = []
+    for target in settings.targets:
+        try:
+            targets.append(plan_database(target, s3_client, settings, stop_at, history))
+        except Exception as e:
+            logging.error(f"Could not plan the restore of {target.name}: {e}")
+            targets.append({"target": target.name, "database": target.database_name, "error": str(e)})
+
+    return {
+        "generated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "stop_at": stop_at.isoformat() if stop_at else None,
+        "targets": targets,
+        "total": combine_estimates([plan for plan in targets if "error" not in plan],
+                                   settings.scheduler.max_parallel_targets),
+        "history": history,
+    }
 
 if __name__ == "__main__":
-    configure_logging()
-    restore_database()
+    parser = argparse.ArgumentParser(description="Restore the configured databases from the S3 backups.")
+    parser.add_argument("--stop-at", type=parse_stop_at, default=None,
+                        help="Point-in-time restore: restore as of this server-local time (YYYY-MM-DD HH:MM[:SS]).")
+    parser.add_argument("--plan", nargs="?", const="-", default=None, metavar="FILE",
+                        help="Print the restore plan and cost estimate as JSON (or write it to FILE) and exit "
+                             "without downloading or restoring anything.")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    if args.plan:
+        # A dry run leaves the restore log alone (and needs no log directory)
+        logging.basicConfig(stream=sys.stderr, level=logging.INFO,
+                            format="%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s")
+        plan = plan_all_databases(settings=settings, stop_at=args.stop_at)
+        if args.plan == "-":
+            print(json.dumps(plan, indent=2))
+        else:
+            with open(args.plan, "w", encoding="utf-8") as plan_file:
+                json.dump(plan, plan_file, indent=2)
+        raise SystemExit(1 if any("error" in target for target in plan["targets"]) else 0)
+    configure_logging(settings)
+    recorder = start_run()
+    results = restore_all_databases(settings=settings, stop_at=args.stop_at)
+    write_run_reports(recorder, results, settings)
+    if any(error is not None for error in results.values()):
+        raise SystemExit(1)
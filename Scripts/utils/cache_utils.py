@@ -0,0 +1,212 @@
+import os
+import re
+import shutil
+import logging
+
+from utils.file_utils import FileLock
+from utils.s3_utils import load_download_manifest, discard_download
+from utils.timing_utils import span
+
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks
+    fcntl = None
+
+"""
+Shared Download Cache for ETO Backup & Restore Application
+
+`backup_directory` is keyed by file basename, so every target (and every staging server) restoring from the same
+archives downloads them from S3 again. With [Cache] directory set, archives are downloaded once into a
+content-addressed store and linked into each target's staging directory:
+
+    <directory>/objects/<etag>_<size><ext>                 archive (plus its download manifest)
+    <directory>/objects/<etag>_<size><ext>.lock            per-object lock file
+
+- Objects are keyed by S3 ETag and size, so the same archive under any key, bucket or target is stored once,
+  and a re-uploaded archive (new ETag) is never mistaken for the old one.
+- Each object is downloaded under an exclusive file lock (`fcntl.flock` / `msvcrt.locking`): concurrent runs
+  and concurrent targets wait for the first download and then reuse it, so an object is never fetched twice.
+- Materialisation into staging tries a hardlink, then a reflink (FICLONE, e.g. XFS/Btrfs), then a plain copy
+  (e.g. the cache is on another volume). Archives are only ever replaced, never written in place, so linked
+  copies cannot change the cached object.
+- `shared_directories` are read-only caches with the same layout (a network mount populated by another host,
+  or a local directory in tests). They are searched before S3 and copied into the local cache on a hit.
+- After every fetch the least recently used objects are evicted until the cache fits in `max_gb`; objects
+  locked by another process are skipped. A staging link keeps its data until staging retention removes it.
+
+Functions:
+1. DownloadCache(directory, max_gb=0, shared_directories=()) - Content-addressed archive cache with LRU eviction.
+2. object_name(etag, size, s3_key="") - Returns the cache file name of an S3 object.
+3. materialize(source_path, destination_path) - Hardlinks, reflinks or copies a cached file into place.
+"""
+
+GB = 1024 ** 3
+OBJECTS_DIRECTORY = "objects"
+LOCK_SUFFIX = ".lock"
+SIDE_SUFFIXES = (LOCK_SUFFIX, ".manifest.json", ".manifest.json.tmp", ".temp", ".link", ".copy")
+FICLONE = 0x40049409
+
+# 1. Download Cache
+class DownloadCache:
+    """
+    (1) Content-addressed archive cache shared by all targets of a run and by concurrent runs on the host.
+
+    - `fetch(s3_client, bucket_name, s3_key, destination_path, download)` materialises the object at
+      `destination_path`, calling `download(object_path)` only when neither this cache nor a shared one has it.
+    - `refresh=True` drops the cached object first (it failed extraction or RESTORE VERIFYONLY) and downloads it
+      from S3 again; shared caches are not consulted, since they may hold the same corrupt copy.
+    - `evict()` removes the least recently used objects above `max_gb` (0 = no cap).
+    """
+    def __init__(self, directory, max_gb=0, shared_directories=()):
+        self.directory = directory
+        self.objects = os.path.join(directory, OBJECTS_DIRECTORY)
+        self.max_gb = max_gb
+        self.shared_directories = [path for path in shared_directories if path]
+        os.makedirs(self.objects, exist_ok=True)
+
+    def lock(self, name):
+        return FileLock(os.path.join(self.objects, name + LOCK_SUFFIX))
+
+    def fetch(self, s3_client, bucket_name, s3_key, destination_path, download, refresh=False):
+        """
+        Returns `destination_path` holding the current S3 object `s3_key`, with its download manifest.
+        """
+        head = s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+        etag, size = head["ETag"], head["ContentLength"]
+        name = object_name(etag, size, s3_key)
+        object_path = os.path.join(self.objects, name)
+
+        with span("cache", key=s3_key, object=name) as timer:
+            with self.lock(name):
+                if refresh:
+                    logging.info(f"Dropping cached {name} for {s3_key}")
+                    discard_download(object_path)
+                source = "cache"
+                if not _is_complete(object_path, etag, size):
+                    shared_path = None if refresh else self._find_shared(name, etag, size)
+                    if shared_path:
+                        source = "shared"
+                        _copy_object(shared_path, object_path)
+                    else:
+                        source = "s3"
+                        download(object_path)
+                        if not _is_complete(object_path, etag, size):
+                            # The key was overwritten between HEAD and download; the next attempt keys it anew
+                            discard_download(object_path)
+                            raise RuntimeError(f"s3://{bucket_name}/{s3_key} changed while it was cached; retry.")
+                # Last use for LRU eviction (shared with hardlinked staging copies)
+                os.utime(object_path)
+                method = materialize(object_path, destination_path)
+            if source != "s3":
+                timer.add_bytes(size)
+            timer.set(source=source, method=method)
+        logging.info(f"{s3_key} served from {source} ({name}, {method}) to {destination_path}")
+        self.evict(keep=(name,))
+        return destination_path
+
+    def _find_shared(self, name, etag, size):
+        for directory in self.shared_directories:
+            path = os.path.join(directory, OBJECTS_DIRECTORY, name)
+            if _is_complete(path, etag, size):
+                return path
+        return None
+
+    def entries(self):
+        """
+        Returns `(last_used, size, name)` of every cached object, least recently used first.
+        """
+        entries = []
+        for name in os.listdir(self.objects):
+            path = os.path.join(self.objects, name)
+            if name.endswith(SIDE_SUFFIXES) or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return sorted(entries)
+
+    def evict(self, keep=()):
+        """
+        Deletes the least recently used objects until the cache fits in `max_gb`; returns the deleted names.
+        Objects in `keep` or locked by another fetch are left alone.
+        """
+        if not self.max_gb:
+            return []
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        deleted = []
+        for _, size, name in entries:
+            if total <= self.max_gb * GB:
+                break
+            if name in keep:
+                continue
+            lock = self.lock(name)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                # Lock files stay: another process may be waiting on this one
+                discard_download(os.path.join(self.objects, name))
+            except OSError as e:
+                logging.warning(f"Could not evict cached {name}: {e}")
+                continue
+            finally:
+                lock.release()
+            total -= size
+            deleted.append(name)
+            logging.info(f"Evicted cached {name} ({size / GB:.1f}GB, least recently used)")
+        return deleted
+
+def _is_complete(path, etag, size):
+    if not os.path.isfile(path) or os.path.getsize(path) != size:
+        return False
+    manifest = load_download_manifest(path)
+    return bool(manifest) and manifest.get("complete") and manifest.get("etag") == etag
+
+def _copy_object(source_path, object_path):
+    """
+    Copies an object and its manifest from a shared cache; the object appears only once fully copied.
+    """
+    shutil.copyfile(source_path, object_path + ".copy")
+    shutil.copyfile(source_path + ".manifest.json", object_path + ".manifest.json")
+    os.replace(object_path + ".copy", object_path)
+
+# 2. Object Name Function
+def object_name(etag, size, s3_key=""):
+    """
+    (2) Returns the cache file name of an object: its ETag (without quotes) and size, plus the key's extension.
+    """
+    digest = re.sub(r"[^0-9A-Za-z-]", "", etag)
+    return f"{digest}_{size}{os.path.splitext(s3_key)[1].lower()}"
+
+def _reflink(source_path, destination_path):
+    if fcntl is None or not hasattr(fcntl, "ioctl"):
+        raise OSError("reflink is not supported on this platform")
+    with open(source_path, "rb") as source, open(destination_path, "wb") as destination:
+        fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+
+# 3. Materialize Function
+def materialize(source_path, destination_path):
+    """
+    (3) Places `source_path` (and its download manifest) at `destination_path` and returns how:
+    `existing` (already the same file), `hardlink`, `reflink` or `copy`. The destination is replaced atomically.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(destination_path)), exist_ok=True)
+    if os.path.exists(destination_path) and os.path.samefile(source_path, destination_path):
+        method = "existing"
+    else:
+        link_path = destination_path + ".link"
+        if os.path.exists(link_path):
+            os.remove(link_path)
+        try:
+            os.link(source_path, link_path)
+            method = "hardlink"
+        except OSError:
+            try:
+                _reflink(source_path, link_path)
+                method = "reflink"
+            except OSError:
+                shutil.copyfile(source_path, link_path)
+                method = "copy"
+        os.replace(link_path, destination_path)
+    # The staging copy keeps its own manifest, so it is reused like any other download
+    shutil.copyfile(source_path + ".manifest.json", destination_path + ".manifest.json")
+    return method
@@ -0,0 +1,403 @@
+import os
+import re
+import time
+import bisect
+import sqlite3
+import logging
+import threading
+import argparse
+from collections import namedtuple
+from datetime import datetime
+from utils.config_utils import get_settings
+from utils.timing_utils import span
+from utils.delta_utils import CHUNK_MANIFEST_SUFFIX
+
+"""
+S3 Backup Catalog for ETO Backup & Restore Application
+
+Pages through the S3 backup prefix and indexes every backup key by database and type, so
+"latest FULL" and "DIFFs after FULL X" are binary searches instead of re-sorting every key.
+
+Backup keys are expected to look like `<prefix><database>_<FULL|DIFF|LOG>_<YYYYMMDDhhmmss>.<ext>`.
+Chunk manifests uploaded next to the archives (`<key>.chunks.json`, see `delta_utils`) are not backups.
+
+The catalog can be persisted in a local SQLite cache next to `backup_directory`. Later runs only list keys
+newer than the last key known for each database and type, with a periodic full reconciliation that also drops
+keys deleted from S3. Within the TTL no listing is done at all.
+
+Functions:
+1. parse_backup_key(key, size=0, etag=None, last_modified=None) - Parses an S3 key into a BackupEntry (or None).
+2. BackupCatalog(bucket_name, prefix, s3_client=None) - Paginated, indexed catalog of backups under a prefix.
+3. load_catalog(bucket_name, prefix, cache_path, ...) - Loads the cached catalog and refreshes it incrementally.
+4. invalidate_catalog_cache(cache_path) - Deletes the local catalog cache so the next run lists S3 from scratch.
+5. create_s3_client() - Creates the shared boto3 S3 client, importing boto3 on first use only.
+6. main() - Command line access to the cache (`--invalidate`, `--refresh`, `--full`).
+"""
+
+# Global Variables
+BACKUP_TYPES = ("FULL", "DIFF", "LOG")
+TIMESTAMP_FORMAT = "%Y%m%d%H%M%S"
+BACKUP_KEY_PATTERN = re.compile(
+    r"^(?P<database>.+?)_(?P<backup_type>FULL|DIFF|LOG)_(?P<timestamp>\d{8}_?\d{6})", re.IGNORECASE
+)
+
+MAX_KEY = "\uffff"  # Sorts after every key with the same timestamp
+catalog_cache_name = "backup_catalog.sqlite"
+
+BackupEntry = namedtuple("BackupEntry", ["key", "database", "backup_type", "timestamp", "size", "etag", "last_modified"])
+
+# 1. Parse Backup Key Function
+def parse_backup_key(key, size=0, etag=None, last_modified=None):
+    """
+    (1) Parses an S3 key into a BackupEntry.
+
+    - Returns None for keys that do not follow the `<database>_<TYPE>_<timestamp>` naming convention,
+      and for the `<key>.chunks.json` manifests of delta sync (they share the archive's name).
+    """
+    if key.lower().endswith(CHUNK_MANIFEST_SUFFIX):
+        return None
+    match = BACKUP_KEY_PATTERN.match(key.rsplit("/", 1)[-1])
+    if not match:
+        return None
+    try:
+        timestamp = datetime.strptime(match.group("timestamp").replace("_", ""), TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    return BackupEntry(
+        key=key,
+        database=match.group("database"),
+        backup_type=match.group("backup_type").upper(),
+        timestamp=timestamp,
+        size=size,
+        etag=etag,
+        last_modified=last_modified,
+    )
+
+# 2. Backup Catalog
+class BackupCatalog:
+    """
+    (2) Paginated, indexed catalog of the backups under an S3 prefix.
+
+    - `refresh()` pages through the prefix with a `list_objects_v2` paginator.
+    - `refresh(since=datetime)` only lists keys newer than `since` for every known database and type,
+      using a per-group `StartAfter` key, so a nightly run only lists new backups.
+    - `refresh_new()` lists only the keys added since the last listing (see its docstring).
+    - Entries are indexed by (database, type) in timestamp order for O(log n) lookups.
+    - `bucket_name` and `prefix` default to [Paths] s3_bucket_name and s3_backup_prefix.
+    """
+    def __init__(self, bucket_name=None, prefix=None, s3_client=None):
+        if not bucket_name or prefix is None:
+            paths = get_settings().paths
+            bucket_name = bucket_name or paths.s3_bucket_name
+            prefix = paths.s3_backup_prefix if prefix is None else prefix
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.s3_client = s3_client
+        self.entries = {}
+        self.index = {}
+        self.skipped_keys = 0
+        self.listed_keys = 0
+
+    def _client(self):
+        if self.s3_client is None:
+            self.s3_client = create_s3_client()
+        return self.s3_client
+
+    def _list(self, prefix, start_after=None):
+        paginator = self._client().get_paginator("list_objects_v2")
+        arguments = {"Bucket": self.bucket_name, "Prefix": prefix}
+        if start_after:
+            arguments["StartAfter"] = start_after
+
+        listed = 0
+        with span("list", bucket=self.bucket_name, prefix=prefix) as timer:
+            for page in paginator.paginate(**arguments):
+                for obj in page.get("Contents", []):
+                    listed += 1
+                    entry = parse_backup_key(obj["Key"], obj.get("Size", 0), obj.get("ETag"), obj.get("LastModified"))
+                    if entry:
+                        self.add(entry)
+                    else:
+                        self.skipped_keys += 1
+            timer.set(keys=listed)
+        return listed
+
+    def refresh(self, since=None, start_after=None):
+        """
+        Lists the prefix and indexes every backup key. Returns the number of keys listed.
+
+        - `start_after` lists only keys after that key in the whole prefix.
+        - `since` lists only keys newer than that timestamp for each (database, type) already in the catalog;
+          an empty catalog falls back to a full listing.
+        """
+        if since is None or not self.index:
+            listed = self._list(self.prefix, start_after)
+        else:
+            listed = 0
+            for database, backup_type in list(self.index):
+                group_prefix = f"{self.prefix}{database}_{backup_type}_"
+                listed += self._list(group_prefix, f"{group_prefix}{since.strftime(TIMESTAMP_FORMAT)}")
+
+        self.listed_keys += listed
+        logging.info(f"Listed {listed} keys under s3://{self.bucket_name}/{self.prefix} "
+                     f"({len(self.entries)} backups indexed, {self.skipped_keys} unrecognised keys skipped)")
+        return listed
+
+    def refresh_new(self):
+        """
+        Lists only the keys added since the last listing. Returns the number of keys listed.
+        An empty catalog falls back to a full listing.
+
+        - One listing of the whole prefix after the newest known key finds every key that sorts last
+          (e.g. the next dated sub-folder).
+        - Keys are not date-sorted across databases and types (`ETO_DIFF_...` sorts before `ETO_LOG_...`), so each
+          type of every database is also listed in the database's newest folder, after its newest key there.
+        - The number of listings depends on the databases and types, not on the number of keys or folders.
+          New databases and new spellings of a prefix are left to the periodic full sync
+          (`load_catalog(database=...)` does one at once when the requested database is unknown).
+        """
+        if not self.index:
+            return self.refresh()
+
+        newest_key = max(self.entries)
+        start_after = {self.prefix: newest_key}
+        for database in self.databases():
+            newest = [self.entries[group[-1][1]] for (group_database, _), group in self.index.items()
+                      if group_database == database]
+            folder = _key_folder(max(newest, key=lambda entry: (entry.timestamp, entry.key)).key)
+            for entry in newest:
+                group_prefix = folder + _group_name(entry.key)
+                last_key = entry.key if entry.key.startswith(group_prefix) else None
+                # Keys after the newest key of the prefix are listed already
+                if max(last_key or "", group_prefix) < newest_key:
+                    start_after[group_prefix] = last_key
+
+        listed = 0
+        for prefix, last_key in sorted(start_after.items()):
+            listed += self._list(prefix, last_key)
+        self.listed_keys += listed
+        logging.info(f"Listed {listed} new keys under s3://{self.bucket_name}/{self.prefix} "
+                     f"({len(start_after)} prefixes, {len(self.entries)} backups indexed)")
+        return listed
+
+    def clear(self):
+        """
+        Removes every entry from the catalog.
+        """
+        self.entries = {}
+        self.index = {}
+        self.skipped_keys = 0
+
+    def add(self, entry):
+        """
+        Adds or replaces a BackupEntry and keeps its (database, type) group sorted by timestamp.
+        """
+        group = self.index.setdefault((entry.database, entry.backup_type), [])
+        previous = self.entries.get(entry.key)
+        if previous:
+            group.pop(bisect.bisect_left(group, (previous.timestamp, previous.key)))
+        self.entries[entry.key] = entry
+        bisect.insort(group, (entry.timestamp, entry.key))
+
+    def _groups(self, database, backup_type):
+        backup_type = backup_type.upper()
+        if database is not None:
+            group = self.index.get((database, backup_type))
+            return [group] if group else []
+        return [group for (_, group_type), group in self.index.items() if group_type == backup_type]
+
+    def databases(self):
+        """
+        Returns the sorted database names found in the catalog.
+        """
+        return sorted({database for database, _ in self.index})
+
+    def latest(self, backup_type, database=None, before=None):
+        """
+        Returns the newest entry of `backup_type` (at or before `before`, if given), or None.
+        `database=None` searches every database in the catalog.
+        """
+        best = None
+        for group in self._groups(database, backup_type):
+            position = len(group) if before is None else bisect.bisect_right(group, (before, MAX_KEY))
+            if position and (best is None or group[position - 1] > best):
+                best = group[position - 1]
+        return self.entries[best[1]] if best else None
+
+    def after(self, backup_type, timestamp, database=None, until=None):
+        """
+        Returns the entries of `backup_type` newer than `timestamp` (and at or before `until`), oldest first.
+        """
+        found = []
+        for group in self._groups(database, backup_type):
+            start = bisect.bisect_right(group, (timestamp, MAX_KEY))
+            end = len(group) if until is None else bisect.bisect_right(group, (until, MAX_KEY))
+            found.extend(group[start:end])
+        return [self.entries[key] for _, key in sorted(found)]
+
+def _key_folder(key):
+    """
+    Returns the folder part of a key, including its trailing slash: `SQLBackups/2025/x.7z` -> `SQLBackups/2025/`.
+    """
+    return key[:key.rfind("/") + 1]
+
+def _group_name(key):
+    """
+    Returns the `<database>_<TYPE>_` start of a backup key's file name, spelled as in the key.
+    """
+    name = key[len(_key_folder(key)):]
+    return name[:BACKUP_KEY_PATTERN.match(name).end("backup_type") + 1]
+
+# 3. Load Catalog Function
+def load_catalog(bucket_name=None, prefix=None, cache_path=None, s3_client=None, ttl_minutes=None,
+                 full_sync_hours=None, force_full=False, read_only=False, database=None):
+    """
+    (3) Loads the backup catalog from the local SQLite cache and brings it up to date.
+
+    - Within `ttl_minutes` of the last sync the cached catalog is returned without listing S3.
+    - After `full_sync_hours` (or with `force_full`) the whole prefix is listed again, dropping deleted keys.
+    - Otherwise only keys added since the last listing are listed (`refresh_new`).
+    - `database` is the database about to be restored; when the catalog has no backups of it yet the TTL is
+      ignored and the whole prefix is listed, since an incremental listing cannot find a new database.
+    - `read_only` refreshes in memory but does not write the cache.
+    - `cache_path`, `ttl_minutes` and `full_sync_hours` default to [Catalog] (see `default_cache_path`).
+    """
+    catalog = BackupCatalog(bucket_name, prefix, s3_client=s3_client)
+    if not cache_path or ttl_minutes is None or full_sync_hours is None:
+        settings = get_settings()
+        cache_path = cache_path or default_cache_path(settings)
+        ttl_minutes = settings.catalog.ttl_minutes if ttl_minutes is None else ttl_minutes
+        full_sync_hours = settings.catalog.full_sync_hours if full_sync_hours is None else full_sync_hours
+    ttl_seconds = ttl_minutes * 60
+    full_sync_seconds = full_sync_hours * 3600
+    now = time.time()
+
+    state = {}
+    if os.path.exists(cache_path):
+        with _open_cache(cache_path) as connection:
+            state = dict(connection.execute("SELECT name, value FROM sync_state"))
+            if state.get("bucket") == catalog.bucket_name and state.get("prefix") == catalog.prefix:
+                for row in connection.execute(
+                        "SELECT key, database, backup_type, timestamp, size, etag, last_modified FROM entries"):
+                    # Caches written before chunk manifests were excluded may still list them
+                    if row[0].lower().endswith(CHUNK_MANIFEST_SUFFIX):
+                        continue
+                    catalog.add(BackupEntry(row[0], row[1], row[2], datetime.strptime(row[3], TIMESTAMP_FORMAT),
+                                            row[4], row[5], row[6]))
+            else:
+                state = {}
+
+    last_synced = float(state.get("last_synced", 0))
+    last_full_sync = float(state.get("last_full_sync", 0))
+
+    unknown_database = database is not None and catalog.entries and database not in catalog.databases()
+    if unknown_database:
+        logging.info(f"No backups of {database} in the cached catalog; listing the whole prefix.")
+
+    if not force_full and not unknown_database and catalog.entries and now - last_synced < ttl_seconds:
+        logging.info(f"Using cached backup catalog ({len(catalog.entries)} backups, "
+                     f"synced {int(now - last_synced)}s ago): {cache_path}")
+        return catalog
+
+    full_sync = force_full or unknown_database or not catalog.entries or now - last_full_sync >= full_sync_seconds
+    if full_sync:
+        catalog.clear()
+        catalog.refresh()
+        last_full_sync = now
+    else:
+        catalog.refresh_new()
+
+    if not read_only:
+        _save_catalog(catalog, cache_path, full_sync, {
+            "bucket": catalog.bucket_name,
+            "prefix": catalog.prefix,
+            "last_synced": repr(now),
+            "last_full_sync": repr(last_full_sync),
+        })
+    return catalog
+
+def default_cache_path(settings=None):
+    """
+    Returns [Catalog] cache_path, or `backup_catalog.sqlite` in [Paths] backup_directory when it is blank.
+    """
+    settings = settings or get_settings()
+    return settings.catalog.cache_path or os.path.join(settings.paths.backup_directory, catalog_cache_name)
+
+def _open_cache(cache_path):
+    connection = sqlite3.connect(cache_path)
+    connection.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT)")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, database TEXT, backup_type TEXT, "
+        "timestamp TEXT, size INTEGER, etag TEXT, last_modified TEXT)"
+    )
+    return connection
+
+def _save_catalog(catalog, cache_path, full_sync, state):
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    connection = _open_cache(cache_path)
+    try:
+        with connection:
+            if full_sync:
+                connection.execute("DELETE FROM entries")
+            connection.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(entry.key, entry.database, entry.backup_type, entry.timestamp.strftime(TIMESTAMP_FORMAT),
+                  entry.size, entry.etag, None if entry.last_modified is None else str(entry.last_modified))
+                 for entry in catalog.entries.values()],
+            )
+            connection.executemany("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", state.items())
+    finally:
+        connection.close()
+    logging.info(f"Saved backup catalog cache ({len(catalog.entries)} backups): {cache_path}")
+
+# 4. Invalidate Catalog Cache Function
+def invalidate_catalog_cache(cache_path=None):
+    """
+    (4) Deletes the local catalog cache so the next run performs a full listing.
+    """
+    cache_path = cache_path or default_cache_path()
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+        logging.info(f"Backup catalog cache invalidated: {cache_path}")
+        return True
+    logging.info(f"No backup catalog cache to invalidate: {cache_path}")
+    return False
+
+# 5. Create S3 Client Function
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def create_s3_client():
+    """
+    (5) Returns the process-wide boto3 S3 client. boto3 is imported here rather than at module load,
+    so commands that never touch S3 (status, dry runs, tests with a local stand-in) start quickly.
+    boto3 clients are thread-safe, so download and streaming workers share this one.
+    """
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            import boto3
+            _s3_client = boto3.client("s3")
+        return _s3_client
+
+# 6. Main Function
+if __name__ == "__main__":
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Manage the local S3 backup catalog cache.")
+    parser.add_argument("--cache-path", default=default_cache_path(settings), help="Path of the SQLite catalog cache.")
+    parser.add_argument("--bucket", default=settings.paths.s3_bucket_name)
+    parser.add_argument("--prefix", default=settings.paths.s3_backup_prefix)
+    parser.add_argument("--invalidate", action="store_true", help="Delete the cache.")
+    parser.add_argument("--refresh", action="store_true", help="Refresh the cache now, ignoring the TTL.")
+    parser.add_argument("--full", action="store_true", help="Force a full reconciliation listing.")
+    args = parser.parse_args()
+
+    if args.invalidate:
+        invalidate_catalog_cache(args.cache_path)
+    if args.refresh or args.full:
+        catalog = load_catalog(args.bucket, args.prefix, args.cache_path, ttl_minutes=0, force_full=args.full)
+        for database in catalog.databases():
+            for backup_type in BACKUP_TYPES:
+                entry = catalog.latest(backup_type, database=database)
+                if entry:
+                    print(f"{database:<20} {backup_type:<5} {entry.timestamp:%Y-%m-%d %H:%M:%S}  {entry.key}")
@@ -0,0 +1,148 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+"""
+Restore Chain Planner for ETO Backup & Restore Application
+
+Pure functions that pick the shortest restore chain (one FULL, the newest DIFF after it and only the LOG
+backups needed after that) from the catalog, and check each fetched file's header against the chain restored
+so far. Nothing here talks to S3 or SQL Server, so the planner can be tested with synthetic headers.
+
+Functions:
+1. header_from_row(row, path, key=None) - Converts a `RESTORE HEADERONLY` row (dict by column name) into a BackupHeader.
+2. plan_chain_keys(catalog, database=None, stop_at=None, exclude=()) - Picks the S3 keys a chain needs from the catalog timestamps.
+3. parse_stop_at(value) - Parses a `--stop-at` timestamp.
+4. check_chain_link(chain, header, stop_at=None) - Decides whether the next fetched file extends a partly restored chain.
+5. reaches_target(chain, stop_at) - Tells whether a restored chain covers the point-in-time target.
+6. stops_at_target(header, stop_at, last=False) - Tells whether a file is restored WITH STOPAT.
+"""
+
+# SQL Server `RESTORE HEADERONLY` BackupType values
+HEADER_BACKUP_TYPES = {1: "FULL", 2: "LOG", 5: "DIFF"}
+
+BackupHeader = namedtuple("BackupHeader", [
+    "path", "key", "backup_type", "database_name", "first_lsn", "last_lsn", "database_backup_lsn",
+    "differential_base_lsn", "checkpoint_lsn", "backup_start", "backup_finish",
+])
+
+def _lsn(value):
+    return None if value is None else int(value)
+
+# 1. Header From Row Function
+def header_from_row(row, path, key=None):
+    """
+    (1) Converts a `RESTORE HEADERONLY` row, keyed by column name, into a BackupHeader.
+    """
+    backup_type = HEADER_BACKUP_TYPES.get(int(row["BackupType"]))
+    if backup_type is None:
+        raise ValueError(f"Unsupported BackupType {row['BackupType']} in {path}")
+    return BackupHeader(
+        path=path,
+        key=key,
+        backup_type=backup_type,
+        database_name=row.get("DatabaseName"),
+        first_lsn=_lsn(row["FirstLSN"]),
+        last_lsn=_lsn(row["LastLSN"]),
+        database_backup_lsn=_lsn(row.get("DatabaseBackupLSN")),
+        differential_base_lsn=_lsn(row.get("DifferentialBaseLSN")),
+        checkpoint_lsn=_lsn(row["CheckpointLSN"]),
+        backup_start=row.get("BackupStartDate"),
+        backup_finish=row.get("BackupFinishDate"),
+    )
+
+# 2. Plan Chain Keys Function
+def plan_chain_keys(catalog, database=None, stop_at=None, exclude=()):
+    """
+    (2) Selects the catalog entries a restore chain needs, based on backup timestamps.
+
+    - The newest FULL at or before `stop_at`, the newest DIFF after it, and the LOG backups after that base.
+    - With `stop_at` logs stop at the first one taken at or after the target time.
+    - `exclude` skips keys already rejected (e.g. a DIFF whose LSN did not match the FULL).
+    - Each file is checked against its real header with `check_chain_link` once it is fetched.
+    """
+    full = catalog.latest("FULL", database=database, before=stop_at)
+    while full and full.key in exclude:
+        full = catalog.latest("FULL", database=database, before=full.timestamp - timedelta(seconds=1))
+    if not full:
+        return []
+
+    chain = [full]
+    diffs = [entry for entry in catalog.after("DIFF", full.timestamp, database=full.database, until=stop_at)
+             if entry.key not in exclude]
+    if diffs:
+        chain.append(diffs[-1])
+
+    if stop_at is None:
+        chain += [log for log in catalog.after("LOG", chain[-1].timestamp, database=full.database)
+                  if log.key not in exclude]
+        return chain
+
+    # Logs up to the target, plus the first log taken after it (it contains the target time)
+    chain += [log for log in catalog.after("LOG", chain[-1].timestamp, database=full.database, until=stop_at)
+              if log.key not in exclude]
+    if chain[-1].backup_type != "LOG" or chain[-1].timestamp < stop_at:
+        chain += [log for log in catalog.after("LOG", max(stop_at, chain[-1].timestamp), database=full.database)
+                  if log.key not in exclude][:1]
+    return chain
+
+# 3. Parse Stop At Function
+def parse_stop_at(value):
+    """
+    (3) Parses a point-in-time target such as `2025-03-01 14:30` or `2025-03-01T14:30:00` (server local time).
+    """
+    try:
+        return datetime.fromisoformat(value.strip().replace("T", " "))
+    except ValueError:
+        raise ValueError(f"Invalid --stop-at timestamp: {value!r} (expected YYYY-MM-DD HH:MM[:SS])")
+
+# 4. Check Chain Link Function
+def check_chain_link(chain, header, stop_at=None):
+    """
+    (4) Decides what to do with the next file of a chain that is restored while it is still being fetched.
+
+    `chain` holds the headers restored so far, in order. Returns:
+    - "restore": the file extends the chain.
+    - "skip": a LOG already covered by the chain (its LastLSN is not past the chain's).
+    - "reject": a DIFF that does not belong to the chain's FULL; the caller re-plans without it.
+    - "done": with `stop_at`, the chain already reaches the target time.
+    Raises ValueError when the file cannot start or continue the chain (no FULL first, or a LOG gap).
+    """
+    if not chain:
+        if header.backup_type != "FULL":
+            raise ValueError(f"The restore chain must start with a FULL backup, got {header.backup_type} {header.key}.")
+        return "restore"
+
+    last = chain[-1]
+    if stop_at is not None and reaches_target(chain, stop_at):
+        return "done"
+    if header.backup_type == "FULL":
+        raise ValueError(f"Unexpected second FULL backup in the restore chain: {header.key}.")
+    if header.backup_type == "DIFF":
+        if header.differential_base_lsn != chain[0].checkpoint_lsn or last.backup_type != "FULL":
+            return "reject"
+        return "restore"
+    if header.last_lsn <= last.last_lsn:
+        return "skip"
+    if header.first_lsn > last.last_lsn:
+        raise ValueError(f"Log chain gap: {header.key} starts at LSN {header.first_lsn}, chain ends at {last.last_lsn}.")
+    return "restore"
+
+# 5. Reaches Target Function
+def reaches_target(chain, stop_at):
+    """
+    (5) Returns True when the restored `chain` covers `stop_at`: it ends with a LOG that finished at or after
+    the target (the LOG that contains it). A chain ending before the target is missing a LOG backup.
+    """
+    last = chain[-1] if chain else None
+    return (last is not None and last.backup_type == "LOG" and last.backup_finish is not None
+            and last.backup_finish >= stop_at)
+
+# 6. Stops At Target Function
+def stops_at_target(header, stop_at, last=False):
+    """
+    (6) Returns True when `header` is the file of a point-in-time chain that is restored WITH STOPAT: a LOG that
+    finished at or after `stop_at` (or whose finish is unknown), or the `last` planned file.
+    """
+    if stop_at is None or header.backup_type != "LOG":
+        return False
+    return last or header.backup_finish is None or header.backup_finish >= stop_at
@@ -1,60 +1,248 @@
 import os
 import configparser
 import logging
+from collections import namedtuple
 
 """
 Configuration Utilities for ETO Backup & Restore Application
 
+`config.ini` is parsed once into a typed, read-only Settings object that is passed through the pipeline.
+Any option can be overridden from the environment as `ETO_<SECTION>_<OPTION>` (e.g. `ETO_DOWNLOAD_MAX_WORKERS=16`,
+`ETO_DATABASE_DSN=...`); secrets come from their own variables (`ZIP_PASSWORD`).
+
 Functions:
-1. load_config(): Loads configuration from `config.ini`.
+1. load_config(): Loads configuration from `config.ini` (raw ConfigParser, environment overrides applied).
 2. test_config(): Prints and logs key configuration values for verification.
+3. load_settings(config_path=None, environ=None): Builds the typed Settings from `config.ini` and the environment.
+4. get_settings(): Returns the Settings loaded once for this process.
 """
 
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "Config", "config.ini")
+ENVIRONMENT_PREFIX = "ETO_"
+
+PathSettings = namedtuple("PathSettings", [
+    "backup_directory", "seven_zip_path", "s3_bucket_name", "s3_backup_prefix", "log_file_path", "zip_password",
+])
+ReportSettings = namedtuple("ReportSettings", ["directory", "prometheus_textfile"])
+DatabaseSettings = namedtuple("DatabaseSettings", [
+    "dsn", "database_name", "pool_max_idle", "health_check_seconds", "connect_retries", "connect_backoff_seconds",
+])
+DownloadSettings = namedtuple("DownloadSettings", [
+    "part_size_mb", "parts", "max_workers", "max_bandwidth_mbps", "delta_sync",
+])
+CacheSettings = namedtuple("CacheSettings", ["directory", "shared_directories", "max_gb"])
+StagingSettings = namedtuple("StagingSettings", [
+    "reserve_gb", "keep_archives", "compression_ratio", "retention_max_age_days", "retention_max_total_gb",
+])
+VerifySettings = namedtuple("VerifySettings", ["checksums", "verifyonly", "verifyonly_checksum"])
+ExtractSettings = namedtuple("ExtractSettings", ["mode", "stream_window_mb", "threads"])
+CatalogSettings = namedtuple("CatalogSettings", ["cache_path", "ttl_minutes", "full_sync_hours", "header_cache_path"])
+SchedulerSettings = namedtuple("SchedulerSettings", [
+    "download_concurrency", "extract_concurrency", "restore_concurrency_per_instance", "max_parallel_targets",
+    "prefetch_files", "stage_retries", "stage_retry_backoff_seconds",
+])
+RestoreSettings = namedtuple("RestoreSettings", [
+    "buffercount", "maxtransfersize", "blocksize", "stats", "move", "drain_mode", "drain_timeout_seconds",
+])
+PermissionSettings = namedtuple("PermissionSettings", ["enabled", "file"])
+Settings = namedtuple("Settings", [
+    "config_path", "paths", "report", "database", "download", "cache", "staging", "verify", "extract", "catalog",
+    "scheduler", "restore", "permissions", "targets",
+])
+
+_settings = None
+
 # 1. Load configuration from `config.ini`
-def load_config():
+def load_config(config_path=None, environ=None):
     """
     (1) Loads configuration from the specified config file.
-    
-    - Reads and parses `config.ini`.
-    - Returns a dictionary of key configuration values.
+
+    - Reads and parses `config.ini` (or the file named by the `ETO_CONFIG_PATH` environment variable).
+    - Applies `ETO_<SECTION>_<OPTION>` environment overrides to existing sections.
+    - Returns the ConfigParser; use `load_settings()` / `get_settings()` for typed values.
     """
+    environ = os.environ if environ is None else environ
     config = configparser.ConfigParser()
-    config_path = os.path.join(os.path.dirname(__file__), "..", "..", "Config", "config.ini")
+    config_path = config_path or environ.get("ETO_CONFIG_PATH") or DEFAULT_CONFIG_PATH
 
     if not os.path.exists(config_path):
-        logging.error(f"? Configuration file not found: {config_path}")
+        logging.error(f"Configuration file not found: {config_path}")
         raise FileNotFoundError(f"Configuration file not found: {config_path}")
 
     config.read(config_path)
+    _apply_environment(config, environ)
     return config
 
+def _apply_environment(config, environ):
+    """
+    Overrides `[Section] option` with `ETO_SECTION_OPTION`. Sections are matched case-insensitively;
+    options that are not in the file yet are added (the longest matching section name wins).
+    """
+    sections = sorted(config.sections(), key=len, reverse=True)
+    for name, value in environ.items():
+        if not name.upper().startswith(ENVIRONMENT_PREFIX) or name.upper() == "ETO_CONFIG_PATH":
+            continue
+        key = name[len(ENVIRONMENT_PREFIX):].lower()
+        for section in sections:
+            section_key = section.lower().replace(":", "_") + "_"
+            if key.startswith(section_key) and len(key) > len(section_key):
+                config.set(section, key[len(section_key):], value)
+                break
+
 # 2. Function to test configuration loading
 def test_config():
     """
     (2) Reads the configuration and prints/logs key values for verification.
-    
+
     - Confirms critical values like backup directory, S3 bucket, and DSN.
     """
-    config = load_config()
+    settings = load_settings()
 
-    backup_dir = config.get("Paths", "backup_directory", fallback="Not Set")
-    s3_bucket = config.get("Paths", "s3_bucket_name", fallback="Not Set")
-    dsn = config.get("Database", "dsn", fallback="Not Set")
+    backup_dir = settings.paths.backup_directory or "Not Set"
+    s3_bucket = settings.paths.s3_bucket_name or "Not Set"
+    dsn = settings.database.dsn or "Not Set"
 
-    print("? Configuration Loaded Successfully!")
+    print("Configuration Loaded Successfully!")
     print(f"Backup Directory: {backup_dir}")
     print(f"S3 Bucket: {s3_bucket}")
     print(f"DSN: {dsn}")
 
-    logging.info("? Configuration Loaded Successfully!")
+    logging.info("Configuration Loaded Successfully!")
     logging.info(f"Backup Directory: {backup_dir}")
     logging.info(f"S3 Bucket: {s3_bucket}")
     logging.info(f"DSN: {dsn}")
 
+# 3. Load Settings Function
+def load_settings(config_path=None, environ=None):
+    """
+    (3) Builds the typed Settings from `config.ini` and the environment.
+
+    - Every option has the same default the pipeline used before it was configurable.
+    - Invalid values (e.g. an unknown extract mode or a non-numeric size) raise ValueError here,
+      before any download or restore has started.
+    """
+    environ = os.environ if environ is None else environ
+    config = load_config(config_path, environ)
+
+    def text(section, option, fallback=""):
+        return config.get(section, option, fallback=fallback).strip()
+
+    extract_mode = text("Extract", "mode", "file").lower()
+    if extract_mode not in ("file", "stream"):
+        raise ValueError(f"Unsupported extract mode in config.ini: {extract_mode}")
+    move = text("Restore", "move")
+    drain_mode = text("Restore", "drain_mode", "single_user").upper()
+    if drain_mode not in ("SINGLE_USER", "RESTRICTED_USER"):
+        raise ValueError(f"Unsupported drain mode in config.ini: {drain_mode}")
+    connect_retries = config.getint("Database", "connect_retries", fallback=3)
+    if connect_retries < 1:
+        raise ValueError(f"connect_retries in config.ini must be at least 1 (attempts), got {connect_retries}")
+    config_path = os.path.abspath(config_path or environ.get("ETO_CONFIG_PATH") or DEFAULT_CONFIG_PATH)
+    permissions_file = text("Permissions", "file") or "permissions.json"
+
+    # Imported here to keep config_utils free of pipeline imports at module load
+    from utils.scheduler_utils import load_restore_targets
+
+    return Settings(
+        config_path=config_path,
+        paths=PathSettings(
+            backup_directory=text("Paths", "backup_directory", "E:\\Eto_Backup_Restore\\Backups\\ETO"),
+            seven_zip_path=text("Paths", "seven_zip_path", "E:\\7z.exe"),
+            s3_bucket_name=text("Paths", "s3_bucket_name", "ssg-etobphc"),
+            s3_backup_prefix=text("Paths", "s3_backup_prefix", "SQLBackups/"),
+            log_file_path=text("Logging", "log_file_path", "E:\\Eto_Backup_Restore\\Logs\\restore_process.log"),
+            zip_password=environ.get("ZIP_PASSWORD"),
+        ),
+        report=ReportSettings(
+            directory=text("Report", "directory"),
+            prometheus_textfile=text("Report", "prometheus_textfile"),
+        ),
+        database=DatabaseSettings(
+            dsn=text("Database", "dsn", "DSN=ETO_DSN"),
+            database_name=text("Database", "database_name", "ETO"),
+            pool_max_idle=config.getint("Database", "pool_max_idle", fallback=4),
+            health_check_seconds=config.getfloat("Database", "health_check_seconds", fallback=30),
+            connect_retries=connect_retries,
+            connect_backoff_seconds=config.getfloat("Database", "connect_backoff_seconds", fallback=1),
+        ),
+        download=DownloadSettings(
+            part_size_mb=config.getfloat("Download", "part_size_mb", fallback=64),
+            parts=config.getint("Download", "parts", fallback=0),
+            max_workers=config.getint("Download", "max_workers", fallback=8),
+            max_bandwidth_mbps=config.getfloat("Download", "max_bandwidth_mbps", fallback=0),
+            delta_sync=config.getboolean("Download", "delta_sync", fallback=False),
+        ),
+        cache=CacheSettings(
+            directory=text("Cache", "directory"),
+            shared_directories=tuple(path.strip() for path in text("Cache", "shared_directories").split(";")
+                                     if path.strip()),
+            max_gb=config.getfloat("Cache", "max_gb", fallback=0),
+        ),
+        staging=StagingSettings(
+            reserve_gb=config.getfloat("Staging", "reserve_gb", fallback=10),
+            keep_archives=config.getboolean("Staging", "keep_archives", fallback=True),
+            compression_ratio=config.getfloat("Staging", "compression_ratio", fallback=4),
+            retention_max_age_days=config.getfloat("Staging", "retention_max_age_days", fallback=14),
+            retention_max_total_gb=config.getfloat("Staging", "retention_max_total_gb", fallback=0),
+        ),
+        verify=VerifySettings(
+            checksums=config.getboolean("Verify", "checksums", fallback=True),
+            verifyonly=config.getboolean("Verify", "verifyonly", fallback=False),
+            verifyonly_checksum=config.getboolean("Verify", "verifyonly_checksum", fallback=False),
+        ),
+        extract=ExtractSettings(
+            mode=extract_mode,
+            stream_window_mb=config.getfloat("Extract", "stream_window_mb", fallback=256),
+            threads=config.getint("Extract", "threads", fallback=0),
+        ),
+        catalog=CatalogSettings(
+            cache_path=text("Catalog", "cache_path"),
+            ttl_minutes=config.getfloat("Catalog", "ttl_minutes", fallback=30),
+            full_sync_hours=config.getfloat("Catalog", "full_sync_hours", fallback=24),
+            header_cache_path=text("Catalog", "header_cache_path"),
+        ),
+        scheduler=SchedulerSettings(
+            download_concurrency=config.getint("Scheduler", "download_concurrency", fallback=2),
+            extract_concurrency=config.getint("Scheduler", "extract_concurrency", fallback=1),
+            restore_concurrency_per_instance=config.getint("Scheduler", "restore_concurrency_per_instance", fallback=1),
+            max_parallel_targets=config.getint("Scheduler", "max_parallel_targets", fallback=0),
+            prefetch_files=config.getint("Scheduler", "prefetch_files", fallback=2),
+            stage_retries=config.getint("Scheduler", "stage_retries", fallback=2),
+            stage_retry_backoff_seconds=config.getfloat("Scheduler", "stage_retry_backoff_seconds", fallback=5),
+        ),
+        restore=RestoreSettings(
+            buffercount=config.getint("Restore", "buffercount", fallback=0),
+            maxtransfersize=config.getint("Restore", "maxtransfersize", fallback=0),
+            blocksize=config.getint("Restore", "blocksize", fallback=0),
+            stats=config.getint("Restore", "stats", fallback=0),
+            move=dict(
+                (part.split("=", 1)[0].strip(), part.split("=", 1)[1].strip())
+                for part in move.split(";") if "=" in part
+            ),
+            drain_mode=drain_mode,
+            drain_timeout_seconds=config.getfloat("Restore", "drain_timeout_seconds", fallback=60),
+        ),
+        permissions=PermissionSettings(
+            enabled=config.getboolean("Permissions", "enabled", fallback=True),
+            file=os.path.join(os.path.dirname(config_path), permissions_file),
+        ),
+        targets=tuple(load_restore_targets(config)),
+    )
+
+# 4. Get Settings Function
+def get_settings():
+    """
+    (4) Returns the Settings for this process, loading them on first use only.
+    """
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
 # Example Usage
 if __name__ == "__main__":
-    logging.basicConfig(filename="E:\\Eto_Backup_Restore\\Logs\\restore_process.log",
+    logging.basicConfig(filename=get_settings().paths.log_file_path,
                         level=logging.INFO,
                         format="%(asctime)s - %(levelname)s - %(message)s")
-    
+
     test_config()
@@ -0,0 +1,189 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+"""
+SQL Server Connection Pool for ETO Backup & Restore Application
+
+Keeps autocommit connections to `master` open between uses, so restore commands, the progress monitor,
+header reads, RESTORE VERIFYONLY and post-restore SQL each borrow their own connection without paying
+the login cost again, and a monitor query never waits on the cursor running a long RESTORE.
+
+- Idle connections are health-checked (`SELECT 1`) before reuse when they have been idle for a while;
+  a dead connection is dropped and replaced.
+- New connections are opened with reconnect-with-backoff, so a briefly unavailable instance
+  (failover, service restart) does not fail the run.
+- `pool.connect(dsn)` returns a connection whose `close()` hands it back to the pool, so code written
+  for `connect_to_database` (RestoreMonitor, verify_backup_file) works unchanged.
+
+Functions:
+1. ConnectionPool(connect=None, max_idle=4, ...) - Pool of autocommit connections per DSN.
+2. get_pool() - Returns the process-wide pool over `connect_to_database`.
+3. master_dsn(dsn, database="master") - Adds `DATABASE=master` to a connection string that names no database.
+"""
+
+# 1. Connection Pool
+class ConnectionPool:
+    """
+    (1) Pool of autocommit connections per DSN.
+
+    - `connect(dsn)` opens a raw connection (defaults to `db_utils.connect_to_database`).
+    - At most `max_idle` idle connections are kept per DSN; more may be borrowed at once.
+    - Idle connections older than `health_check_seconds` are checked with `SELECT 1` before reuse.
+    - Opening a connection is tried `retries` times (at least once), waiting `backoff` seconds doubled per
+      attempt up to `max_backoff`.
+    """
+    def __init__(self, connect=None, max_idle=4, health_check_seconds=30, retries=3, backoff=1.0, max_backoff=30,
+                 database="master"):
+        if connect is None:
+            from utils.db_utils import connect_to_database
+            connect = connect_to_database
+        self._connect = connect
+        self.max_idle = max_idle
+        self.health_check_seconds = health_check_seconds
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.database = database
+        self.idle = {}
+        self.opened = 0
+        self.reused = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def _open(self, dsn):
+        delay = self.backoff
+        attempts = max(self.retries, 1)
+        for attempt in range(1, attempts + 1):
+            try:
+                conn = self._connect(master_dsn(dsn, self.database) if self.database else dsn)
+                with self.lock:
+                    self.opened += 1
+                return conn
+            except Exception as e:
+                if attempt == attempts:
+                    raise
+                logging.warning(f"Connection attempt {attempt}/{attempts} failed: {e}. Retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                delay = min(self.max_backoff, delay * 2)
+
+    def _healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            return True
+        except Exception as e:
+            logging.warning(f"Dropping dead pooled connection: {e}")
+            _close_quietly(conn)
+            return False
+
+    def acquire(self, dsn):
+        """
+        Returns a raw connection for `dsn`: a healthy idle one if available, otherwise a new one.
+        """
+        while True:
+            with self.lock:
+                idle = self.idle.get(dsn)
+                conn, released = idle.pop() if idle else (None, None)
+            if conn is None:
+                return self._open(dsn)
+            if time.monotonic() - released < self.health_check_seconds or self._healthy(conn):
+                with self.lock:
+                    self.reused += 1
+                return conn
+
+    def release(self, dsn, conn, discard=False):
+        """
+        Returns a connection to the pool; `discard` (or a full pool) closes it instead.
+        """
+        if conn is None:
+            return
+        with self.lock:
+            idle = self.idle.setdefault(dsn, [])
+            if not discard and not self.closed and len(idle) < self.max_idle:
+                idle.append((conn, time.monotonic()))
+                return
+        _close_quietly(conn)
+
+    @contextmanager
+    def connection(self, dsn):
+        """
+        Borrows a connection for the `with` block. A connection that fails its health check on the way
+        out (e.g. after a network error inside the block) is dropped instead of returned.
+        """
+        conn = self.acquire(dsn)
+        try:
+            yield conn
+        except Exception:
+            self.release(dsn, conn, discard=not self._healthy(conn))
+            raise
+        self.release(dsn, conn)
+
+    def connect(self, dsn):
+        """
+        Borrows a connection that goes back to the pool when `close()` is called on it.
+        """
+        return PooledConnection(self, dsn, self.acquire(dsn))
+
+    def close_all(self):
+        """
+        Closes every idle connection; connections still borrowed are closed when released.
+        """
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for conn, _ in connections:
+                _close_quietly(conn)
+        logging.info(f"Connection pool closed ({self.opened} opened, {self.reused} reused).")
+
+class PooledConnection:
+    """
+    Borrowed connection; `close()` returns it to the pool instead of logging out.
+    """
+    def __init__(self, pool, dsn, conn):
+        self.pool = pool
+        self.dsn = dsn
+        self.conn = conn
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def close(self):
+        conn, self.conn = self.conn, None
+        self.pool.release(self.dsn, conn)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+# 2. Get Pool Function
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    (2) Returns the process-wide ConnectionPool over `connect_to_database`, created on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = ConnectionPool()
+        return _pool
+
+# 3. Master DSN Function
+def master_dsn(dsn, database="master"):
+    """
+    (3) Adds `DATABASE=<database>` to an ODBC connection string that does not name a database, so
+    pooled connections never hold a session in the database being restored.
+    """
+    if any(part.strip().lower().startswith("database=") for part in dsn.split(";")):
+        return dsn
+    return f"{dsn.rstrip(';')};DATABASE={database}"
@@ -1,49 +1,63 @@
 import os
 import logging
 import time
-import pyodbc
-
-# Database Configuration
-backup_directory = "E:\\Eto_Backup_Restore\\Backups\\ETO"
-log_file_path = "E:\\Eto_Backup_Restore\\Logs\\restore_process.log"
-dsn = "DSN=ETO_DSN"
-
-# Initialize Logging
-logging.basicConfig(
-    filename=log_file_path,
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
-logging.info("? Logging initialized successfully.")
+from utils.config_utils import get_settings
+from utils.chain_utils import header_from_row
+from utils.connection_utils import get_pool
+from utils.staging_utils import apply_retention
+from utils.timing_utils import span
 
 # ======================
-# ? Required Functions Checklist
-# 1?? connect_to_database(dsn) ? Establishes a connection to SQL Server
-# 2?? check_database_state(cursor, database_name) ? Checks the current state of the database
-# 3?? restore_full_backup(cursor, database_name, backup_file_path) ? Restores FULL backup and ensures completion
-# 4?? restore_diff_backup(cursor, database_name, backup_file_path, is_last_backup) ? Restores DIFF backup after validation
-# 5?? wait_for_database(cursor, database_name, expected_state, max_wait=1800, interval=90) ? Ensures database transitions properly before proceeding
-# 6?? validate_backup_lsn(full_backup_path, diff_backup_path) ? Ensures DIFF backup matches FULL backup LSN
-# 7?? verify_functions_exist() ? Ensures all required functions exist before execution
-# 8?? clear_old_backups(directory) ? Deletes old backups **ONLY after restore is confirmed**
+# Required Functions Checklist
+# 1. connect_to_database(dsn) - Establishes a connection to SQL Server
+# 2. check_database_state(cursor, database_name) - Checks the current state of the database
+# 3. restore_full_backup(cursor, database_name, backup_file_path) - Restores FULL backup and ensures completion
+# 4. restore_diff_backup(cursor, database_name, backup_file_path, is_last_backup) - Restores DIFF backup after validation
+# 5. wait_for_database(cursor, database_name, expected_state, max_wait=1800, interval=90, ...) - Ensures database transitions properly before proceeding
+# 6. validate_backup_lsn(full_backup_path, diff_backup_path) - Ensures DIFF backup matches FULL backup LSN
+# 6a read_backup_header(cursor, backup_file_path, key=None) - Reads RESTORE HEADERONLY by column name
+# 6b restore_log_backup(cursor, database_name, backup_file_path, is_last_backup) - Restores a LOG backup
+# 7. verify_functions_exist() - Ensures all required functions exist before execution
+# 8. clear_old_backups(directory, keep=(), ...) - Deletes old backups **ONLY after restore is confirmed** (age, then LRU)
+# 9. build_restore_command(database_name, backup_file_paths, ...) - Builds a tuned, quoted RESTORE statement
+# 9a read_file_list(cursor, backup_file_paths) - Reads RESTORE FILELISTONLY by column name
+# 10 execute_with_messages(cursor, sql, on_message=None) - Runs a statement and forwards its info messages
+# 10a get_session_id(cursor) - Returns the @@SPID of the connection
+# 10b verify_backup(cursor, backup_file_path, checksum=False) - Runs RESTORE VERIFYONLY on a backup file
+# 10c drain_connections(cursor, database_name, mode="SINGLE_USER", timeout=60) - Closes other sessions and waits until none remain
+# 10d read_last_restore(cursor, database_name) - Returns the newest msdb restore history entry of a database
 # ======================
 
-# 1?? Connect to Database Function
+# Restore Tuning
+RESTORE_TUNING_OPTIONS = ("BUFFERCOUNT", "MAXTRANSFERSIZE", "BLOCKSIZE", "STATS")
+VALID_BLOCKSIZES = (512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+# msdb restorehistory restore_type values
+RESTORE_HISTORY_TYPES = {"D": "FULL", "I": "DIFF", "L": "LOG"}
+
+# Connection Draining
+DRAIN_MODES = ("SINGLE_USER", "RESTRICTED_USER")
+DRAIN_INITIAL_INTERVAL = 0.05
+DRAIN_MAX_INTERVAL = 1.0
+
+# 1. Connect to Database Function
 def connect_to_database(dsn):
     """
     Establishes a connection to SQL Server.
+    pyodbc is imported on first use, so the module loads without the ODBC driver stack.
     """
+    import pyodbc
+
     try:
-        logging.info(f"?? Connecting to the database using DSN: {dsn}")
+        logging.info(f"Connecting to the database using DSN: {dsn}")
         conn = pyodbc.connect(dsn, autocommit=True)
-        logging.info("? Database connection established.")
+        logging.info("Database connection established.")
         return conn
     except Exception as e:
-        logging.error(f"? Error connecting to the database: {e}")
+        logging.error(f"Error connecting to the database: {e}")
         raise RuntimeError(f"Database connection failed: {e}")
 
-# 2?? Check Database State Function
+# 2. Check Database State Function
 def check_database_state(cursor, database_name):
     """
     Checks the current state of the database.
@@ -54,89 +68,152 @@ def check_database_state(cursor, database_name):
         row = cursor.fetchone()
         if row:
             state = row[0]
-            logging.info(f"?? Database '{database_name}' is in state: {state}")
+            logging.info(f"Database '{database_name}' is in state: {state}")
             return state
         else:
-            logging.error(f"? Database '{database_name}' does not exist.")
+            logging.error(f"Database '{database_name}' does not exist.")
             return None
     except Exception as e:
-        logging.error(f"? Error checking database state: {e}")
+        logging.error(f"Error checking database state: {e}")
         raise RuntimeError(f"Error checking database state: {e}")
 
-# 3?? Restore FULL Backup Function
-def restore_full_backup(cursor, database_name, backup_file_path):
+# 3. Restore FULL Backup Function
+def restore_full_backup(cursor, database_name, backup_file_path, options=None, on_message=None):
     """
     Restores FULL backup and ensures completion.
+    `backup_file_path` may be a list of stripe files; `options` holds tuning and MOVE settings.
+    `on_message` receives the STATS progress messages.
     """
     try:
-        logging.info(f"?? Executing FULL restore: {backup_file_path}")
-        cursor.execute(f"RESTORE DATABASE [{database_name}] FROM DISK = '{backup_file_path}' WITH NORECOVERY, REPLACE;")
-        logging.info(f"? FULL backup restored: {backup_file_path}")
+        logging.info(f"Executing FULL restore: {backup_file_path}")
+        execute_with_messages(cursor, build_restore_command(database_name, backup_file_path, replace=True,
+                                                            options=options), on_message)
+        logging.info(f"FULL backup restored: {backup_file_path}")
     except Exception as e:
-        logging.error(f"? Error restoring FULL backup: {e}")
+        logging.error(f"Error restoring FULL backup: {e}")
         raise RuntimeError(f"FULL backup restore failed: {e}")
 
-# 4?? Restore DIFF Backup Function
-def restore_diff_backup(cursor, database_name, backup_file_path, is_last_backup):
+# 4. Restore DIFF Backup Function
+def restore_diff_backup(cursor, database_name, backup_file_path, is_last_backup, options=None, on_message=None):
     """
     Restores DIFF backup after validation.
     """
     try:
-        logging.info(f"?? Executing DIFF restore: {backup_file_path}")
-        cursor.execute(f"RESTORE DATABASE [{database_name}] FROM DISK = '{backup_file_path}' {'WITH RECOVERY;' if is_last_backup else 'WITH NORECOVERY;'}")
-        logging.info(f"? DIFF backup restored: {backup_file_path}")
+        logging.info(f"Executing DIFF restore: {backup_file_path}")
+        execute_with_messages(cursor, build_restore_command(database_name, backup_file_path, recovery=is_last_backup,
+                                                            options=_without_move(options)), on_message)
+        logging.info(f"DIFF backup restored: {backup_file_path}")
     except Exception as e:
-        logging.error(f"? Error restoring DIFF backup: {e}")
+        logging.error(f"Error restoring DIFF backup: {e}")
         raise RuntimeError(f"DIFF backup restore failed: {e}")
 
-# 5?? Wait for Database Transition Function
-def wait_for_database(cursor, database_name, expected_state, max_wait=1800, interval=90):
+# 5. Wait for Database Transition Function
+def wait_for_database(cursor, database_name, expected_state, max_wait=1800, interval=90, initial_interval=1,
+                      wake_event=None):
     """
     Waits for the database to transition to the expected state.
+
+    - Polls after `initial_interval` seconds and backs off up to `interval` seconds.
+    - `wake_event` (threading.Event) cuts a wait short, e.g. when a restore statement completes.
     """
-    elapsed_time = 0
-    while elapsed_time < max_wait:
+    started = time.monotonic()
+    delay = initial_interval
+    while True:
         cursor.execute(f"SELECT state_desc FROM sys.databases WHERE name = '{database_name}'")
         row = cursor.fetchone()
         current_state = row[0] if row else "UNKNOWN"
 
         if current_state == expected_state:
-            logging.info(f"? Database '{database_name}' reached expected state: {expected_state}")
+            logging.info(f"Database '{database_name}' reached expected state: {expected_state}")
             return True
 
-        logging.info(f"? Database '{database_name}' is in state: {current_state}. Waiting {interval}s...")
-        time.sleep(interval)
-        elapsed_time += interval
+        remaining = max_wait - (time.monotonic() - started)
+        if remaining <= 0:
+            break
+        delay = min(delay, interval, remaining)
+        logging.info(f"Database '{database_name}' is in state: {current_state}. Waiting up to {delay:.0f}s...")
+        if wake_event is not None:
+            if wake_event.wait(delay):
+                wake_event.clear()
+        else:
+            time.sleep(delay)
+        delay *= 2
 
-    logging.error(f"? Database '{database_name}' did not reach state '{expected_state}' within {max_wait // 60} minutes. Aborting.")
+    logging.error(f"Database '{database_name}' did not reach state '{expected_state}' within {max_wait // 60} minutes. Aborting.")
     return False
 
-# 6?? Validate Backup LSN Function
-def validate_backup_lsn(full_backup_path, diff_backup_path):
+# 6. Validate Backup LSN Function
+def validate_backup_lsn(full_backup_path, diff_backup_path, cursor=None, header_cache=None):
     """
     Validates if the DIFF backup can be applied to the FULL backup by checking LSN values.
+    The DIFF's DifferentialBaseLSN must equal the FULL's CheckpointLSN.
+
+    - Reuses the caller's `cursor` when given; otherwise borrows a pooled connection.
+    - `header_cache` (utils.header_utils.HeaderCache) avoids re-reading headers of unchanged files.
     """
     try:
-        conn = connect_to_database(dsn="DSN=ETO_DSN")
-        cursor = conn.cursor()
+        if cursor is None:
+            with get_pool().connection(get_settings().database.dsn) as conn:
+                return validate_backup_lsn(full_backup_path, diff_backup_path, conn.cursor(), header_cache)
 
-        cursor.execute(f"RESTORE HEADERONLY FROM DISK = '{full_backup_path}'")
-        full_lsn = cursor.fetchone()[36]  # Column 36 contains FirstLSN
-
-        cursor.execute(f"RESTORE HEADERONLY FROM DISK = '{diff_backup_path}'")
-        diff_lsn = cursor.fetchone()[37]  # Column 37 contains DifferentialBaseLSN
+        full_lsn = read_backup_header(cursor, full_backup_path, header_cache=header_cache).checkpoint_lsn
+        diff_lsn = read_backup_header(cursor, diff_backup_path, header_cache=header_cache).differential_base_lsn
 
         if full_lsn == diff_lsn:
-            logging.info("? LSN validation successful. DIFF backup matches FULL backup.")
+            logging.info("LSN validation successful. DIFF backup matches FULL backup.")
             return True
         else:
-            logging.error(f"? LSN mismatch: FULL LSN={full_lsn}, DIFF LSN={diff_lsn}.")
+            logging.error(f"LSN mismatch: FULL CheckpointLSN={full_lsn}, DIFF DifferentialBaseLSN={diff_lsn}.")
             return False
     except Exception as e:
-        logging.error(f"? Error during LSN validation: {e}")
+        logging.error(f"Error during LSN validation: {e}")
         return False
 
-# 7?? Verify Functions Exist Function
+# 6a Read Backup Header Function
+def read_backup_header(cursor, backup_file_path, key=None, etag=None, header_cache=None):
+    """
+    Runs RESTORE HEADERONLY and returns the first backup set as a BackupHeader, reading columns by name.
+
+    - With `header_cache`, a header cached for the S3 `etag` or for the file's path/size/mtime is returned
+      without a SQL round-trip; newly read headers are added to the cache.
+    """
+    if header_cache:
+        header = header_cache.get(path=backup_file_path, etag=etag)
+        if header:
+            logging.info(f"Header cache hit: {backup_file_path}")
+            return header._replace(path=backup_file_path, key=key or header.key)
+
+    with span("header_read", key=key):
+        cursor.execute(f"RESTORE HEADERONLY FROM {disk_clause(backup_file_path)};")
+        columns = [column[0] for column in cursor.description]
+        row = cursor.fetchone()
+        if row is None:
+            raise RuntimeError(f"RESTORE HEADERONLY returned no backup sets for {backup_file_path}")
+        while cursor.nextset():
+            pass
+    header = header_from_row(dict(zip(columns, row)), backup_file_path, key)
+
+    if header_cache:
+        header_cache.put(header, etag)
+        header_cache.save()
+    return header
+
+# 6b Restore LOG Backup Function
+def restore_log_backup(cursor, database_name, backup_file_path, is_last_backup, options=None, on_message=None):
+    """
+    Restores a transaction LOG backup.
+    """
+    try:
+        logging.info(f"Executing LOG restore: {backup_file_path}")
+        execute_with_messages(cursor, build_restore_command(database_name, backup_file_path, restore_type="LOG",
+                                                            recovery=is_last_backup, options=_without_move(options)),
+                              on_message)
+        logging.info(f"LOG backup restored: {backup_file_path}")
+    except Exception as e:
+        logging.error(f"Error restoring LOG backup: {e}")
+        raise RuntimeError(f"LOG backup restore failed: {e}")
+
+# 7. Verify Functions Exist Function
 def verify_functions_exist():
     """
     Ensures that all required functions exist before running the script.
@@ -148,17 +225,202 @@ def verify_functions_exist():
         "restore_diff_backup",
         "wait_for_database",
         "validate_backup_lsn",
-        "clear_old_backups"
+        "read_backup_header",
+        "restore_log_backup",
+        "clear_old_backups",
+        "build_restore_command",
+        "read_file_list",
+        "execute_with_messages",
+        "get_session_id",
+        "verify_backup",
+        "drain_connections",
+        "read_last_restore"
     ]
     missing_functions = [func for func in required_functions if func not in globals()]
     if missing_functions:
-        logging.error(f"? Missing required functions: {missing_functions}")
+        logging.error(f"Missing required functions: {missing_functions}")
         exit(1)
-    logging.info("? All required functions are present.")
+    logging.info("All required functions are present.")
 
-# 8?? Clear Old Backups Function
-def clear_old_backups(directory):
+# 8. Clear Old Backups Function
+def clear_old_backups(directory, keep=(), max_age_days=0, max_total_gb=0, older_than=None):
     """
     Deletes older backups only AFTER the latest backup has been fully restored.
     """
-    pass  # Logic implemented in `restore_script.py`
+    return apply_retention(directory, keep, max_age_days, max_total_gb, older_than)
+
+# 9. Build Restore Command Function
+def build_restore_command(database_name, backup_file_paths, restore_type="DATABASE", recovery=False,
+                          replace=False, options=None):
+    """
+    Builds a RESTORE DATABASE/LOG statement with quoted identifiers and paths.
+
+    - `backup_file_paths` is one path or a list of stripe files from the same backup set.
+    - `options` may set buffercount, maxtransfersize, blocksize, stats,
+      move ({logical file name: physical path}, `{database}` is replaced by the database name) and
+      stop_at (a datetime, adds `STOPAT` for a point-in-time LOG restore).
+    """
+    options = options or {}
+    with_clauses = ["RECOVERY" if recovery else "NORECOVERY"]
+    if replace:
+        with_clauses.append("REPLACE")
+
+    for option_name in RESTORE_TUNING_OPTIONS:
+        value = options.get(option_name.lower())
+        if not value:
+            continue
+        value = int(value)
+        if option_name == "MAXTRANSFERSIZE" and (value % 65536 or not 65536 <= value <= 4194304):
+            raise ValueError(f"MAXTRANSFERSIZE must be a multiple of 65536 up to 4194304, got {value}")
+        if option_name == "BLOCKSIZE" and value not in VALID_BLOCKSIZES:
+            raise ValueError(f"BLOCKSIZE must be one of {VALID_BLOCKSIZES}, got {value}")
+        with_clauses.append(f"{option_name} = {value}")
+
+    for logical_name, physical_path in (options.get("move") or {}).items():
+        physical_path = physical_path.replace("{database}", database_name)
+        with_clauses.append(f"MOVE {quote_literal(logical_name)} TO {quote_literal(physical_path)}")
+
+    if options.get("stop_at"):
+        with_clauses.append(f"STOPAT = {quote_literal(options['stop_at'].strftime('%Y-%m-%dT%H:%M:%S'))}")
+
+    return (f"RESTORE {restore_type} {quote_identifier(database_name)} "
+            f"FROM {disk_clause(backup_file_paths)} WITH {', '.join(with_clauses)};")
+
+def quote_identifier(name):
+    """
+    Quotes a SQL Server identifier with brackets, escaping embedded `]`.
+    """
+    return "[" + name.replace("]", "]]") + "]"
+
+def quote_literal(value):
+    """
+    Quotes a Unicode string literal, escaping embedded `'`.
+    """
+    return "N'" + str(value).replace("'", "''") + "'"
+
+def disk_clause(backup_file_paths):
+    """
+    Builds `DISK = N'...', DISK = N'...'` for one path or a list of stripe files.
+    """
+    if isinstance(backup_file_paths, (str, os.PathLike)):
+        backup_file_paths = [backup_file_paths]
+    return ", ".join(f"DISK = {quote_literal(os.fspath(path))}" for path in backup_file_paths)
+
+def _without_move(options):
+    return {name: value for name, value in (options or {}).items() if name != "move"}
+
+# 9a Read File List Function
+def read_file_list(cursor, backup_file_paths):
+    """
+    Runs RESTORE FILELISTONLY and returns one dict per database file, keyed by column name
+    (LogicalName, PhysicalName, Type, Size, ...).
+    """
+    cursor.execute(f"RESTORE FILELISTONLY FROM {disk_clause(backup_file_paths)};")
+    columns = [column[0] for column in cursor.description]
+    files = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    while cursor.nextset():
+        pass
+    return files
+
+# 10 Execute With Messages Function
+def execute_with_messages(cursor, sql, on_message=None):
+    """
+    Executes `sql` and consumes every result set, passing info messages (e.g. RESTORE ... WITH STATS
+    "NN percent processed.") to `on_message` as they arrive.
+    """
+    cursor.execute(sql)
+    while True:
+        for message in getattr(cursor, "messages", None) or []:
+            if on_message:
+                on_message(message[-1] if isinstance(message, tuple) else message)
+        if not cursor.nextset():
+            break
+
+# 10a Get Session ID Function
+def get_session_id(cursor):
+    """
+    Returns the @@SPID of the cursor's connection, used to find its requests in sys.dm_exec_requests.
+    """
+    cursor.execute("SELECT @@SPID")
+    return cursor.fetchone()[0]
+
+# 10b Verify Backup Function
+def verify_backup(cursor, backup_file_path, checksum=False):
+    """
+    Runs RESTORE VERIFYONLY on a backup file (or list of stripe files).
+    `checksum` adds WITH CHECKSUM, which also fails for backups taken without checksums.
+    Returns True if SQL Server considers the backup set readable, False otherwise.
+    """
+    try:
+        execute_with_messages(cursor, f"RESTORE VERIFYONLY FROM {disk_clause(backup_file_path)}"
+                                      + (" WITH CHECKSUM;" if checksum else ";"))
+        logging.info(f"RESTORE VERIFYONLY succeeded: {backup_file_path}")
+        return True
+    except Exception as e:
+        logging.error(f"RESTORE VERIFYONLY failed for {backup_file_path}: {e}")
+        return False
+
+# 10c Drain Connections Function
+def drain_connections(cursor, database_name, mode="SINGLE_USER", timeout=60):
+    """
+    Closes every other session in the database and waits until none remain.
+
+    - One `ALTER DATABASE ... SET SINGLE_USER|RESTRICTED_USER WITH ROLLBACK IMMEDIATE` rolls back and
+      disconnects all other sessions (RESTRICTED_USER keeps db_owner/sysadmin sessions until they leave).
+    - `sys.dm_exec_sessions` is then polled every 50 ms, backing off to 1 s, until no session other than
+      this one is in the database; the cursor should be connected to `master`.
+    - Raises RuntimeError when sessions remain after `timeout` seconds. Returns the seconds spent draining.
+    """
+    mode = mode.upper()
+    if mode not in DRAIN_MODES:
+        raise ValueError(f"Drain mode must be one of {DRAIN_MODES}, got {mode}")
+
+    started = time.monotonic()
+    logging.info(f"Draining connections to {database_name} ({mode} WITH ROLLBACK IMMEDIATE)...")
+    cursor.execute(f"ALTER DATABASE {quote_identifier(database_name)} SET {mode} WITH ROLLBACK IMMEDIATE;")
+
+    delay = DRAIN_INITIAL_INTERVAL
+    while True:
+        cursor.execute(
+            "SELECT d.user_access_desc, (SELECT COUNT(*) FROM sys.dm_exec_sessions s "
+            "WHERE s.database_id = d.database_id AND s.session_id <> @@SPID) "
+            f"FROM sys.databases d WHERE d.name = {quote_literal(database_name)};"
+        )
+        row = cursor.fetchone()
+        user_access, sessions = (row[0], row[1]) if row else (None, 0)
+        elapsed = time.monotonic() - started
+
+        if user_access == mode and not sessions:
+            logging.info(f"Drained connections to {database_name} in {elapsed:.2f}s.")
+            return elapsed
+
+        remaining = timeout - elapsed
+        if remaining <= 0:
+            raise RuntimeError(f"{sessions} session(s) still connected to {database_name} ({user_access}) "
+                               f"after {timeout}s of draining.")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, DRAIN_MAX_INTERVAL)
+
+# 10d Read Last Restore Function
+def read_last_restore(cursor, database_name):
+    """
+    Returns the newest `msdb.dbo.restorehistory` entry of `database_name` with its backup set's LSNs, as
+    `{"restore_date", "backup_type", "first_lsn", "last_lsn", "checkpoint_lsn"}`, or None if it was never restored.
+    """
+    cursor.execute(f"""
+        SELECT TOP (1) rh.restore_date, rh.restore_type, bs.first_lsn, bs.last_lsn, bs.checkpoint_lsn
+        FROM msdb.dbo.restorehistory rh
+            JOIN msdb.dbo.backupset bs ON bs.backup_set_id = rh.backup_set_id
+        WHERE rh.destination_database_name = {quote_literal(database_name)}
+        ORDER BY rh.restore_history_id DESC;
+    """)
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return {
+        "restore_date": row[0],
+        "backup_type": RESTORE_HISTORY_TYPES.get(row[1], row[1]),
+        "first_lsn": None if row[2] is None else int(row[2]),
+        "last_lsn": None if row[3] is None else int(row[3]),
+        "checkpoint_lsn": None if row[4] is None else int(row[4]),
+    }
@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import zlib
+import hashlib
+import logging
+import argparse
+
+"""
+Delta Sync for ETO Backup & Restore Application
+
+A nightly archive shares large byte ranges with archives already on disk (the previous night's FULL, the
+same key downloaded before). With a chunk manifest next to the archive in S3, `download_file(..., delta=True)`
+copies the chunks it already has locally and fetches only the changed ones with ranged GETs.
+
+- Chunks are content-defined: a cut is made after an anchor byte whose trailing 48-byte window hashes
+  (CRC-32) to zero under a mask, so an insertion early in the file only changes the chunks around it instead
+  of shifting every fixed-size block after it. Candidates are found with `bytes.find` and only those windows
+  are hashed, which keeps chunking at disk speed instead of a per-byte Python loop.
+- The manifest is generated where the archive is created and uploaded as `<key>.chunks.json`:
+      {"version": 1, "algorithm": "anchor-crc32-sha256", "size": N, "min_size": ..., "avg_size": ..., "max_size": ...,
+       "chunks": [[offset, length, "<sha256>"], ...]}
+- After a delta (or manifest-backed) download the chunk list is kept in the archive's
+  `<destination>.manifest.json`, which is the local index the next download reuses chunks from.
+
+Functions:
+1. chunk_file(path, min_size, avg_size, max_size) - Splits a file into content-defined chunks.
+2. build_chunk_manifest(path, ...) - Returns the chunk manifest of a local archive.
+3. write_chunk_manifest(path, manifest_path=None, ...) - Writes `<archive>.chunks.json` to upload next to the archive.
+4. load_remote_manifest(s3_client, bucket_name, s3_key) - Fetches `<key>.chunks.json` from S3, or None.
+5. build_chunk_map(source_paths) - Indexes the chunks of local archives by hash, from their download manifests.
+6. plan_delta(manifest, chunk_map, max_range_bytes) - Splits a new archive into local copies and byte ranges to fetch.
+"""
+
+# Chunking Defaults (recorded in every manifest; the downloader only follows the manifest)
+CHUNK_MIN_SIZE = 256 * 1024
+CHUNK_AVG_SIZE = 1024 * 1024
+CHUNK_MAX_SIZE = 4 * 1024 * 1024
+CHUNK_MANIFEST_SUFFIX = ".chunks.json"
+CHUNK_READ_SIZE = 16 * 1024 * 1024
+MANIFEST_VERSION = 1
+MAX_DELTA_SOURCES = 8
+
+# Cut points: an anchor byte whose trailing window (anchor included) has a CRC-32 with all mask bits clear
+ANCHOR_BYTE = b"\x8f"
+WINDOW_SIZE = 48
+
+def _cut_point(buffer, start, end, min_size, mask):
+    """
+    Returns the end offset of the chunk starting at `start`: just after the first anchor byte past `min_size`
+    bytes whose trailing window hashes to zero under `mask`, or `end` (max size / end of data).
+    """
+    if end - start <= min_size:
+        return end
+    find = buffer.find
+    position = find(ANCHOR_BYTE, start + min_size - 1, end)
+    while position != -1:
+        cut = position + 1
+        # min_size >= WINDOW_SIZE, so the window never reaches back into the previous chunk
+        if not zlib.crc32(buffer[cut - WINDOW_SIZE:cut]) & mask:
+            return cut
+        position = find(ANCHOR_BYTE, cut, end)
+    return end
+
+# 1. Chunk File Function
+def chunk_file(path, min_size=CHUNK_MIN_SIZE, avg_size=CHUNK_AVG_SIZE, max_size=CHUNK_MAX_SIZE):
+    """
+    (1) Splits a file into content-defined chunks and yields `(offset, length, sha256 hex)` in file order.
+    Cuts are expected about `avg_size` bytes past `min_size` on high-entropy data (7z archives), and are
+    always within [min_size, max_size].
+    """
+    if min_size < WINDOW_SIZE or max_size < min_size:
+        raise ValueError(f"Invalid chunk sizes: min {min_size}, max {max_size} (min must be >= {WINDOW_SIZE})")
+    # One byte in 256 is an anchor, so keep one anchor in avg_size / 256
+    mask = (1 << max(0, (avg_size // 256).bit_length() - 1)) - 1
+    offset = 0
+    buffer = b""
+    start = 0
+    eof = False
+    with open(path, "rb") as source:
+        while True:
+            if not eof and len(buffer) - start < max_size:
+                block = source.read(CHUNK_READ_SIZE)
+                eof = not block
+                buffer = buffer[start:] + block
+                start = 0
+                continue
+            if start >= len(buffer):
+                return
+            end = _cut_point(buffer, start, min(len(buffer), start + max_size), min_size, mask)
+            yield offset, end - start, hashlib.sha256(memoryview(buffer)[start:end]).hexdigest()
+            offset += end - start
+            start = end
+
+# 2. Build Chunk Manifest Function
+def build_chunk_manifest(path, min_size=CHUNK_MIN_SIZE, avg_size=CHUNK_AVG_SIZE, max_size=CHUNK_MAX_SIZE):
+    """
+    (2) Returns the chunk manifest of a local archive.
+    """
+    chunks = [list(chunk) for chunk in chunk_file(path, min_size, avg_size, max_size)]
+    return {
+        "version": MANIFEST_VERSION,
+        "algorithm": "anchor-crc32-sha256",
+        "size": os.path.getsize(path),
+        "min_size": min_size,
+        "avg_size": avg_size,
+        "max_size": max_size,
+        "chunks": chunks,
+    }
+
+# 3. Write Chunk Manifest Function
+def write_chunk_manifest(path, manifest_path=None, **chunking):
+    """
+    (3) Writes the chunk manifest of `path` to `<path>.chunks.json` (or `manifest_path`) and returns it.
+    Upload it next to the archive as `<key>.chunks.json`.
+    """
+    manifest = build_chunk_manifest(path, **chunking)
+    manifest_path = manifest_path or path + CHUNK_MANIFEST_SUFFIX
+    with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file)
+    logging.info(f"Wrote chunk manifest {manifest_path} ({len(manifest['chunks'])} chunks)")
+    return manifest
+
+# 4. Load Remote Manifest Function
+def load_remote_manifest(s3_client, bucket_name, s3_key):
+    """
+    (4) Fetches and validates `<key>.chunks.json` from S3. Returns None when there is none (or it is unusable),
+    in which case the caller downloads the whole archive.
+    """
+    manifest_key = s3_key + CHUNK_MANIFEST_SUFFIX
+    try:
+        body = s3_client.get_object(Bucket=bucket_name, Key=manifest_key)["Body"].read()
+    except Exception as e:
+        logging.info(f"No chunk manifest for {s3_key} ({type(e).__name__}); downloading the whole archive.")
+        return None
+    try:
+        manifest = json.loads(body)
+        chunks = manifest["chunks"]
+        expected = 0
+        for offset, length, _ in chunks:
+            if offset != expected or length <= 0:
+                raise ValueError(f"chunk at {offset} does not follow the previous chunk")
+            expected += length
+        if manifest.get("version") != MANIFEST_VERSION or expected != manifest["size"]:
+            raise ValueError("unsupported version or chunks do not cover the archive")
+    except (ValueError, KeyError, TypeError) as e:
+        logging.warning(f"Ignoring invalid chunk manifest {manifest_key}: {e}")
+        return None
+    return manifest
+
+# 5. Build Chunk Map Function
+def build_chunk_map(source_paths):
+    """
+    (5) Indexes the chunks of local archives by SHA-256: `{sha256: (path, offset, length)}`.
+    `source_paths` are archives whose `<path>.manifest.json` is complete, matches the file size and lists
+    `chunks`; others are ignored. Earlier sources win for chunks found in several files.
+    """
+    chunk_map = {}
+    for path in source_paths:
+        try:
+            with open(path + ".manifest.json", "r", encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+            if not manifest.get("complete") or os.path.getsize(path) != manifest.get("size"):
+                continue
+        except (OSError, ValueError):
+            continue
+        for offset, length, digest in manifest.get("chunks") or []:
+            chunk_map.setdefault(digest, (path, offset, length))
+    return chunk_map
+
+def find_delta_sources(destination_path, limit=MAX_DELTA_SOURCES):
+    """
+    Returns the archives next to `destination_path` that carry a chunk index, newest first
+    (the destination itself first, when an older version of the same key is on disk).
+    """
+    directory = os.path.dirname(destination_path) or "."
+    candidates = []
+    for name in os.listdir(directory):
+        if not name.endswith(".manifest.json"):
+            continue
+        path = os.path.join(directory, name[:-len(".manifest.json")])
+        if os.path.exists(path):
+            candidates.append((path != destination_path, -os.path.getmtime(path), path))
+    return [path for _, _, path in sorted(candidates)[:limit]]
+
+# 6. Plan Delta Function
+def plan_delta(manifest, chunk_map, max_range_bytes):
+    """
+    (6) Splits the archive described by `manifest` into:
+
+    - copies: `(offset, length, sha256, source_path, source_offset)` for chunks found in `chunk_map`;
+    - ranges: inclusive `(start, end)` byte ranges covering the other chunks, adjacent chunks merged up to
+      `max_range_bytes` so they are fetched with few ranged GETs;
+    - missing: `(offset, length, sha256)` of the chunks inside those ranges, to verify after download.
+    """
+    copies, ranges, missing = [], [], []
+    for offset, length, digest in manifest["chunks"]:
+        source = chunk_map.get(digest)
+        if source and source[2] == length:
+            copies.append((offset, length, digest, source[0], source[1]))
+            continue
+        missing.append((offset, length, digest))
+        if ranges and ranges[-1][1] + 1 == offset and offset + length - ranges[-1][0] <= max_range_bytes:
+            ranges[-1] = (ranges[-1][0], offset + length - 1)
+        else:
+            ranges.append((offset, offset + length - 1))
+    return copies, ranges, missing
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the chunk manifest that enables delta downloads of an archive.")
+    parser.add_argument("archives", nargs="+", help="Archives (.7z) to index; writes <archive>.chunks.json next to each.")
+    parser.add_argument("--bucket", default=None, help="Also upload each manifest to this S3 bucket...")
+    parser.add_argument("--prefix", default="SQLBackups/", help="...as <prefix><archive name>.chunks.json.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format="%(message)s")
+
+    for archive in args.archives:
+        written = write_chunk_manifest(archive)
+        if args.bucket:
+            from utils.catalog_utils import create_s3_client
+            manifest_key = args.prefix + os.path.basename(archive) + CHUNK_MANIFEST_SUFFIX
+            create_s3_client().put_object(Bucket=args.bucket, Key=manifest_key,
+                                          Body=json.dumps(written).encode("utf-8"))
+            logging.info(f"Uploaded s3://{args.bucket}/{manifest_key}")
@@ -1,31 +1,102 @@
 import shutil
 import logging
+import time
 import os
 
-# Ensure logging is set up
-log_file_path = "E:\\Eto_Backup_Restore\\Logs\\restore_process.log"
-os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
-logging.basicConfig(
-    filename=log_file_path,
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_POLL_SECONDS = 0.2
 
 def check_disk_space(directory, min_free_space_gb):
     """
     Checks if there is enough free space in the given directory.
     Raises an error if free space is below `min_free_space_gb` GB.
+    The directory does not have to exist yet; its nearest existing parent is checked.
     """
-    total, used, free = shutil.disk_usage(directory)
-    free_gb = free // (2**30)  # Convert bytes to GB
+    free_gb = free_bytes(directory) / (2**30)  # Convert bytes to GB
 
     if free_gb < min_free_space_gb:
-        logging.error(f"? Not enough disk space! Only {free_gb}GB free, but {min_free_space_gb}GB required.")
-        raise RuntimeError(f"Not enough disk space: {free_gb}GB available, {min_free_space_gb}GB required.")
+        logging.error(f"Not enough disk space in {directory}! Only {free_gb:.1f}GB free, but {min_free_space_gb:.1f}GB required.")
+        raise RuntimeError(f"Not enough disk space in {directory}: {free_gb:.1f}GB available, {min_free_space_gb:.1f}GB required.")
     
-    logging.info(f"Sufficient disk space: {free_gb}GB free.")
-    print(f"Sufficient disk space: {free_gb}GB free.")  # Ensures immediate feedback
+    logging.info(f"Sufficient disk space in {directory}: {free_gb:.1f}GB free, {min_free_space_gb:.1f}GB required.")
+
+def free_bytes(directory):
+    """
+    Returns the free bytes on the volume holding `directory` (or its nearest existing parent).
+    """
+    return shutil.disk_usage(existing_parent(directory)).free
+
+def existing_parent(path):
+    """
+    Returns `path` or its nearest existing parent directory.
+    """
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+def volume_of(path):
+    """
+    Returns a key identifying the volume that holds `path` (device id of its nearest existing parent).
+    """
+    return os.stat(existing_parent(path)).st_dev
+
+class FileLock:
+    """
+    Exclusive lock on `path` shared by threads and processes (one open handle per holder).
+    `acquire(blocking=False)` returns False instead of waiting when another holder has it.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def acquire(self, blocking=True):
+        handle = open(self.path, "a+b")
+        while True:
+            try:
+                if fcntl:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                else:
+                    handle.seek(0)
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+                self.handle = handle
+                return True
+            except OSError:
+                if not blocking:
+                    handle.close()
+                    return False
+                # msvcrt.LK_LOCK gives up after 10 seconds; poll instead (flock only fails here on EINTR)
+                time.sleep(LOCK_POLL_SECONDS)
+
+    def release(self):
+        if self.handle is None:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+            else:
+                self.handle.seek(0)
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.handle.close()
+            self.handle = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
 
 # Example Usage
 if __name__ == "__main__":
-    check_disk_space("E:\\", 10)
+    from utils.config_utils import get_settings
+    from utils.logging_utils import setup_logging
+    settings = get_settings()
+    setup_logging(settings.paths.log_file_path)
+    check_disk_space(settings.paths.backup_directory, 10)
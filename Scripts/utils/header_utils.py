@@ -0,0 +1,136 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+from datetime import datetime
+
+from utils.chain_utils import BackupHeader
+from utils.file_utils import FileLock
+
+"""
+Backup Header Cache for ETO Backup & Restore Application
+
+`RESTORE HEADERONLY` makes SQL Server scan the media header of multi-GB `.bak` files. This module keeps the
+parsed headers in a JSON file and reuses them across runs and retries.
+
+Entries are keyed by file path, size and mtime, and indexed by the S3 ETag of the archive the file came from.
+The ETag index lets the restore chain be planned before anything is downloaded: a backup whose ETag was seen
+before (on this host, or on another host sharing the cache file) needs no SQL round-trip and no download
+until it is known to be part of the chain.
+
+`db_utils.read_backup_header(..., header_cache=...)` and `db_utils.validate_backup_lsn(..., header_cache=...)`
+consult the cache before running `RESTORE HEADERONLY` on the caller's cursor.
+
+Functions:
+1. HeaderCache(cache_path) - JSON-backed header cache with path/size/mtime keys and an ETag index.
+2. encode_header(header) / decode_header(data) - Converts a BackupHeader to and from its JSON form.
+"""
+
+# Global Variables
+header_cache_name = "backup_headers.json"
+
+def _paths(path):
+    return [path] if isinstance(path, str) else list(path or [])
+
+def _exists(path):
+    return bool(_paths(path)) and all(os.path.exists(part) for part in _paths(path))
+
+def _file_key(path):
+    keys = []
+    for part in _paths(path):
+        stat = os.stat(part)
+        keys.append(f"{os.path.abspath(part)}|{stat.st_size}|{int(stat.st_mtime)}")
+    return ";".join(keys)
+
+# 1. Header Cache
+class HeaderCache:
+    """
+    (1) JSON-backed cache of BackupHeader records.
+
+    - `get(path=..., etag=...)` returns a cached header by ETag, or by path/size/mtime of an existing file.
+    - `put(header, etag=None)` records a header for its file and ETag; `save()` merges it into the file atomically.
+    """
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.files = {}
+        self.etags = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        if cache_path and os.path.exists(cache_path):
+            self.files, self.etags = _read_cache(cache_path)
+
+    def get(self, path=None, etag=None):
+        with self.lock:
+            if etag and etag in self.etags:
+                return decode_header(self.etags[etag])
+            if path and _exists(path):
+                data = self.files.get(_file_key(path))
+                if data:
+                    return decode_header(data)
+        return None
+
+    def put(self, header, etag=None):
+        data = encode_header(header)
+        with self.lock:
+            if _exists(header.path):
+                self.files[_file_key(header.path)] = data
+            if etag:
+                self.etags[etag] = data
+            self.dirty = True
+
+    def save(self):
+        """
+        Merges this cache into the file and replaces it atomically. Targets and hosts sharing the file take
+        `<cache>.lock` and re-read it first, so no one's entries are lost; each writer uses its own temp file.
+        """
+        with self.lock:
+            if not self.dirty or not self.cache_path:
+                return
+            directory = os.path.dirname(os.path.abspath(self.cache_path))
+            os.makedirs(directory, exist_ok=True)
+            with FileLock(self.cache_path + ".lock"):
+                files, etags = _read_cache(self.cache_path) if os.path.exists(self.cache_path) else ({}, {})
+                files.update(self.files)
+                etags.update(self.etags)
+                handle, temp_path = tempfile.mkstemp(prefix=os.path.basename(self.cache_path) + ".",
+                                                     suffix=".tmp", dir=directory)
+                try:
+                    with os.fdopen(handle, "w", encoding="utf-8") as cache_file:
+                        json.dump({"files": files, "etags": etags}, cache_file)
+                    os.replace(temp_path, self.cache_path)
+                except BaseException:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
+            self.files, self.etags = files, etags
+            self.dirty = False
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            data = json.load(cache_file)
+        return data.get("files", {}), data.get("etags", {})
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable header cache {cache_path}: {e}")
+        return {}, {}
+
+# 2. Encode / Decode Header Functions
+def encode_header(header):
+    """
+    (2) Returns a BackupHeader as a JSON-safe dict (dates as ISO strings).
+    """
+    return {
+        field: value.isoformat() if isinstance(value, datetime) else value
+        for field, value in header._asdict().items()
+    }
+
+def decode_header(data):
+    """
+    (2) Rebuilds a BackupHeader from `encode_header` output.
+    """
+    values = dict(data)
+    for field in ("backup_start", "backup_finish"):
+        if isinstance(values.get(field), str):
+            values[field] = datetime.fromisoformat(values[field])
+    return BackupHeader(**{field: values.get(field) for field in BackupHeader._fields})
@@ -0,0 +1,204 @@
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+from utils.header_utils import encode_header, decode_header
+
+"""
+Restore Run Journal for ETO Backup & Restore Application
+
+A restore that dies halfway leaves the database in RESTORING with part of the chain applied. `sys.databases`
+alone cannot tell "FULL done, DIFF pending" from "never started", so every step of the chain is recorded in a
+small JSON journal per target, written atomically and fsync'd after each step:
+
+    downloaded -> extracted -> verified -> restoring -> restored (or skipped) ... -> complete
+
+On the next run the journal is cross-checked against SQL Server before anything is trusted:
+- the database must still be RESTORING, and
+- the newest `msdb.dbo.restorehistory` entry for it must be the last file the journal restored (same backup type
+  and LastLSN), or the file it was restoring when the process died (the restore finished, the journal write did not).
+Only then does the run continue with the next file of the chain; otherwise the journal is reset and the restore
+starts from the FULL backup as before. Files already extracted (and verified) for the same ETag are reused
+without downloading or extracting them again.
+
+Journal layout (`restore_journal_<database>.json` next to the backups):
+
+    {"version": 1, "database": "...", "status": "running" | "complete", "started": "...", "stop_at": null,
+     "consumed": ["<key>", ...],
+     "files": {"<key>": {"etag": "...", "downloaded": "...", "extracted": "...", "paths": [...], "sizes": [...],
+                         "verified": "...", "header": {...}, "restoring": "...", "restored": "..."}}}
+
+Functions:
+1. RestoreJournal(path, database_name) - Fsync'd JSON journal of one target's restore chain.
+2. resume_chain(journal, database_state, last_restore, stop_at=None) - Cross-checks the journal with SQL Server.
+3. journal_path(directory, database_name) - Returns the journal location of a database.
+"""
+
+JOURNAL_VERSION = 1
+RESTORE_STEPS = ("restoring", "restored", "skipped")
+journal_name = "restore_journal_{database}.json"
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+def _paths(path):
+    return [path] if isinstance(path, str) else list(path or [])
+
+# 1. Restore Journal
+class RestoreJournal:
+    """
+    (1) Fsync'd JSON journal of one target's restore chain; safe to update from prefetch threads.
+
+    - `begin(stop_at)` starts a new run: restore steps are forgotten, fetched files stay reusable.
+    - `mark(key, step, etag=None, header=None, paths=None)` records a step of one file and writes the journal.
+    - `extracted_paths(key, etag)` returns the extracted files of a previous fetch if they are still intact.
+    - `complete()` marks the run finished, so the next run starts from scratch.
+    """
+    def __init__(self, path, database_name):
+        self.path = path
+        self.database_name = database_name
+        self.lock = threading.Lock()
+        self.data = None
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as journal_file:
+                    data = json.load(journal_file)
+                if data.get("version") == JOURNAL_VERSION and data.get("database") == database_name:
+                    self.data = data
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable restore journal {path}: {e}")
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as journal_file:
+            json.dump(self.data, journal_file, indent=1)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+    @property
+    def running(self):
+        return bool(self.data) and self.data.get("status") == "running"
+
+    def begin(self, stop_at=None):
+        with self.lock:
+            files = (self.data or {}).get("files") or {}
+            for record in files.values():
+                for step in RESTORE_STEPS:
+                    record.pop(step, None)
+            self.data = {
+                "version": JOURNAL_VERSION,
+                "database": self.database_name,
+                "status": "running",
+                "started": _now(),
+                "stop_at": stop_at.isoformat() if stop_at else None,
+                "consumed": [],
+                "files": files,
+            }
+            self._save()
+
+    def mark(self, key, step, etag=None, header=None, paths=None):
+        """
+        Records `step` for `key`. `restored` and `skipped` also append the key to the consumed chain.
+        A different `etag` than the one recorded means a new object, so its earlier steps are dropped.
+        """
+        with self.lock:
+            if self.data is None:
+                return
+            record = self.data["files"].setdefault(key, {})
+            if etag and record.get("etag") not in (None, etag):
+                record.clear()
+            if etag:
+                record["etag"] = etag
+            if header is not None:
+                record["header"] = encode_header(header)
+            if paths is not None:
+                record["paths"] = _paths(paths)
+                record["sizes"] = [os.path.getsize(path) for path in _paths(paths)]
+            record[step] = _now()
+            if step in ("restored", "skipped") and key not in self.data["consumed"]:
+                self.data["consumed"].append(key)
+            self._save()
+
+    def record(self, key):
+        with self.lock:
+            return dict(((self.data or {}).get("files") or {}).get(key) or {})
+
+    def extracted_paths(self, key, etag=None, verified=False):
+        """
+        Returns the extracted file(s) of `key` from an earlier fetch when they still exist with the recorded
+        sizes and the archive had the same `etag` (and, with `verified`, passed RESTORE VERIFYONLY); else None.
+        """
+        record = self.record(key)
+        if "extracted" not in record or (etag and record.get("etag") != etag):
+            return None
+        if verified and "verified" not in record:
+            return None
+        paths = record.get("paths") or []
+        if not paths or any(not os.path.exists(path) or os.path.getsize(path) != size
+                            for path, size in zip(paths, record.get("sizes") or [])):
+            return None
+        return paths[0] if len(paths) == 1 else paths
+
+    def consumed(self):
+        with self.lock:
+            return list((self.data or {}).get("consumed") or [])
+
+    def complete(self):
+        with self.lock:
+            if self.data is None:
+                return
+            self.data["status"] = "complete"
+            self.data["finished"] = _now()
+            self._save()
+
+# 2. Resume Chain Function
+def resume_chain(journal, database_state, last_restore, stop_at=None):
+    """
+    (2) Returns `(consumed_keys, chain_headers)` to continue an interrupted restore, or None to start over.
+
+    - `database_state` is the `sys.databases` state and `last_restore` the newest msdb restore of the database
+      (`db_utils.read_last_restore`), with `backup_type` and `last_lsn`.
+    - A file the journal was still restoring counts as restored when msdb shows it as the last restore.
+    """
+    if not journal.running or not journal.data.get("files"):
+        return None
+    journal_stop_at = journal.data.get("stop_at")
+    if journal_stop_at != (stop_at.isoformat() if stop_at else None):
+        logging.info(f"Restore journal of {journal.database_name} was for stop_at={journal_stop_at}; starting over.")
+        return None
+    if database_state != "RESTORING":
+        logging.info(f"{journal.database_name} is {database_state}, not RESTORING; the restore journal is stale.")
+        return None
+    if not last_restore:
+        logging.warning(f"No msdb restore history for {journal.database_name}; not trusting the restore journal.")
+        return None
+
+    def matches(header):
+        return header.backup_type == last_restore["backup_type"] and header.last_lsn == last_restore["last_lsn"]
+
+    consumed = journal.consumed()
+    chain = [decode_header(journal.record(key)["header"])._replace(key=key)
+             for key in consumed if "restored" in journal.record(key)]
+    for key in list(journal.data["files"]):
+        record = journal.record(key)
+        if "restoring" in record and "restored" not in record and matches(decode_header(record["header"])):
+            logging.info(f"{key} finished restoring before the previous run stopped; recording it as restored.")
+            journal.mark(key, "restored")
+            return consumed + [key], chain + [decode_header(record["header"])._replace(key=key)]
+    if chain and matches(chain[-1]):
+        return consumed, chain
+
+    logging.warning(f"msdb shows {last_restore['backup_type']} ending at LSN {last_restore['last_lsn']} as the last "
+                    f"restore of {journal.database_name}, which the restore journal does not end with; starting over.")
+    return None
+
+# 3. Journal Path Function
+def journal_path(directory, database_name):
+    """
+    (3) Returns the journal location for `database_name` in `directory`.
+    """
+    return os.path.join(directory, journal_name.format(database="".join(
+        char if char.isalnum() or char in "-_." else "_" for char in database_name)))
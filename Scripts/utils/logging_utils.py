@@ -38,9 +38,10 @@ def test_logging():
     """
     print("Testing logging system...")
     logging.info("Test log entry: Logging is working correctly.")
-    print(f"? Log entry written to log file.")
+    print(f"Log entry written to log file.")
 
 # Example Usage
 if __name__ == "__main__":
-    setup_logging("E:\\Eto_Backup_Restore\\Logs\\restore_process.log")  # (1)
+    from utils.config_utils import get_settings
+    setup_logging(get_settings().paths.log_file_path)  # (1)
     test_logging()  # (2)
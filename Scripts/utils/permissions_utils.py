@@ -0,0 +1,206 @@
+import re
+import json
+import logging
+from collections import namedtuple
+
+from utils.db_utils import quote_identifier, quote_literal
+
+"""
+Post-Restore Permissions for ETO Backup & Restore Application
+
+A restored database carries the users and grants of the server it was backed up on. This module re-applies
+the principals, role memberships and grants declared in `Config/permissions.json` (the same mapping that
+`restore_master_permissions.sql` and `restore_permissions.sql` spell out by hand):
+
+- One query reads the logins, server roles and server grants of the instance together with the users,
+  role members and grants of the restored database.
+- Only the missing `CREATE LOGIN`, `ALTER SERVER ROLE`, `CREATE USER`, `ALTER ROLE` and `GRANT` statements are
+  sent, as one batch per database. Statements for the database run through `[<db>].sys.sp_executesql`, so the
+  pooled connection stays in `master` and never holds a session in the restored database.
+
+`permissions.json` layout:
+
+    {
+      "logins":     {"<login>": {"server_roles": [...], "grants": [...]}},
+      "principals": {"<user>": {"login": "<login>", "roles": [...], "grants": [...]}},
+      "databases":  {"<database>": {"principals": {...}}}
+    }
+
+`principals` apply to every database listed under `databases`; a database's own `principals` entry replaces
+them for that database. `login` defaults to the user name. Databases not listed are left untouched.
+
+Functions:
+1. load_permissions(path) - Loads and validates the declarative permissions mapping.
+2. read_current_permissions(cursor, database_name) - Reads existing principals, role members and grants in one query.
+3. plan_permission_changes(permissions, database_name, current) - Returns the statements that are missing.
+4. apply_permissions(cursor, database_name, permissions) - Diffs and applies the missing statements in one batch.
+"""
+
+PermissionChange = namedtuple("PermissionChange", ["scope", "kind", "principal", "item", "sql"])
+
+# Permission names are spliced into GRANT statements, so only plain keyword lists are accepted
+PERMISSION_NAME = re.compile(r"^[A-Z]+( [A-Z]+)*$")
+ROLE_NAME = re.compile(r"^[A-Za-z0-9_]+$")
+
+# 1. Load Permissions Function
+def load_permissions(path):
+    """
+    (1) Loads `permissions.json` and normalizes it to
+    `{"logins": {name: {"server_roles", "grants"}}, "databases": {name: {user: {"login", "roles", "grants"}}}}`.
+
+    - Grant lists may be given as `["SELECT, INSERT"]` or `["SELECT", "INSERT"]`.
+    - Unknown permission or role names raise ValueError before anything is sent to SQL Server.
+    """
+    with open(path, "r", encoding="utf-8") as handle:
+        data = json.load(handle)
+
+    logins = {
+        name: {
+            "server_roles": _names(options.get("server_roles"), ROLE_NAME, f"server role of {name}"),
+            "grants": _grants(options.get("grants"), f"server grant to {name}"),
+        }
+        for name, options in (data.get("logins") or {}).items()
+    }
+
+    default_principals = data.get("principals") or {}
+    databases = {}
+    for database_name, options in (data.get("databases") or {}).items():
+        principals = (options or {}).get("principals", default_principals)
+        databases[database_name] = {
+            user: {
+                "login": principal.get("login", user),
+                "roles": _names(principal.get("roles"), ROLE_NAME, f"role of {user} in {database_name}"),
+                "grants": _grants(principal.get("grants"), f"grant to {user} in {database_name}"),
+            }
+            for user, principal in principals.items()
+        }
+
+    return {"logins": logins, "databases": databases}
+
+def _names(values, pattern, what):
+    names = []
+    for value in values or []:
+        value = value.strip()
+        if not pattern.match(value):
+            raise ValueError(f"Invalid {what} in permissions file: {value!r}")
+        names.append(value)
+    return names
+
+def _grants(values, what):
+    permissions = []
+    for value in values or []:
+        permissions += [part.strip().upper() for part in value.split(",") if part.strip()]
+    return _names(permissions, PERMISSION_NAME, what)
+
+# 2. Read Current Permissions Function
+def read_current_permissions(cursor, database_name):
+    """
+    (2) Reads the instance's logins, server role members and server grants, and the database's users,
+    role members and database-level grants, in a single round-trip.
+
+    Returns a set of `(kind, principal, item)` tuples, e.g. `("ROLE", "SQLETO", "db_datareader")`.
+    """
+    db = quote_identifier(database_name)
+    cursor.execute(f"""
+        SELECT 'LOGIN', p.name, NULL FROM sys.server_principals p WHERE p.type IN ('S', 'U', 'G')
+        UNION ALL
+        SELECT 'SERVER ROLE', m.name, r.name FROM sys.server_role_members rm
+            JOIN sys.server_principals r ON r.principal_id = rm.role_principal_id
+            JOIN sys.server_principals m ON m.principal_id = rm.member_principal_id
+        UNION ALL
+        SELECT 'SERVER GRANT', p.name, sp.permission_name FROM sys.server_permissions sp
+            JOIN sys.server_principals p ON p.principal_id = sp.grantee_principal_id
+            WHERE sp.class = 100 AND sp.state IN ('G', 'W')
+        UNION ALL
+        SELECT 'USER', p.name, NULL FROM {db}.sys.database_principals p WHERE p.type IN ('S', 'U', 'G')
+        UNION ALL
+        SELECT 'ROLE', m.name, r.name FROM {db}.sys.database_role_members rm
+            JOIN {db}.sys.database_principals r ON r.principal_id = rm.role_principal_id
+            JOIN {db}.sys.database_principals m ON m.principal_id = rm.member_principal_id
+        UNION ALL
+        SELECT 'GRANT', p.name, dp.permission_name FROM {db}.sys.database_permissions dp
+            JOIN {db}.sys.database_principals p ON p.principal_id = dp.grantee_principal_id
+            WHERE dp.class = 0 AND dp.state IN ('G', 'W');
+    """)
+    # Names are compared case-insensitively, as on a default (CI) collation
+    return {(kind, principal.lower(), (item or "").lower()) for kind, principal, item in cursor.fetchall()}
+
+# 3. Plan Permission Changes Function
+def plan_permission_changes(permissions, database_name, current):
+    """
+    (3) Returns the PermissionChanges needed to bring the instance and `database_name` in line with
+    `permissions`, given the `current` set from `read_current_permissions`.
+    """
+    def missing(kind, principal, item=None):
+        key = (kind, principal.lower(), (item or "").lower())
+        if key in current:
+            return False
+        current.add(key)
+        return True
+
+    changes = []
+    for login, options in permissions["logins"].items():
+        name = quote_identifier(login)
+        if missing("LOGIN", login):
+            changes.append(PermissionChange("server", "login", login, None, f"CREATE LOGIN {name} FROM WINDOWS;"))
+        for role in options["server_roles"]:
+            if missing("SERVER ROLE", login, role):
+                changes.append(PermissionChange("server", "server role", login, role,
+                                                f"ALTER SERVER ROLE {quote_identifier(role)} ADD MEMBER {name};"))
+        for permission in options["grants"]:
+            if missing("SERVER GRANT", login, permission):
+                changes.append(PermissionChange("server", "grant", login, permission,
+                                                f"GRANT {permission} TO {name};"))
+
+    for user, options in permissions["databases"].get(database_name, {}).items():
+        name = quote_identifier(user)
+        if missing("USER", user):
+            changes.append(PermissionChange(database_name, "user", user, options["login"],
+                                            f"CREATE USER {name} FOR LOGIN {quote_identifier(options['login'])};"))
+        for role in options["roles"]:
+            if missing("ROLE", user, role):
+                changes.append(PermissionChange(database_name, "role", user, role,
+                                                f"ALTER ROLE {quote_identifier(role)} ADD MEMBER {name};"))
+        for permission in options["grants"]:
+            if missing("GRANT", user, permission):
+                changes.append(PermissionChange(database_name, "grant", user, permission,
+                                                f"GRANT {permission} TO {name};"))
+    return changes
+
+# 4. Apply Permissions Function
+def apply_permissions(cursor, database_name, permissions):
+    """
+    (4) Brings the instance and `database_name` in line with `permissions` and returns the applied changes.
+
+    - Two round-trips in total: the diff query and, if anything is missing, one batch with every statement.
+    - The batch runs with XACT_ABORT, so the first failing statement stops it and raises.
+    """
+    if database_name not in permissions["databases"]:
+        logging.info(f"No permissions configured for {database_name}; skipping.")
+        return []
+
+    changes = plan_permission_changes(permissions, database_name, read_current_permissions(cursor, database_name))
+    if not changes:
+        logging.info(f"Permissions for {database_name} are already up to date.")
+        return []
+
+    db = quote_identifier(database_name)
+    statements = ["SET XACT_ABORT ON;"]
+    for change in changes:
+        if change.scope == "server":
+            statements.append(change.sql)
+        else:
+            statements.append(f"EXEC {db}.sys.sp_executesql {quote_literal(change.sql)};")
+
+    try:
+        cursor.execute("\n".join(statements))
+        while cursor.nextset():
+            pass
+    except Exception as e:
+        logging.error(f"Failed to apply permissions for {database_name}: {e}")
+        raise RuntimeError(f"Failed to apply permissions for {database_name}: {e}") from e
+
+    for change in changes:
+        logging.info(f"Permissions ({change.scope}): {change.sql}")
+    logging.info(f"Applied {len(changes)} permission change(s) for {database_name}.")
+    return changes
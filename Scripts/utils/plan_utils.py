@@ -0,0 +1,151 @@
+import os
+import glob
+import json
+import logging
+
+"""
+Restore Plan Estimates for ETO Backup & Restore Application
+
+Turns a planned restore chain into the numbers an operator needs to fit a restore into a maintenance window:
+bytes to download, bytes to extract, staging disk peak and expected duration. Throughputs come from the JSON
+run reports of previous runs (`restore_report_*.json`, see `timing_utils`), so estimates follow the real
+S3, 7-Zip and SQL Server speed of this host rather than fixed guesses.
+
+- Byte stages (download, extract, stream_extract, restore) use the summed bytes / summed span seconds of the
+  last runs, i.e. the throughput of one file at a time.
+- Fixed stages (drain, recovery, permissions) add their mean seconds per run, when they have been recorded.
+- The timeline follows the restore loop: files are fetched one after another, at most `prefetch_files` ahead of
+  the file being restored, and each restore starts once its file is fetched and the previous restore is done.
+- Byte stages without history are listed under `missing_history` and make the duration unknown (None).
+
+Functions:
+1. load_stage_history(report_directory, runs=10) - Per-stage throughput and seconds from the latest run reports.
+2. estimate_chain(files, staging, history, prefetch_files=0) - Bytes, disk peak and duration for one chain.
+3. combine_estimates(estimates, max_parallel_targets=0) - Totals across targets restored concurrently.
+"""
+
+MB = 1024 * 1024
+REPORT_PATTERN = "restore_report_*.json"
+HISTORY_RUNS = 10
+FIXED_STAGES = ("drain", "recovery", "permissions")
+
+# 1. Load Stage History Function
+def load_stage_history(report_directory, runs=HISTORY_RUNS):
+    """
+    (1) Reads the newest `runs` run reports in `report_directory` and returns
+    `{stage: {"mb_per_second", "seconds_per_run", "runs"}}` for the stages they recorded.
+    Unreadable reports are skipped; an empty dict means there is no history yet.
+    """
+    paths = sorted(glob.glob(os.path.join(report_directory, REPORT_PATTERN)), reverse=True)[:runs]
+    totals = {}
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as report_file:
+                stages = json.load(report_file).get("stages") or {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable run report {path}: {e}")
+            continue
+        for name, stage in stages.items():
+            total = totals.setdefault(name, {"bytes": 0, "seconds": 0.0, "runs": 0})
+            total["bytes"] += stage.get("bytes") or 0
+            total["seconds"] += stage.get("seconds") or 0
+            total["runs"] += 1
+
+    history = {}
+    for name, total in totals.items():
+        history[name] = {
+            "mb_per_second": (round(total["bytes"] / MB / total["seconds"], 1)
+                              if total["bytes"] and total["seconds"] else None),
+            "seconds_per_run": round(total["seconds"] / total["runs"], 3),
+            "runs": total["runs"],
+        }
+    logging.info(f"Loaded stage history from {len(paths)} run report(s) in {report_directory}")
+    return history
+
+def _seconds(byte_count, stage, history, missing):
+    if not byte_count:
+        return 0.0
+    rate = (history.get(stage) or {}).get("mb_per_second")
+    if not rate:
+        missing.add(stage)
+        return None
+    return byte_count / MB / rate
+
+def _round(value):
+    return None if value is None else round(value, 1)
+
+# 2. Estimate Chain Function
+def estimate_chain(files, staging, history, prefetch_files=0):
+    """
+    (2) Estimates one restore chain.
+
+    - `files` are the StagedFile records of the chain in restore order, `staging` its StagingPlan.
+    - Archives already on disk are not downloaded again; everything is extracted (or streamed) and restored.
+    - Returns a dict with per-file estimates, byte totals, the disk peak and `expected_seconds`.
+    """
+    missing = set()
+    streaming = staging.mode == "stream"
+    estimates = []
+    for staged in files:
+        on_disk = os.path.exists(staged.archive_path) and os.path.getsize(staged.archive_path) == staged.archive_bytes
+        download_bytes = 0 if on_disk and not streaming else staged.archive_bytes
+        if streaming:
+            fetch_seconds = _seconds(staged.archive_bytes, "stream_extract", history, missing)
+        else:
+            download_seconds = _seconds(download_bytes, "download", history, missing)
+            extract_seconds = _seconds(staged.extracted_bytes, "extract", history, missing)
+            fetch_seconds = (None if download_seconds is None or extract_seconds is None
+                             else download_seconds + extract_seconds)
+        estimates.append({
+            "key": staged.key,
+            "download_bytes": download_bytes,
+            "extract_bytes": staged.extracted_bytes,
+            "fetch_seconds": _round(fetch_seconds),
+            "restore_seconds": _round(_seconds(staged.extracted_bytes, "restore", history, missing)),
+        })
+
+    fixed_seconds = sum(history[stage]["seconds_per_run"] for stage in FIXED_STAGES if stage in history)
+
+    expected_seconds = None
+    if not missing:
+        # Fetches run back to back, each at most `prefetch_files` files ahead of the restore loop
+        fetch_free = 0.0
+        restore_ends = []
+        for index, estimate in enumerate(estimates):
+            gate = restore_ends[index - prefetch_files - 1] if index > prefetch_files else 0.0
+            fetched = max(fetch_free, gate) + estimate["fetch_seconds"]
+            fetch_free = fetched
+            started = max(fetched, restore_ends[-1] if restore_ends else 0.0)
+            restore_ends.append(started + estimate["restore_seconds"])
+        expected_seconds = round((restore_ends[-1] if restore_ends else 0.0) + fixed_seconds, 1)
+
+    return {
+        "files": estimates,
+        "download_bytes": sum(estimate["download_bytes"] for estimate in estimates),
+        "extract_bytes": sum(estimate["extract_bytes"] for estimate in estimates),
+        "staging_mode": staging.mode,
+        "keep_archives": staging.keep_archives,
+        "disk_peak_bytes": staging.peak_bytes,
+        "disk_free_bytes": staging.free_bytes,
+        "expected_seconds": expected_seconds,
+        "missing_history": sorted(missing),
+    }
+
+# 3. Combine Estimates Function
+def combine_estimates(estimates, max_parallel_targets=0):
+    """
+    (3) Totals the per-target estimates. Targets run `max_parallel_targets` at a time (0 = all at once), so the
+    expected duration is the longest target or the summed time spread over the slots, whichever is larger.
+    Bandwidth shared between concurrent targets is not modelled.
+    """
+    seconds = [estimate["expected_seconds"] for estimate in estimates]
+    slots = max_parallel_targets or len(estimates) or 1
+    expected_seconds = None
+    if estimates and None not in seconds:
+        expected_seconds = round(max(max(seconds), sum(seconds) / slots), 1)
+    return {
+        "download_bytes": sum(estimate["download_bytes"] for estimate in estimates),
+        "extract_bytes": sum(estimate["extract_bytes"] for estimate in estimates),
+        "disk_peak_bytes": sum(estimate["disk_peak_bytes"] for estimate in estimates),
+        "expected_seconds": expected_seconds,
+    }
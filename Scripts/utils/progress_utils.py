@@ -0,0 +1,136 @@
+import re
+import time
+import logging
+import threading
+from collections import namedtuple
+
+"""
+Restore Progress Monitoring for ETO Backup & Restore Application
+
+Watches a running RESTORE from a second connection and emits progress events with percent complete,
+throughput and ETA to the log and to an optional callback.
+
+Two sources feed the events:
+- `sys.dm_exec_requests` (percent_complete, estimated_completion_time) polled on the monitor connection,
+  starting with short intervals and backing off as the restore goes on.
+- `WITH STATS` info messages captured from the restoring cursor (`on_message`).
+
+Functions:
+1. RestoreMonitor(connect, dsn, session_id, database_name, ...) - Background monitor used as a context manager.
+2. parse_stats_message(message) - Extracts the percentage from a "NN percent processed." message.
+"""
+
+ProgressEvent = namedtuple("ProgressEvent", [
+    "database_name", "percent", "elapsed_seconds", "eta_seconds", "mb_per_second", "source",
+])
+
+STATS_PATTERN = re.compile(r"(\d+)\s+percent processed", re.IGNORECASE)
+MB = 1024 * 1024
+
+# 1. Restore Monitor
+class RestoreMonitor:
+    """
+    (1) Monitors one RESTORE session from a separate connection.
+
+    - `connect(dsn)` opens the monitor connection; `session_id` is the @@SPID of the restoring connection.
+    - `total_bytes` (backup size) is used to derive throughput in MB/s.
+    - Polling starts at `min_interval` seconds and grows by `backoff` up to `max_interval`.
+    - `on_message` receives STATS messages from the restoring cursor.
+    - `stop()` (or leaving the `with` block) wakes the monitor immediately instead of waiting out the interval.
+    """
+    def __init__(self, connect, dsn, session_id, database_name, total_bytes=0, callback=None,
+                 min_interval=2, max_interval=60, backoff=1.5):
+        self.connect = connect
+        self.dsn = dsn
+        self.session_id = session_id
+        self.database_name = database_name
+        self.total_bytes = total_bytes
+        self.callback = callback
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.started = time.monotonic()
+        self.last_percent = 0.0
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self.started = time.monotonic()
+        self.thread = threading.Thread(target=self._run, name=f"monitor-{self.database_name}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout=10)
+
+    def on_message(self, message):
+        percent = parse_stats_message(message)
+        if percent is not None:
+            self._emit(percent, None, "stats")
+
+    def _emit(self, percent, eta_seconds, source):
+        with self.lock:
+            if percent < self.last_percent:
+                return
+            self.last_percent = percent
+        elapsed = time.monotonic() - self.started
+        if eta_seconds is None and percent > 0:
+            eta_seconds = elapsed * (100 - percent) / percent
+        mb_per_second = self.total_bytes * percent / 100 / MB / elapsed if self.total_bytes and elapsed > 0 else None
+        event = ProgressEvent(self.database_name, round(percent, 1), round(elapsed, 1),
+                              None if eta_seconds is None else round(eta_seconds, 1),
+                              None if mb_per_second is None else round(mb_per_second, 1), source)
+
+        logging.info(f"RESTORE {self.database_name}: {event.percent:.1f}% after {event.elapsed_seconds:.0f}s"
+                     + (f", {event.mb_per_second:.1f} MB/s" if event.mb_per_second is not None else "")
+                     + (f", ETA {event.eta_seconds:.0f}s" if event.eta_seconds is not None else ""))
+        if self.callback:
+            try:
+                self.callback(event)
+            except Exception as e:
+                logging.warning(f"Progress callback failed: {e}")
+
+    def _run(self):
+        try:
+            conn = self.connect(self.dsn)
+            cursor = conn.cursor()
+        except Exception as e:
+            logging.warning(f"Restore monitor could not connect, relying on STATS messages only: {e}")
+            return
+
+        interval = self.min_interval
+        try:
+            while not self.stopped.wait(interval):
+                cursor.execute(
+                    "SELECT percent_complete, estimated_completion_time FROM sys.dm_exec_requests "
+                    "WHERE session_id = ? AND command LIKE 'RESTORE%'",
+                    self.session_id,
+                )
+                row = cursor.fetchone()
+                if row and row[0] is not None:
+                    self._emit(float(row[0]), (row[1] or 0) / 1000 or None, "dm_exec_requests")
+                interval = min(self.max_interval, interval * self.backoff)
+        except Exception as e:
+            logging.warning(f"Restore monitor stopped: {e}")
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+# 2. Parse STATS Message Function
+def parse_stats_message(message):
+    """
+    (2) Returns the percentage from a `WITH STATS` info message, or None for other messages.
+    """
+    match = STATS_PATTERN.search(message or "")
+    return float(match.group(1)) if match else None
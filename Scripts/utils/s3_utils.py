@@ -1,41 +1,54 @@
 import os
+import json
+import hashlib
 import logging
 import subprocess
-import boto3
-import shutil
-import smtplib
 import time
-import pyodbc
-from email.message import EmailMessage
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.config_utils import get_settings
+from utils.catalog_utils import BackupCatalog, load_catalog, create_s3_client
+from utils.delta_utils import load_remote_manifest, build_chunk_map, find_delta_sources, plan_delta
+from utils.staging_utils import apply_retention
+from utils.scheduler_utils import StageCancelled
+from utils.timing_utils import span
 
 """
 S3 Backup Management for ETO Backup & Restore Application
 
 Functions:
 1. send_email_alert(subject, body) - Sends email notifications for missing backups.
-2. download_file(s3_key, destination_path) - Downloads a backup from S3 and applies a safe overwrite.
+2. download_file(s3_key, destination_path, ...) - Downloads a backup from S3 with parallel ranged GETs and applies a safe overwrite.
 3. safe_overwrite_backup(directory, temp_backup) - Ensures downloaded backups do not overwrite until verified.
-4. get_latest_s3_keys(bucket_name, retries=3) - Retrieves the latest FULL and most recent DIFF backup.
-5. extract_file(file_path, expected_type="FULL") - Extracts a .7z archive to retrieve `.bak` files.
-6. clear_old_backups(directory) - Deletes old backups **only after restore is confirmed**.
+4. get_latest_s3_keys(bucket_name, retries=3, ...) - Retrieves the latest FULL and the newest DIFF taken after it.
+5. extract_file(file_path, expected_type="FULL", threads=None) - Lists a .7z archive and extracts only the matching backup files.
+6. clear_old_backups(directory, keep=(), ...) - Deletes old backups **only after restore is confirmed** (age, then LRU).
 7. verify_functions_exist() - Ensures all required functions exist before execution.
 8. main() - Executes test operations when the script is run directly.
+
+Download Helpers:
+- plan_part_ranges(size, part_size, parts=None) - Splits an object size into inclusive byte ranges.
+- plan_checksum(s3_client, bucket_name, s3_key, etag, size) - Works out how a download can be checked against its ETag.
+- multipart_etag(part_digests) - Rebuilds an S3 multipart ETag from the MD5 digests of its parts.
+- delta_download(s3_client, bucket_name, s3_key, destination_path, ...) - Rebuilds an archive from local chunks plus ranged GETs.
+- discard_download(destination_path) - Deletes a download, its `.temp` file and its manifest so it is fetched again.
+- BandwidthLimiter(max_mbps) - Token bucket shared by download workers to cap total throughput.
+- list_archive_contents(file_path, password=None, seven_zip=None) - Lists archive members (name, size, method, CRC) without decompressing.
+- select_backup_members(members, expected_type) - Filters archive members down to the backup files of one type.
+- load_download_manifest(destination_path) / save_download_manifest(destination_path, manifest)
+  - Read and atomically write the `<destination>.manifest.json` checkpoint sidecar.
 """
 
-# Global Variables
-seven_zip_path = "E:\\7z.exe"
-zip_password = os.getenv("ZIP_PASSWORD")
-backup_directory = "E:\\Eto_Backup_Restore\\Backups\\ETO"
-log_file_path = "E:\\Eto_Backup_Restore\\Logs\\restore_process.log"
-
-# Initialize Logging
-logging.basicConfig(
-    filename=log_file_path,
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
-logging.info("? Logging initialized successfully.")
+# Download Tuning (defaults, overridden by [Download] in config.ini)
+download_part_size_mb = 64
+download_max_workers = 8
+download_max_bandwidth_mbps = 0  # 0 = unlimited
+download_chunk_size = 1024 * 1024
+download_verify_checksum = True
+download_checkpoint_parts = 32  # Save the resume checkpoint every N parts...
+download_checkpoint_seconds = 5  # ...or every N seconds, and always when the download stops
+MB = 1024 * 1024
+BACKUP_EXTENSIONS = (".bak", ".trn")
 
 # Email Notification Settings
 SMTP_SERVER = "smtp.yourcompany.com"
@@ -50,6 +63,9 @@ def send_email_alert(subject, body):
     """
     (1) Sends an email notification for missing backups.
     """
+    import smtplib
+    from email.message import EmailMessage
+
     msg = EmailMessage()
     msg.set_content(body)
     msg["Subject"] = subject
@@ -61,36 +77,468 @@ def send_email_alert(subject, body):
             server.starttls()
             server.login(EMAIL_USERNAME, EMAIL_PASSWORD)
             server.send_message(msg)
-        logging.info(f"? Email alert sent: {subject}")
+        logging.info(f"Email alert sent: {subject}")
     except Exception as e:
-        logging.error(f"? Failed to send email alert: {e}")
+        logging.error(f"Failed to send email alert: {e}")
 
 # 2. Download File Function
-def download_file(s3_key, destination_path):
+class ChecksumMismatchError(RuntimeError):
     """
-    (2) Downloads a file from S3 using AWS CLI and verifies it before overwriting.
+    Raised when a downloaded archive does not match its S3 ETag or fails the CRC check on extraction.
     """
-    if os.path.exists(destination_path):
-        logging.info(f"? Backup file already exists: {destination_path}. Skipping download.")
-        return destination_path
 
+def download_file(s3_key, destination_path, bucket_name=None, s3_client=None, part_size_mb=None,
+                  parts=None, max_workers=None, max_bandwidth_mbps=None, verify_checksum=None, checksum_retries=1,
+                  delta=False, cancel_event=None):
+    """
+    (2) Downloads a file from S3 with parallel ranged GETs and verifies it before overwriting.
+
+    - Skips the download only if `<destination>.manifest.json` marks it complete for the current ETag and size.
+    - Preallocates `<destination>.temp` to the object size.
+    - Fetches `parts` byte ranges (or `part_size_mb` sized ranges) on `max_workers` threads.
+    - Each part is written straight to its offset in the `.temp` file and recorded in the manifest, which is
+      saved every `download_checkpoint_parts` parts or `download_checkpoint_seconds` seconds and whenever the
+      download stops, so a rerun only fetches the missing ranges. A changed ETag discards the partial download.
+    - `max_bandwidth_mbps` caps the combined throughput of all workers (0 = unlimited).
+    - With `verify_checksum` the bytes are hashed while they are downloaded and compared with the ETag:
+      multipart ETags are rebuilt from per-part MD5s (parts are aligned to the upload part size),
+      single-part ETags from an MD5 fed in file order as contiguous parts complete.
+      A mismatch discards the download and fetches it again up to `checksum_retries` times.
+    - With `delta` and a `<key>.chunks.json` manifest in S3, chunks already present in local archives are
+      copied and only the rest is fetched (`delta_download`); any problem falls back to the full download.
+    - `cancel_event` (threading.Event) stops every part at its next chunk; the partial download is deleted
+      and StageCancelled raised.
+    - Hands the finished `.temp` file to `safe_overwrite_backup`.
+    """
+    bucket_name = bucket_name or get_settings().paths.s3_bucket_name
+    s3_client = s3_client or create_s3_client()
+    part_size = int((part_size_mb or download_part_size_mb) * MB)
+    max_workers = max_workers or download_max_workers
+    if max_bandwidth_mbps is None:
+        max_bandwidth_mbps = download_max_bandwidth_mbps
+    if verify_checksum is None:
+        verify_checksum = download_verify_checksum
+    limiter = BandwidthLimiter(max_bandwidth_mbps) if max_bandwidth_mbps else None
     temp_path = destination_path + ".temp"
-    command = f'aws s3 cp s3://ssg-etobphc/{s3_key} "{temp_path}"'
 
     try:
-        subprocess.run(command, shell=True, check=True, text=True)
-        if not os.path.exists(temp_path):
-            logging.error(f"? Downloaded file missing: {temp_path}")
-            raise RuntimeError(f"Download failed, file not found: {temp_path}")
-        logging.info(f"? Downloaded {s3_key} to {temp_path}")
+        head = s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+        size = head["ContentLength"]
+        etag = head["ETag"]
+        manifest = load_download_manifest(destination_path)
+
+        if os.path.exists(destination_path):
+            if (manifest and manifest.get("complete") and manifest.get("etag") == etag
+                    and os.path.getsize(destination_path) == size):
+                logging.info(f"Backup file already exists and matches ETag {etag}: {destination_path}. Skipping download.")
+                return destination_path
+            logging.warning(f"Existing file {destination_path} does not match s3://{bucket_name}/{s3_key} (ETag {etag}). Downloading again.")
+            manifest = None
+
+        resumable = (manifest and not manifest.get("complete") and os.path.exists(temp_path)
+                     and manifest.get("etag") == etag and manifest.get("size") == size
+                     and os.path.getsize(temp_path) == size)
+        if manifest and not manifest.get("complete") and not resumable:
+            logging.warning(f"Partial download of {s3_key} cannot be resumed "
+                            f"(manifest ETag {manifest.get('etag')}, current ETag {etag}). Starting over.")
+
+        checksum, upload_part_size = (plan_checksum(s3_client, bucket_name, s3_key, etag, size)
+                                      if verify_checksum else (None, None))
+        if resumable and checksum == "multipart" and manifest["part_size"] != upload_part_size:
+            checksum = None
+            logging.warning(f"Resumed download of {s3_key} is not aligned to its upload parts; ETag check skipped.")
+
+        if delta and not resumable and delta_download(s3_client, bucket_name, s3_key, destination_path, etag, size,
+                                                      checksum, upload_part_size, part_size, max_workers, limiter,
+                                                      cancel_event):
+            return destination_path
+
+        if resumable:
+            part_size = manifest["part_size"]
+            ranges = plan_part_ranges(size, part_size)
+        else:
+            if checksum == "multipart":
+                ranges = plan_part_ranges(size, upload_part_size)
+            else:
+                ranges = plan_part_ranges(size, part_size, parts)
+            part_size = ranges[0][1] + 1 if ranges else part_size
+            manifest = {
+                "bucket": bucket_name,
+                "key": s3_key,
+                "etag": etag,
+                "size": size,
+                "part_size": part_size,
+                "completed": [],
+                "part_md5": {},
+                "complete": False,
+            }
+            with open(temp_path, "wb") as temp_file:
+                temp_file.truncate(size)
+            save_download_manifest(destination_path, manifest)
+
+        done = {tuple(part) for part in manifest["completed"]}
+        pending = [part for part in ranges if part not in done]
+        pending_bytes = sum(end - start + 1 for start, end in pending)
+        if done:
+            logging.info(f"Resuming {s3_key}: {len(done)}/{len(ranges)} parts already downloaded.")
+        logging.info(f"Downloading s3://{bucket_name}/{s3_key} ({pending_bytes / MB:.1f} of {size / MB:.1f} MB) "
+                     f"in {len(pending)} parts with {max_workers} workers...")
+
+        part_md5 = manifest.setdefault("part_md5", {})
+        completed = set(done)
+        object_md5 = hashlib.md5() if checksum == "md5" else None
+        hashed_parts = 0
+        unsaved_parts = 0
+        with span("download", key=s3_key, parts=len(pending), workers=max_workers) as timer:
+            started = time.monotonic()
+            last_saved = started
+            pool = ThreadPoolExecutor(max_workers=max_workers)
+            try:
+                futures = {
+                    pool.submit(_download_part, s3_client, bucket_name, s3_key, etag, temp_path, start, end, limiter,
+                                checksum == "multipart", cancel_event): (start, end)
+                    for start, end in pending
+                }
+                for future in as_completed(futures):
+                    _, digest = future.result()
+                    start, end = futures[future]
+                    completed.add((start, end))
+                    manifest["completed"].append([start, end])
+                    if digest:
+                        part_md5[str(start)] = digest
+                    # Rewriting the whole manifest per part would be quadratic for thousands of small parts
+                    unsaved_parts += 1
+                    if (unsaved_parts >= download_checkpoint_parts
+                            or time.monotonic() - last_saved >= download_checkpoint_seconds):
+                        save_download_manifest(destination_path, manifest)
+                        unsaved_parts = 0
+                        last_saved = time.monotonic()
+                    # Feed the whole-object MD5 in file order while later parts are still downloading
+                    while object_md5 and hashed_parts < len(ranges) and ranges[hashed_parts] in completed:
+                        _hash_file_range(temp_path, *ranges[hashed_parts], object_md5)
+                        hashed_parts += 1
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+                if unsaved_parts:
+                    save_download_manifest(destination_path, manifest)
+            elapsed = max(time.monotonic() - started, 1e-6)
+
+            if os.path.getsize(temp_path) != size:
+                logging.error(f"Downloaded file size mismatch: {temp_path}")
+                raise RuntimeError(f"Download failed, size mismatch for {temp_path}")
+            logging.info(f"Downloaded {s3_key} to {temp_path} "
+                         f"({pending_bytes / MB:.1f} MB in {elapsed:.1f}s, {pending_bytes / MB / elapsed:.1f} MB/s)")
+
+            # Compare the inline checksum with the ETag before the file replaces anything
+            if checksum:
+                if checksum == "multipart":
+                    for start, end in ranges:
+                        if str(start) not in part_md5:
+                            part_md5[str(start)] = _hash_file_range(temp_path, start, end, hashlib.md5()).hexdigest()
+                    actual = multipart_etag([part_md5[str(start)] for start, _ in ranges])
+                else:
+                    for start, end in ranges[hashed_parts:]:
+                        _hash_file_range(temp_path, start, end, object_md5)
+                    actual = object_md5.hexdigest()
+                if actual != etag.strip('"'):
+                    logging.error(f"Checksum mismatch for {s3_key}: downloaded {actual}, S3 ETag {etag}")
+                    discard_download(destination_path)
+                    raise ChecksumMismatchError(f"Checksum mismatch for {s3_key}: downloaded {actual}, S3 ETag {etag}")
+                logging.info(f"Verified {s3_key} against its ETag {etag}")
+                manifest["verified"] = checksum
+            timer.add_bytes(pending_bytes)
 
         # Safely overwrite old backup with new one
-        safe_overwrite_backup(backup_directory, temp_path)
+        safe_overwrite_backup(os.path.dirname(destination_path), temp_path)
+        manifest["complete"] = True
+        save_download_manifest(destination_path, manifest)
         return destination_path
-    except subprocess.CalledProcessError as e:
-        logging.error(f"? Failed to download {s3_key}: {e}")
+    except ChecksumMismatchError:
+        if checksum_retries <= 0:
+            raise
+        logging.warning(f"Downloading {s3_key} again after a checksum mismatch...")
+        return download_file(s3_key, destination_path, bucket_name, s3_client, part_size_mb, parts, max_workers,
+                             max_bandwidth_mbps, verify_checksum, checksum_retries - 1, delta, cancel_event)
+    except StageCancelled:
+        logging.warning(f"Download of {s3_key} was cancelled; removing the partial download.")
+        discard_download(destination_path)
+        raise
+    except Exception as e:
+        logging.error(f"Failed to download {s3_key}: {e}")
         raise RuntimeError(f"Download failed for {s3_key}: {e}")
 
+def _download_part(s3_client, bucket_name, s3_key, etag, temp_path, start, end, limiter, hash_part=False,
+                   cancel_event=None):
+    """
+    Fetches one inclusive byte range and writes it at its offset in the `.temp` file.
+    `IfMatch` makes S3 reject the part if the object changed mid-download; `cancel_event` is checked
+    before every chunk.
+    Returns the bytes written and, with `hash_part`, the MD5 of the part computed as it streams.
+    """
+    with span("download_part", key=s3_key, start=start, end=end) as timer:
+        response = s3_client.get_object(Bucket=bucket_name, Key=s3_key, Range=f"bytes={start}-{end}", IfMatch=etag)
+        body = response["Body"]
+        digest = hashlib.md5() if hash_part else None
+        written = 0
+        with open(temp_path, "r+b") as temp_file:
+            temp_file.seek(start)
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise StageCancelled(f"Download of {s3_key} was cancelled.")
+                chunk = body.read(download_chunk_size)
+                if not chunk:
+                    break
+                if limiter:
+                    limiter.consume(len(chunk))
+                temp_file.write(chunk)
+                if digest:
+                    digest.update(chunk)
+                written += len(chunk)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        timer.add_bytes(written)
+
+    if written != end - start + 1:
+        raise RuntimeError(f"Short read for bytes {start}-{end}: got {written} bytes")
+    return written, digest.hexdigest() if digest else None
+
+def _hash_file_range(path, start, end, hasher):
+    """
+    Feeds bytes `start`-`end` (inclusive) of `path` into `hasher` and returns it.
+    """
+    with open(path, "rb") as source:
+        source.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = source.read(min(download_chunk_size, remaining))
+            if not chunk:
+                break
+            hasher.update(chunk)
+            remaining -= len(chunk)
+    return hasher
+
+def plan_checksum(s3_client, bucket_name, s3_key, etag, size):
+    """
+    Works out how a download of `s3_key` can be checked against its ETag.
+
+    - ("multipart", part_size): the ETag is `<md5 of part md5s>-<N>`; part 1's size comes from `head_object(PartNumber=1)`.
+    - ("md5", None): the ETag is the MD5 of the whole object.
+    - (None, None): the ETag cannot be reproduced (unequal upload parts, SSE-KMS/SSE-C, unknown format).
+    """
+    value = etag.strip('"')
+    if "-" in value:
+        try:
+            part_count = int(value.split("-", 1)[1])
+            head = s3_client.head_object(Bucket=bucket_name, Key=s3_key, PartNumber=1)
+            part_size = head["ContentLength"]
+        except Exception as e:
+            logging.warning(f"Could not read the upload part size of {s3_key}; ETag check skipped: {e}")
+            return None, None
+        if part_size and len(plan_part_ranges(size, part_size)) == part_count:
+            return "multipart", part_size
+        logging.warning(f"{s3_key} was uploaded in unequal parts; ETag check skipped.")
+        return None, None
+    if len(value) == 32 and all(char in "0123456789abcdef" for char in value.lower()):
+        return "md5", None
+    return None, None
+
+def multipart_etag(part_digests):
+    """
+    Rebuilds an S3 multipart ETag from the hex MD5 digests of its parts, in part order.
+    """
+    combined = hashlib.md5(b"".join(bytes.fromhex(digest) for digest in part_digests))
+    return f"{combined.hexdigest()}-{len(part_digests)}"
+
+def delta_download(s3_client, bucket_name, s3_key, destination_path, etag, size, checksum, upload_part_size,
+                   part_size, max_workers, limiter, cancel_event=None):
+    """
+    Rebuilds `s3_key` in `<destination>.temp` from chunks of archives already on disk plus ranged GETs for
+    the rest, using the `<key>.chunks.json` manifest (see `delta_utils`).
+
+    - Every chunk is checked against its SHA-256: copied chunks as they are read, fetched chunks after download.
+      A copied chunk that no longer matches is fetched instead.
+    - The result is checked against the ETag as in `download_file` (`checksum` from `plan_checksum`).
+    - The chunk list is kept in the download manifest, so this archive can seed the next delta download.
+    - Returns the manifest, or None (nothing replaced, `.temp` deleted) when there is no usable chunk manifest,
+      the result does not verify or the rebuild fails (a ranged GET, an unreadable local archive), in which case
+      the caller downloads the whole object. Only StageCancelled is raised.
+    """
+    try:
+        return _delta_download(s3_client, bucket_name, s3_key, destination_path, etag, size, checksum,
+                               upload_part_size, part_size, max_workers, limiter, cancel_event)
+    except StageCancelled:
+        raise
+    except Exception as e:
+        logging.warning(f"Delta download of {s3_key} failed ({e}); downloading the whole object.")
+        if os.path.exists(destination_path + ".temp"):
+            os.remove(destination_path + ".temp")
+        return None
+
+def _delta_download(s3_client, bucket_name, s3_key, destination_path, etag, size, checksum, upload_part_size,
+                    part_size, max_workers, limiter, cancel_event):
+    remote = load_remote_manifest(s3_client, bucket_name, s3_key)
+    if not remote:
+        return None
+    if remote["size"] != size:
+        logging.warning(f"Chunk manifest of {s3_key} describes {remote['size']} bytes, object has {size}; ignoring it.")
+        return None
+
+    temp_path = destination_path + ".temp"
+    chunk_map = build_chunk_map(find_delta_sources(destination_path))
+    copies, ranges, missing = plan_delta(remote, chunk_map, part_size)
+    with span("delta_download", key=s3_key, chunks=len(remote["chunks"])) as timer:
+        started = time.monotonic()
+        with open(temp_path, "wb") as temp_file:
+            temp_file.truncate(size)
+
+        # Local copies first: a stale source chunk is simply re-planned as a fetch
+        reused_bytes = 0
+        stale = set()
+        sources = {}
+        try:
+            with open(temp_path, "r+b") as temp_file:
+                for offset, length, digest, source_path, source_offset in copies:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise StageCancelled(f"Download of {s3_key} was cancelled.")
+                    if source_path not in sources:
+                        sources[source_path] = open(source_path, "rb")
+                    source = sources[source_path]
+                    source.seek(source_offset)
+                    data = source.read(length)
+                    if len(data) != length or hashlib.sha256(data).hexdigest() != digest:
+                        stale.add(digest)
+                        continue
+                    temp_file.seek(offset)
+                    temp_file.write(data)
+                    reused_bytes += length
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+        finally:
+            for source in sources.values():
+                source.close()
+        if stale:
+            logging.warning(f"{len(stale)} local chunk(s) changed on disk; fetching them from S3.")
+            chunk_map = {digest: source for digest, source in chunk_map.items() if digest not in stale}
+            _, ranges, missing = plan_delta(remote, chunk_map, part_size)
+
+        fetched_bytes = sum(end - start + 1 for start, end in ranges)
+        logging.info(f"Delta download of {s3_key}: reusing {reused_bytes / MB:.1f} MB from local archives, "
+                     f"fetching {fetched_bytes / MB:.1f} of {size / MB:.1f} MB in {len(ranges)} ranges...")
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [pool.submit(_download_part, s3_client, bucket_name, s3_key, etag, temp_path, start, end, limiter,
+                                   False, cancel_event)
+                       for start, end in ranges]
+            for future in as_completed(futures):
+                future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        bad = [offset for offset, length, digest in missing
+               if _hash_file_range(temp_path, offset, offset + length - 1, hashlib.sha256()).hexdigest() != digest]
+        actual = None
+        if not bad and checksum == "multipart":
+            actual = multipart_etag([_hash_file_range(temp_path, start, end, hashlib.md5()).hexdigest()
+                                     for start, end in plan_part_ranges(size, upload_part_size)])
+        elif not bad and checksum == "md5":
+            actual = _hash_file_range(temp_path, 0, size - 1, hashlib.md5()).hexdigest()
+        if bad or (actual and actual != etag.strip('"')):
+            logging.warning(f"Delta download of {s3_key} does not match its chunk manifest or ETag "
+                            f"({len(bad)} bad chunk(s), ETag {actual or '-'} vs {etag}); downloading the whole object.")
+            os.remove(temp_path)
+            timer.set(fallback=True)
+            return None
+        timer.add_bytes(fetched_bytes)
+        timer.set(reused_bytes=reused_bytes, fetched_bytes=fetched_bytes)
+        elapsed = max(time.monotonic() - started, 1e-6)
+
+    safe_overwrite_backup(os.path.dirname(destination_path), temp_path)
+    manifest = {
+        "bucket": bucket_name,
+        "key": s3_key,
+        "etag": etag,
+        "size": size,
+        "part_size": part_size,
+        "completed": [],
+        "part_md5": {},
+        "complete": True,
+        "verified": checksum or "chunks",
+        "chunks": remote["chunks"],
+        "delta": {"reused_bytes": reused_bytes, "fetched_bytes": fetched_bytes},
+    }
+    save_download_manifest(destination_path, manifest)
+    logging.info(f"Delta download of {s3_key} complete in {elapsed:.1f}s: fetched {fetched_bytes / MB:.1f} MB, "
+                 f"saved {(size - fetched_bytes) / MB:.1f} MB ({100 * (size - fetched_bytes) / max(size, 1):.0f}%).")
+    return manifest
+
+def discard_download(destination_path):
+    """
+    Deletes a downloaded file, its `.temp` file and its manifest so the next `download_file` starts over.
+    """
+    for path in (destination_path, destination_path + ".temp", destination_path + ".manifest.json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+def load_download_manifest(destination_path):
+    """
+    Loads the `<destination>.manifest.json` checkpoint, or None if it is missing or unreadable.
+    """
+    manifest_path = destination_path + ".manifest.json"
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable download manifest {manifest_path}: {e}")
+        return None
+
+def save_download_manifest(destination_path, manifest):
+    """
+    Atomically writes the `<destination>.manifest.json` checkpoint.
+    """
+    manifest_path = destination_path + ".manifest.json"
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file)
+        manifest_file.flush()
+        os.fsync(manifest_file.fileno())
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+def plan_part_ranges(size, part_size, parts=None):
+    """
+    Splits `size` bytes into inclusive (start, end) ranges.
+    `parts` fixes the number of ranges; otherwise ranges are `part_size` bytes long.
+    """
+    if size <= 0:
+        return []
+    if parts:
+        part_size = -(-size // max(1, min(parts, size)))
+    part_size = max(1, part_size)
+    return [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+class BandwidthLimiter:
+    """
+    Token bucket shared by all download workers to cap total throughput in MB/s.
+    """
+    def __init__(self, max_mbps):
+        self.rate = max_mbps * MB
+        self.capacity = self.rate
+        self.tokens = self.rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount or self.tokens >= self.capacity:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
 # 3. Safe Overwrite Function
 def safe_overwrite_backup(directory, temp_backup):
     """
@@ -98,75 +546,185 @@ def safe_overwrite_backup(directory, temp_backup):
     """
     try:
         final_path = os.path.join(directory, os.path.basename(temp_backup).replace(".temp", ""))
-        os.rename(temp_backup, final_path)
-        logging.info(f"? Backup successfully renamed from {temp_backup} to {final_path}")
+        os.replace(temp_backup, final_path)
+        logging.info(f"Backup successfully renamed from {temp_backup} to {final_path}")
     except Exception as e:
-        logging.error(f"? Failed to safely overwrite backup: {e}")
+        logging.error(f"Failed to safely overwrite backup: {e}")
         raise RuntimeError(f"Error during backup overwrite: {e}")
 
 # 4. Get Latest S3 Keys Function
-def get_latest_s3_keys(bucket_name, retries=3):
+def get_latest_s3_keys(bucket_name, retries=3, s3_client=None, prefix="SQLBackups/", database=None,
+                       cache_path=None, cache_ttl_minutes=None, full_sync_hours=None):
     """
-    (4) Retrieves the latest FULL and DIFF backup from S3.
-    """
-    s3_client = boto3.client("s3")
-    full_backup, diff_backup = None, None
+    (4) Retrieves the latest FULL backup and the newest DIFF taken after it from S3.
 
+    - Pages through the whole prefix with `BackupCatalog`, so buckets with more than 1000 keys are handled.
+    - `database` restricts the lookup to one database name as it appears in the backup keys.
+    - With `cache_path` the catalog is loaded from the local cache and only refreshed incrementally.
+    """
     for attempt in range(retries):
         try:
-            logging.info(f"?? Fetching backup files from S3 bucket: {bucket_name} (Attempt {attempt + 1}/{retries})")
-            response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix="SQLBackups/")
+            logging.info(f"Fetching backup files from S3 bucket: {bucket_name} (Attempt {attempt + 1}/{retries})")
+            if cache_path:
+                catalog = load_catalog(bucket_name, prefix, cache_path, s3_client=s3_client,
+                                       ttl_minutes=cache_ttl_minutes, full_sync_hours=full_sync_hours,
+                                       force_full=attempt > 0, database=database)
+            else:
+                catalog = BackupCatalog(bucket_name, prefix, s3_client=s3_client)
+                catalog.refresh()
 
-            if "Contents" not in response:
-                logging.warning("?? No backups found in S3. Retrying...")
+            full_entry = catalog.latest("FULL", database=database)
+            if not full_entry:
+                logging.warning("No FULL backups found in S3. Retrying...")
                 continue
 
-            backups = response["Contents"]
-            all_files = [obj["Key"] for obj in backups]
-            logging.info(f"?? All backups found in S3: {all_files}")
+            diff_entries = catalog.after("DIFF", full_entry.timestamp, database=full_entry.database)
+            full_backup = full_entry.key
+            diff_backup = diff_entries[-1].key if diff_entries else None
 
-            full_backups = sorted([obj["Key"] for obj in backups if "FULL" in obj["Key"].upper()], reverse=True)
-            diff_backups = sorted([obj["Key"] for obj in backups if "DIFF" in obj["Key"].upper()], reverse=True)
-
-            full_backup = full_backups[0] if full_backups else None
-            diff_backup = diff_backups[0] if diff_backups else None
-
-            logging.info(f"? Selected FULL backup: {full_backup}")
-            logging.info(f"? Selected DIFF backup: {diff_backup}")
+            logging.info(f"Selected FULL backup: {full_backup}")
+            logging.info(f"Selected DIFF backup: {diff_backup}")
             return full_backup, diff_backup
 
         except Exception as e:
-            logging.error(f"? Error retrieving backups from S3: {e}")
+            logging.error(f"Error retrieving backups from S3: {e}")
             continue
 
-    logging.critical("? No backups found in S3 after multiple retries.")
+    logging.critical("No backups found in S3 after multiple retries.")
     raise RuntimeError("No FULL or DIFF backups found in S3.")
 
 # 5. Extract File Function
-def extract_file(file_path, expected_type="FULL"):
+def extract_file(file_path, expected_type="FULL", threads=None, extract_path=None, password=None,
+                 seven_zip=None, cancel_event=None):
     """
-    (5) Extracts a .7z archive and ensures that a FULL or DIFF backup is selected correctly.
+    (5) Extracts only the backup members of `expected_type` from a .7z archive.
+
+    - Lists the archive first (`list_archive_contents`) without decompressing anything.
+    - Extracts just the matching `.bak`/`.trn` members, with `threads` decompression threads (`-mmt`).
+    - `password` and `seven_zip` (the 7-Zip executable) default to [Paths] zip_password and seven_zip_path.
+    - 7-Zip verifies each member's CRC while decoding; a CRC failure raises ChecksumMismatchError.
+    - `cancel_event` (threading.Event) kills 7-Zip, deletes the partly extracted files and raises StageCancelled.
+    - Returns the list of extracted paths (several for a striped backup set).
     """
     if not os.path.exists(file_path):
-        logging.error(f"? File not found for extraction: {file_path}")
+        logging.error(f"File not found for extraction: {file_path}")
         raise FileNotFoundError(f"File not found: {file_path}")
 
-    extract_path = os.path.dirname(file_path)
-    command = f'"{seven_zip_path}" x "{file_path}" -o"{extract_path}" -y'
+    extract_path = extract_path or os.path.dirname(file_path)
+    if password is None or not seven_zip:
+        paths = get_settings().paths
+        password = paths.zip_password if password is None else password
+        seven_zip = seven_zip or paths.seven_zip_path
+    members = list_archive_contents(file_path, password, seven_zip)
+    targets = select_backup_members(members, expected_type)
+    if not targets:
+        logging.error(f"No {expected_type} backup found in {file_path}: {[member['path'] for member in members]}")
+        raise RuntimeError(f"No {expected_type} backup found in {file_path}")
+
+    command = [seven_zip, "x", file_path, f"-o{extract_path}", "-y", "-spd", f"-p{password or ''}",
+               f"-mmt{threads}" if threads else "-mmt=on"]
+    command += [member["path"] for member in targets]
+    target_paths = [os.path.join(extract_path, *member["path"].replace("\\", "/").split("/")) for member in targets]
+
+    try:
+        logging.info(f"Extracting {[member['path'] for member in targets]} "
+                     f"({sum(member['size'] for member in targets) / MB:.1f} MB) from {file_path}")
+        with span("extract", byte_count=sum(member["size"] for member in targets), archive=file_path,
+                  threads=threads or "on"):
+            _run_cancellable(command, cancel_event)
+    except StageCancelled:
+        logging.warning(f"Extraction of {file_path} was cancelled; removing the partly extracted files.")
+        for path in target_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Extraction failed for {file_path}: {e.stderr or e}")
+        # 7-Zip checks the CRC of every member while decoding
+        if any(marker in (e.stderr or "") for marker in ("CRC Failed", "Data Error", "Unexpected end of archive")):
+            raise ChecksumMismatchError(f"Archive {file_path} is corrupt: {e.stderr.strip()}")
+        raise RuntimeError(f"Extraction failed: {e.stderr or e}")
+
+    extracted_paths = []
+    for member, extracted_path in zip(targets, target_paths):
+        if not os.path.exists(extracted_path) or os.path.getsize(extracted_path) != member["size"]:
+            logging.error(f"Extracted file missing or incomplete: {extracted_path}")
+            raise ChecksumMismatchError(f"Extracted file missing or incomplete: {extracted_path}")
+        extracted_paths.append(extracted_path)
+
+    logging.info(f"Extracted {file_path} to {extracted_paths}")
+    return extracted_paths
+
+def _run_cancellable(command, cancel_event=None, poll_seconds=0.5):
+    """
+    Runs `command` like `subprocess.run(check=True, capture_output=True, text=True)`, but kills it and raises
+    StageCancelled as soon as `cancel_event` is set.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    while True:
+        try:
+            stdout, stderr = process.communicate(timeout=poll_seconds if cancel_event is not None else None)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel_event.is_set():
+                process.kill()
+                process.communicate()
+                raise StageCancelled(f"{os.path.basename(command[0])} was cancelled.")
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return stdout
 
+def list_archive_contents(file_path, password=None, seven_zip=None):
+    """
+    Lists the members of a .7z archive without decompressing it.
+    Returns dicts with path, size, packed_size, method, crc and is_dir.
+    """
+    command = [seven_zip or get_settings().paths.seven_zip_path, "l", "-slt", "-ba", f"-p{password or ''}", file_path]
     try:
-        subprocess.run(command, shell=True, check=True, text=True)
-        logging.info(f"? Extracted {file_path} to {extract_path}")
+        result = subprocess.run(command, check=True, capture_output=True, text=True)
     except subprocess.CalledProcessError as e:
-        logging.error(f"? Extraction failed for {file_path}: {e}")
-        raise RuntimeError(f"Extraction failed: {e}")
+        logging.error(f"Could not list archive {file_path}: {e.stderr or e}")
+        raise RuntimeError(f"Could not list archive {file_path}: {e.stderr or e}")
+
+    members = []
+    for block in result.stdout.replace("\r\n", "\n").split("\n\n"):
+        fields = dict(
+            line.split(" = ", 1) if " = " in line else (line.rstrip(" ="), "")
+            for line in block.splitlines() if "=" in line
+        )
+        if "Path" not in fields:
+            continue
+        members.append({
+            "path": fields["Path"],
+            "size": int(fields.get("Size") or 0),
+            "packed_size": int(fields.get("Packed Size") or 0),
+            "method": fields.get("Method", ""),
+            "crc": fields.get("CRC", ""),
+            "is_dir": fields.get("Folder") == "+" or "D" in fields.get("Attributes", "").split(" ")[0],
+        })
+    return members
+
+def select_backup_members(members, expected_type="FULL"):
+    """
+    Returns the backup file members (`.bak`/`.trn`) whose file name contains `expected_type`.
+    """
+    return [
+        member for member in members
+        if not member["is_dir"]
+        and member["path"].lower().endswith(BACKUP_EXTENSIONS)
+        and expected_type.upper() in os.path.basename(member["path"].replace("\\", "/")).upper()
+    ]
 
 # 6. Clear Old Backups Function
-def clear_old_backups(directory):
+def clear_old_backups(directory, keep=(), max_age_days=0, max_total_gb=0, older_than=None):
     """
     (6) Deletes older backups only AFTER the latest backup has been fully restored.
+
+    - `keep` lists the files of the chain just restored; they are never deleted.
+    - Archives and backups unused for `max_age_days` go first, then the least recently used ones until
+      the directory holds at most `max_total_gb` (see `staging_utils.apply_retention`).
     """
-    logging.info("? Skipping backup cleanup in test mode.")
+    return apply_retention(directory, keep, max_age_days, max_total_gb, older_than)
 
 # 7. Verify Functions Exist Function
 def verify_functions_exist():
@@ -183,13 +741,15 @@ def verify_functions_exist():
     ]
     missing_functions = [func for func in required_functions if func not in globals()]
     if missing_functions:
-        logging.error(f"? Missing required functions: {missing_functions}")
+        logging.error(f"Missing required functions: {missing_functions}")
         exit(1)
-    logging.info("? All required functions are present.")
+    logging.info("All required functions are present.")
 
 # 8. Main Function for Testing
 if __name__ == "__main__":
-    logging.info("? Running S3 Backup Test Mode...")
+    from utils.logging_utils import setup_logging
+    settings = get_settings()
+    setup_logging(settings.paths.log_file_path)
+    logging.info("Running S3 Backup Test Mode...")
     verify_functions_exist()
-    bucket_name = "ssg-etobphc"
-    get_latest_s3_keys(bucket_name)
+    get_latest_s3_keys(settings.paths.s3_bucket_name, prefix=settings.paths.s3_backup_prefix)
@@ -0,0 +1,212 @@
+import logging
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Multi-Database Restore Scheduler for ETO Backup & Restore Application
+
+Runs the download/extract/restore pipeline of several database targets concurrently.
+Each stage has its own concurrency limit: network downloads, CPU-bound extraction and SQL restores
+(per SQL Server instance). A failure in one target never aborts the others.
+
+Functions:
+1. load_restore_targets(config) - Reads `[Target:<name>]` sections from `config.ini` (falls back to [Database]/[Paths]).
+2. StageLimits(download, extract, restore_per_instance) - Per-stage semaphores shared by all targets.
+3. run_restore_targets(targets, restore_function, stage_limits, max_parallel_targets=None) - Runs every target and collects results.
+4. Prefetcher(fetch, lookahead=2, retries=2, backoff=1.0) - Runs a stage for the next items of a serial pipeline ahead of the consumer.
+"""
+
+RestoreTarget = namedtuple("RestoreTarget", [
+    "name", "database_name", "dsn", "instance", "s3_bucket_name", "s3_backup_prefix", "s3_database_name",
+    "backup_directory",
+])
+
+# 1. Load Restore Targets Function
+def load_restore_targets(config):
+    """
+    (1) Builds the list of RestoreTarget entries from `config.ini`.
+
+    - Every `[Target:<name>]` section is a target; missing options fall back to [Database] and [Paths].
+    - Without any target sections the single [Database] database is the only target.
+    """
+    defaults = {
+        "database_name": config.get("Database", "database_name", fallback="ETO"),
+        "dsn": config.get("Database", "dsn", fallback="DSN=ETO_DSN"),
+        "s3_bucket_name": config.get("Paths", "s3_bucket_name", fallback="ssg-etobphc"),
+        "s3_backup_prefix": config.get("Paths", "s3_backup_prefix", fallback="SQLBackups/"),
+        "backup_directory": config.get("Paths", "backup_directory", fallback=""),
+    }
+
+    sections = [section for section in config.sections() if section.startswith("Target:")]
+    if not sections:
+        sections = [None]
+
+    targets = []
+    for section in sections:
+        options = dict(defaults)
+        if section:
+            options.update({key: value for key, value in config.items(section) if value.strip()})
+        dsn = options["dsn"]
+        targets.append(RestoreTarget(
+            name=section.split(":", 1)[1].strip() if section else options["database_name"],
+            database_name=options["database_name"],
+            dsn=dsn,
+            instance=options.get("instance") or dsn,
+            s3_bucket_name=options["s3_bucket_name"],
+            s3_backup_prefix=options["s3_backup_prefix"],
+            s3_database_name=options.get("s3_database_name") or None,
+            backup_directory=options["backup_directory"],
+        ))
+    return targets
+
+# 2. Stage Limits
+class StageLimits:
+    """
+    (2) Concurrency limits shared by every target pipeline.
+
+    - `stage("download")` and `stage("extract")` are limited globally.
+    - `stage("restore", instance)` is limited per SQL Server instance.
+    """
+    def __init__(self, download=2, extract=1, restore_per_instance=1):
+        self.semaphores = {
+            "download": threading.BoundedSemaphore(max(1, download)),
+            "extract": threading.BoundedSemaphore(max(1, extract)),
+        }
+        self.restore_per_instance = max(1, restore_per_instance)
+        self.lock = threading.Lock()
+
+    def _semaphore(self, stage_name, instance):
+        if stage_name != "restore":
+            return self.semaphores[stage_name]
+        with self.lock:
+            return self.semaphores.setdefault(
+                f"restore:{instance}", threading.BoundedSemaphore(self.restore_per_instance)
+            )
+
+    @contextmanager
+    def stage(self, stage_name, instance=None):
+        semaphore = self._semaphore(stage_name, instance)
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+# 3. Run Restore Targets Function
+def run_restore_targets(targets, restore_function, stage_limits=None, max_parallel_targets=None):
+    """
+    (3) Runs `restore_function(target, stage_limits)` for every target concurrently.
+
+    - Exceptions are logged and recorded per target; other targets keep running.
+    - Returns a dict of target name -> None (success) or the exception raised.
+    """
+    stage_limits = stage_limits or StageLimits()
+    results = {}
+
+    def run(target):
+        threading.current_thread().name = target.name
+        try:
+            restore_function(target, stage_limits)
+            results[target.name] = None
+        except Exception as e:
+            logging.error(f"Restore of target {target.name} failed: {e}")
+            results[target.name] = e
+
+    with ThreadPoolExecutor(max_workers=max_parallel_targets or len(targets) or 1) as pool:
+        list(pool.map(run, targets))
+
+    failed = [name for name, error in results.items() if error is not None]
+    logging.info(f"Restore run finished: {len(targets) - len(failed)}/{len(targets)} targets succeeded"
+                 + (f", failed: {failed}" if failed else "."))
+    return results
+
+class StageCancelled(Exception):
+    """
+    Raised by a Prefetcher stage that was cancelled before it finished.
+    """
+
+# 4. Prefetcher
+class Prefetcher:
+    """
+    (4) Runs `fetch(item)` for the next items of a serial pipeline while the consumer works on the current one.
+
+    - `schedule(keyed_items)` submits the first `lookahead + 1` items not started yet, so at most that many
+      results (downloaded and extracted files) are in flight or waiting at any time.
+    - `result(key, item)` waits for an item, running it now if it was never scheduled.
+    - `fetch(item, cancelled)` receives the Prefetcher's cancel event and should check it between chunks of
+      work, removing its partial output and raising StageCancelled once it is set.
+    - A failed `fetch` is retried `retries` times, waiting `backoff` seconds doubled per attempt;
+      `discard(keys)` (items dropped from the plan) stops items before their next attempt.
+    - `cancel()` stops running items at their next chunk and never starts the queued ones.
+    """
+    def __init__(self, fetch, lookahead=2, retries=2, backoff=1.0, name="prefetch"):
+        self.fetch = fetch
+        self.lookahead = max(0, lookahead)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.executor = ThreadPoolExecutor(max_workers=max(1, self.lookahead), thread_name_prefix=name)
+        self.futures = {}
+        self.discarded = set()
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+
+    def _run(self, key, item):
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            if self.cancelled.is_set() or key in self.discarded:
+                raise StageCancelled(f"{key} was cancelled.")
+            try:
+                return self.fetch(item, self.cancelled)
+            except Exception as e:
+                if attempt == self.retries or self.cancelled.is_set():
+                    raise
+                logging.warning(f"{key} failed (attempt {attempt + 1}/{self.retries + 1}): {e}. "
+                                f"Retrying in {delay:.1f}s...")
+                if self.cancelled.wait(delay):
+                    raise StageCancelled(f"{key} was cancelled.")
+                delay *= 2
+
+    def _submit(self, key, item):
+        with self.lock:
+            self.discarded.discard(key)
+            if key not in self.futures:
+                self.futures[key] = self.executor.submit(self._run, key, item)
+            return self.futures[key]
+
+    def schedule(self, keyed_items):
+        """
+        Submits the first `lookahead + 1` of `keyed_items` ((key, item) pairs in consumption order).
+        """
+        for key, item in list(keyed_items)[:self.lookahead + 1]:
+            self._submit(key, item)
+
+    def result(self, key, item):
+        """
+        Returns the result for `key`, waiting for (or starting) its stage; stage errors are re-raised.
+        """
+        future = self._submit(key, item)
+        try:
+            return future.result()
+        finally:
+            with self.lock:
+                self.futures.pop(key, None)
+
+    def discard(self, keys):
+        """
+        Drops items that are no longer needed: queued ones never start, running ones stop before a retry.
+        """
+        with self.lock:
+            for key in keys:
+                future = self.futures.pop(key, None)
+                if future is not None and not future.cancel():
+                    self.discarded.add(key)
+
+    def cancel(self):
+        """
+        Cancels every pending item and signals the running ones, which stop at their next chunk
+        and clean up after themselves; returns once they have.
+        """
+        self.cancelled.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
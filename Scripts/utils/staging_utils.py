@@ -0,0 +1,149 @@
+import os
+import time
+import logging
+from collections import namedtuple
+
+from utils.file_utils import check_disk_space, free_bytes, volume_of
+
+"""
+Disk-Space Staging Planner for ETO Backup & Restore Application
+
+Works out how much disk a planned restore chain needs before anything is downloaded, and how to stage it:
+- file, keep archives:   every `.7z` and every extracted `.bak` stays on disk.
+- file, delete archives: each `.7z` is deleted once extracted, so only one archive is on disk at a time.
+- stream:                archives never land on disk (`stream_utils`), only the extracted `.bak` files.
+
+The cheapest mode that fits the staging volume is chosen, preferring the configured one. The database
+data/log files reported by `RESTORE FILELISTONLY` are checked against their own volumes before restoring,
+and old archives and backups are only evicted after a successful restore.
+
+Functions:
+1. plan_staging(files, staging_directory, mode="file", keep_archives=True, reserve_gb=0, ...) - Peak bytes and the stream/keep/delete decision.
+2. check_database_files_space(database_files, database_name, move=None, reserve_gb=0) - Checks data/log volumes against FILELISTONLY sizes.
+3. apply_retention(directory, keep=(), max_age_days=0, max_total_gb=0, older_than=None) - Evicts old archives and backups (age, then LRU).
+"""
+
+GB = 2**30
+STAGED_EXTENSIONS = (".7z", ".bak", ".trn")
+
+StagedFile = namedtuple("StagedFile", ["key", "archive_path", "archive_bytes", "extracted_paths", "extracted_bytes"])
+StagingPlan = namedtuple("StagingPlan", ["mode", "keep_archives", "peak_bytes", "free_bytes"])
+
+def _size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+# 1. Plan Staging Function
+def plan_staging(files, staging_directory, mode="file", keep_archives=True, reserve_gb=0, stream_available=True,
+                 check=True):
+    """
+    (1) Returns the StagingPlan for staging `files` (StagedFile records) in `staging_directory`.
+
+    - Bytes already on disk (a finished archive, a previously extracted `.bak`) are not counted again.
+    - Peak bytes are the extracted sizes plus all archives (keep), the largest archive (delete) or nothing (stream).
+    - Candidates are tried in order: the configured mode, then deleting archives, then streaming.
+    - Raises RuntimeError (via `check_disk_space`) if even the smallest footprint does not fit; with
+      `check=False` the smallest footprint is returned instead, for reporting.
+    """
+    extracted = sum(max(0, staged.extracted_bytes - sum(_size(path) for path in staged.extracted_paths))
+                    for staged in files)
+    archives = [max(0, staged.archive_bytes - _size(staged.archive_path)) for staged in files]
+
+    candidates = [("stream", False)] if mode == "stream" else [("file", keep_archives), ("file", False)]
+    if stream_available and ("stream", False) not in candidates:
+        candidates.append(("stream", False))
+
+    free = free_bytes(staging_directory)
+    reserve = reserve_gb * GB
+    for candidate_mode, keep in dict.fromkeys(candidates):
+        if candidate_mode == "stream":
+            peak = extracted
+        else:
+            peak = extracted + (sum(archives) if keep else max(archives, default=0))
+        if peak + reserve <= free:
+            plan = StagingPlan(candidate_mode, keep, peak, free)
+            if (candidate_mode, keep) != candidates[0]:
+                logging.warning(f"Not enough space in {staging_directory} to stage with mode={candidates[0][0]}, "
+                                f"keep_archives={candidates[0][1]}; using mode={candidate_mode}, keep_archives={keep}.")
+            logging.info(f"Staging plan: {peak / GB:.1f}GB peak in {staging_directory} "
+                         f"({free / GB:.1f}GB free, mode={candidate_mode}, keep_archives={keep})")
+            return plan
+
+    if check:
+        check_disk_space(staging_directory, (peak + reserve) / GB)
+    return StagingPlan(candidate_mode, keep, peak, free)
+
+# 2. Check Database Files Space Function
+def check_database_files_space(database_files, database_name, move=None, reserve_gb=0):
+    """
+    (2) Checks that every volume receiving data/log files has room for them.
+
+    - `database_files` are `RESTORE FILELISTONLY` rows (LogicalName, PhysicalName, Size).
+    - `move` ({logical name: path}, `{database}` placeholder) overrides PhysicalName like the RESTORE statement does.
+    - Existing files at the target path are replaced in place, so their size is already accounted for.
+    - Raises RuntimeError (via `check_disk_space`) for the first volume that is too small.
+    """
+    volumes = {}
+    for database_file in database_files:
+        physical_path = (move or {}).get(database_file["LogicalName"], database_file["PhysicalName"])
+        physical_path = physical_path.replace("{database}", database_name)
+        needed = max(0, int(database_file.get("Size") or 0) - _size(physical_path))
+        directory = os.path.dirname(physical_path)
+        try:
+            volume = volume_of(directory)
+        except OSError as e:
+            logging.warning(f"Cannot check free space for {physical_path}: {e}")
+            continue
+        path, total = volumes.get(volume, (directory, 0))
+        volumes[volume] = (path, total + needed)
+
+    for directory, needed in volumes.values():
+        check_disk_space(directory, (needed + reserve_gb * GB) / GB)
+
+# 3. Apply Retention Function
+def apply_retention(directory, keep=(), max_age_days=0, max_total_gb=0, older_than=None):
+    """
+    (3) Evicts staged archives and backups from `directory`; call only after a successful restore.
+
+    - Only `.7z`, `.bak` and `.trn` files are considered (their download manifests go with them).
+    - `keep` paths (the chain just restored) and files modified after `older_than` (in use by other
+      restores in this run) are never evicted.
+    - Files unused for more than `max_age_days` are deleted first, then the least recently used ones
+      until the rest fits in `max_total_gb` (0 disables either policy).
+    - Returns the list of deleted paths.
+    """
+    if not os.path.isdir(directory):
+        return []
+    keep = {os.path.abspath(path) for path in keep}
+    now = time.time()
+
+    candidates = []
+    for name in os.listdir(directory):
+        path = os.path.abspath(os.path.join(directory, name))
+        if not name.lower().endswith(STAGED_EXTENSIONS) or not os.path.isfile(path) or path in keep:
+            continue
+        stat = os.stat(path)
+        last_used = max(stat.st_atime, stat.st_mtime)
+        if older_than is not None and stat.st_mtime >= older_than:
+            continue
+        candidates.append((last_used, stat.st_size, path))
+    candidates.sort()
+
+    total = sum(size for _, size, _ in candidates) + sum(_size(path) for path in keep)
+    deleted = []
+    for last_used, size, path in candidates:
+        expired = max_age_days and now - last_used > max_age_days * 86400
+        over_budget = max_total_gb and total > max_total_gb * GB
+        if not expired and not over_budget:
+            continue
+        try:
+            os.remove(path)
+            if os.path.exists(path + ".manifest.json"):
+                os.remove(path + ".manifest.json")
+        except OSError as e:
+            logging.warning(f"Could not delete old backup {path}: {e}")
+            continue
+        total -= size
+        deleted.append(path)
+        logging.info(f"Deleted old backup {path} ({size / GB:.1f}GB, "
+                     f"{'expired' if expired else 'least recently used'})")
+    return deleted
@@ -0,0 +1,315 @@
+import io
+import os
+import struct
+import logging
+import threading
+import time
+from utils.config_utils import get_settings
+from utils.catalog_utils import create_s3_client
+from utils.s3_utils import ChecksumMismatchError
+from utils.scheduler_utils import StageCancelled
+from utils.timing_utils import span
+
+"""
+Streaming Restore Utilities for ETO Backup & Restore Application
+
+Streams a `.7z` backup archive from S3 straight into the 7z decoder so the archive never lands on disk
+and the `.bak` is written while the download is still running.
+
+The 7z format stores its header at the end of the archive, so the signature header and the end header
+are fetched first with small ranged GETs. The packed streams are then read sequentially through a bounded
+in-memory window that the decoder consumes as bytes arrive.
+
+Functions:
+1. stream_extract_file(s3_key, extract_path, expected_type="FULL", ...) - Downloads, decrypts and extracts `.bak` members in one pass.
+2. S3StreamReader(s3_client, bucket_name, s3_key, ...) - Seekable read-only view of an S3 object backed by a sliding window.
+3. list_remote_archive(s3_key, bucket_name=None, s3_client=None, password=None) - Lists archive members from the pinned headers only.
+"""
+
+# Streaming Defaults
+stream_window_mb = 256
+stream_chunk_size = 1024 * 1024
+SIGNATURE_HEADER_SIZE = 32
+MB = 1024 * 1024
+
+# 1. Stream Extract Function
+def stream_extract_file(s3_key, extract_path, expected_type="FULL", bucket_name=None, s3_client=None,
+                        password=None, window_mb=None, cancel_event=None):
+    """
+    (1) Streams a `.7z` archive from S3 into the decoder and writes the matching `.bak` members to `extract_path`.
+
+    - Download and decompression overlap; peak disk use is the extracted `.bak` only.
+    - `window_mb` bounds how far the download may run ahead of the decoder.
+    - py7zr checks each member's CRC while decoding; a mismatch raises ChecksumMismatchError.
+    - `cancel_event` (threading.Event) stops the download at its next chunk; the partly extracted files are
+      deleted and StageCancelled raised.
+    - Returns the list of extracted `.bak` paths.
+    """
+    try:
+        import py7zr
+    except ImportError:
+        logging.error("Streaming extraction requires the py7zr package.")
+        raise RuntimeError("Streaming extraction requires the py7zr package (pip install py7zr).")
+
+    bucket_name = bucket_name or get_settings().paths.s3_bucket_name
+    s3_client = s3_client or create_s3_client()
+    password = password if password is not None else get_settings().paths.zip_password
+    os.makedirs(extract_path, exist_ok=True)
+
+    reader = S3StreamReader(s3_client, bucket_name, s3_key, window_bytes=int((window_mb or stream_window_mb) * MB),
+                            cancel_event=cancel_event)
+    started = time.monotonic()
+    targets = []
+    try:
+        with py7zr.SevenZipFile(reader, mode="r", password=password or None) as archive:
+            targets = [
+                name for name in archive.getnames()
+                if name.lower().endswith((".bak", ".trn")) and expected_type.upper() in os.path.basename(name).upper()
+            ]
+            if not targets:
+                logging.error(f"No {expected_type} .bak file found in s3://{bucket_name}/{s3_key}")
+                raise RuntimeError(f"No {expected_type} .bak file found in {s3_key}")
+
+            logging.info(f"Streaming {s3_key} ({reader.size / MB:.1f} MB) into {extract_path}: {targets}")
+            with span("stream_extract", byte_count=reader.size, key=s3_key):
+                reader.start_streaming()
+                archive.extract(path=extract_path, targets=targets)
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        extracted_paths = [os.path.join(extract_path, name) for name in targets]
+        logging.info(f"Streamed and extracted {s3_key} in {elapsed:.1f}s "
+                     f"({reader.size / MB / elapsed:.1f} MB/s, {reader.fallback_bytes / MB:.1f} MB re-fetched)")
+        return extracted_paths
+    except py7zr.exceptions.CrcError as e:
+        logging.error(f"CRC check failed while streaming {s3_key}: {e}")
+        raise ChecksumMismatchError(f"CRC check failed while streaming {s3_key}: {e}")
+    except Exception as e:
+        if cancel_event is not None and cancel_event.is_set():
+            # The decoder may wrap the reader's StageCancelled
+            logging.warning(f"Streaming of {s3_key} was cancelled; removing the partly extracted files.")
+            for name in targets:
+                path = os.path.join(extract_path, name)
+                if os.path.exists(path):
+                    os.remove(path)
+            raise StageCancelled(f"Streaming of {s3_key} was cancelled.")
+        logging.error(f"Streaming extraction failed for {s3_key}: {e}")
+        raise RuntimeError(f"Streaming extraction failed for {s3_key}: {e}")
+    finally:
+        reader.close()
+
+# 2. S3 Stream Reader
+class S3StreamReader(io.RawIOBase):
+    """
+    (2) Seekable, read-only view of an S3 object for the 7z decoder.
+
+    - The signature header and end header are pinned in memory with ranged GETs on open.
+    - Before `start_streaming()` all other reads are served by small ranged GETs.
+    - After `start_streaming()` a background thread reads the object sequentially into a window of at most
+      `window_bytes`; reads wait for bytes to arrive and release them once consumed.
+    - Backward seeks outside the window fall back to ranged GETs (counted in `fallback_bytes`).
+    - Once `cancel_event` is set, reads raise StageCancelled and the background download stops.
+    """
+    def __init__(self, s3_client, bucket_name, s3_key, window_bytes=256 * MB, chunk_size=None, cancel_event=None):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.s3_key = s3_key
+        self.window_bytes = window_bytes
+        self.chunk_size = chunk_size or stream_chunk_size
+        self.fallback_bytes = 0
+        self.cancel_event = cancel_event
+
+        head = s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+        self.size = head["ContentLength"]
+        self.etag = head["ETag"]
+        self.position = 0
+
+        self.pinned = []
+        self.block = (0, b"")
+        self._pin_headers()
+
+        self.streaming = False
+        self.producer = None
+        self.window = bytearray()
+        self.window_start = 0
+        self.produced = 0
+        self.finished = False
+        self.error = None
+        self.closing = False
+        self.condition = threading.Condition()
+
+    def _fetch(self, start, end):
+        if end < start:
+            return b""
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.s3_key,
+                                              Range=f"bytes={start}-{end}", IfMatch=self.etag)
+        return response["Body"].read()
+
+    def _pin_headers(self):
+        signature = self._fetch(0, min(SIGNATURE_HEADER_SIZE, self.size) - 1)
+        self.pinned.append((0, signature))
+        if len(signature) == SIGNATURE_HEADER_SIZE:
+            next_header_offset, next_header_size = struct.unpack("<QQ", signature[12:28])
+            header_start = SIGNATURE_HEADER_SIZE + next_header_offset
+            header_end = min(header_start + next_header_size, self.size) - 1
+            if header_start < self.size:
+                self.pinned.append((header_start, self._fetch(header_start, header_end)))
+
+    def start_streaming(self):
+        """
+        Switches body reads from ranged GETs to the sequential background download.
+        """
+        self.streaming = True
+
+    def _start_producer(self, offset):
+        self.window_start = offset
+        self.produced = offset
+        self.producer = threading.Thread(target=self._produce, args=(offset,), daemon=True)
+        self.producer.start()
+
+    def _produce(self, offset):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.s3_key,
+                                                 Range=f"bytes={offset}-{self.size - 1}", IfMatch=self.etag)
+            body = response["Body"]
+            while True:
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    raise StageCancelled(f"Streaming of {self.s3_key} was cancelled.")
+                chunk = body.read(self.chunk_size)
+                if not chunk:
+                    break
+                with self.condition:
+                    while len(self.window) >= self.window_bytes and not self.closing:
+                        self.condition.wait()
+                    if self.closing:
+                        return
+                    chunk_start = self.produced
+                    self.produced += len(chunk)
+                    if self.produced > self.window_start:
+                        self.window += chunk[max(0, self.window_start - chunk_start):]
+                    self.condition.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    def _read_pinned(self, position, length):
+        for start, data in self.pinned:
+            if start <= position < start + len(data):
+                return data[position - start:position - start + length]
+        return None
+
+    def _read_direct(self, position, length):
+        block_start, block = self.block
+        if not (block_start <= position and position + length <= block_start + len(block)):
+            end = min(self.size, position + max(length, self.chunk_size)) - 1
+            block_start, block = position, self._fetch(position, end)
+            self.block = (block_start, block)
+            if self.streaming:
+                self.fallback_bytes += len(block)
+        return block[position - block_start:position - block_start + length]
+
+    def _read_window(self, position, length):
+        with self.condition:
+            if position > self.window_start:
+                # Skip ahead: release everything before the requested offset
+                del self.window[:position - self.window_start]
+                self.window_start = position
+                if self.produced < position:
+                    self.window.clear()
+                self.condition.notify_all()
+
+            wanted_end = min(position + length, self.size)
+            while self.window_start + len(self.window) < wanted_end and not self.finished:
+                self.condition.wait()
+            if self.error:
+                raise RuntimeError(f"Streaming download failed for {self.s3_key}: {self.error}")
+
+            data = bytes(self.window[:length])
+            del self.window[:len(data)]
+            self.window_start += len(data)
+            self.condition.notify_all()
+            return data
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.size - self.position)
+        filled = 0
+        while filled < length:
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                raise StageCancelled(f"Streaming of {self.s3_key} was cancelled.")
+            data = self._read_at(self.position, min(length - filled, self.window_bytes))
+            if not data:
+                break
+            buffer[filled:filled + len(data)] = data
+            filled += len(data)
+            self.position += len(data)
+        return filled
+
+    def _read_at(self, position, length):
+        data = self._read_pinned(position, length)
+        if data is not None:
+            return data
+        if not self.streaming:
+            return self._read_direct(position, length)
+        if self.producer is None:
+            self._start_producer(position)
+        if position < self.window_start:
+            return self._read_direct(position, min(length, self.window_start - position))
+        return self._read_window(position, length)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self.position
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.window.clear()
+            self.condition.notify_all()
+        super().close()
+
+# 3. List Remote Archive Function
+def list_remote_archive(s3_key, bucket_name=None, s3_client=None, password=None):
+    """
+    (3) Lists the members of a `.7z` archive in S3 without downloading its packed data.
+    Only the signature and end headers are fetched; returns dicts like `s3_utils.list_archive_contents`.
+    """
+    import py7zr
+
+    bucket_name = bucket_name or get_settings().paths.s3_bucket_name
+    s3_client = s3_client or create_s3_client()
+    password = password if password is not None else get_settings().paths.zip_password
+    reader = S3StreamReader(s3_client, bucket_name, s3_key)
+    try:
+        with py7zr.SevenZipFile(reader, mode="r", password=password or None) as archive:
+            return [
+                {
+                    "path": info.filename,
+                    "size": info.uncompressed or 0,
+                    "packed_size": info.compressed or 0,
+                    "method": "",
+                    "crc": f"{info.crc32:08X}" if info.crc32 is not None else "",
+                    "is_dir": info.is_directory,
+                }
+                for info in archive.list()
+            ]
+    finally:
+        reader.close()
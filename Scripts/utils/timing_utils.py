@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+"""
+Stage Timing Instrumentation for ETO Backup & Restore Application
+
+Lightweight spans around every stage of a restore run, so a slow night can be traced to S3, 7-Zip or SQL Server.
+Each span records its duration, the bytes it moved and the resulting throughput. Finished spans are collected by
+the process-wide RunRecorder and written as a JSON run report (and optionally a Prometheus textfile) at the end.
+
+Stage names used by the pipeline:
+    list, download, download_part, extract, stream_extract, header_read, restore, recovery, permissions
+
+Usage:
+    with span("extract", database="ETO", key=s3_key) as timer:
+        ...
+        timer.add_bytes(extracted_bytes)
+
+Functions:
+1. span(stage, byte_count=0, **attributes) - Context manager that times one stage and records it.
+2. RunRecorder() - Thread-safe collector of finished spans with per-stage aggregates.
+3. start_run() / current_run() - Installs / returns the process-wide RunRecorder.
+4. write_run_report(recorder, report_path, results=None) - Writes the machine-readable JSON run report.
+5. write_prometheus_textfile(recorder, textfile_path, results=None) - Writes metrics for the node_exporter textfile collector.
+"""
+
+MB = 1024 * 1024
+
+class Span:
+    """
+    One timed stage. `add_bytes()` and `set()` may be called while the span is open.
+    """
+    def __init__(self, stage, byte_count=0, attributes=None):
+        self.stage = stage
+        self.bytes = byte_count
+        self.attributes = dict(attributes or {})
+        self.started = time.time()
+        self.duration = None
+        self.status = "ok"
+        self.error = None
+        self._perf_started = time.perf_counter()
+
+    def add_bytes(self, amount):
+        self.bytes += amount
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._perf_started
+
+    def to_dict(self):
+        attributes = dict(self.attributes)
+        return {
+            "stage": self.stage,
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="milliseconds"),
+            "seconds": round(self.duration or 0, 3),
+            "bytes": self.bytes,
+            "mb_per_second": round(self.bytes / MB / self.duration, 1) if self.bytes and self.duration else None,
+            "status": self.status,
+            "error": self.error,
+            "thread": attributes.pop("thread", None),
+            **attributes,
+        }
+
+# 1. Span Function
+@contextmanager
+def span(stage, byte_count=0, **attributes):
+    """
+    (1) Times the enclosed block as one `stage` span and records it on the current run.
+    Exceptions are recorded on the span (status "error") and re-raised.
+    """
+    current = Span(stage, byte_count, dict(attributes, thread=threading.current_thread().name))
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.error = str(e)
+        raise
+    finally:
+        current.finish()
+        current_run().add(current)
+
+# 2. Run Recorder
+class RunRecorder:
+    """
+    (2) Collects finished spans for one run; safe to use from download, extract and restore threads.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, finished_span):
+        with self.lock:
+            self.spans.append(finished_span)
+
+    def snapshot(self):
+        with self.lock:
+            return sorted(self.spans, key=lambda item: item.started)
+
+    def stages(self):
+        """
+        Aggregates spans per stage: count, errors, summed and wall-clock seconds, bytes and throughput.
+        Wall-clock seconds (first start to last end) give the real throughput of parallel spans such as download parts.
+        """
+        stages = {}
+        for item in self.snapshot():
+            stage = stages.setdefault(item.stage, {
+                "count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0,
+                "first_start": item.started, "last_end": item.started,
+            })
+            stage["count"] += 1
+            stage["errors"] += item.status != "ok"
+            stage["seconds"] += item.duration or 0
+            stage["max_seconds"] = max(stage["max_seconds"], item.duration or 0)
+            stage["bytes"] += item.bytes
+            stage["first_start"] = min(stage["first_start"], item.started)
+            stage["last_end"] = max(stage["last_end"], item.started + (item.duration or 0))
+
+        for stage in stages.values():
+            wall_seconds = stage.pop("last_end") - stage.pop("first_start")
+            stage["wall_seconds"] = round(wall_seconds, 3)
+            stage["seconds"] = round(stage["seconds"], 3)
+            stage["max_seconds"] = round(stage["max_seconds"], 3)
+            stage["mb_per_second"] = round(stage["bytes"] / MB / wall_seconds, 1) if stage["bytes"] and wall_seconds else None
+        return stages
+
+# 3. Start Run / Current Run Functions
+_current_run = RunRecorder()
+_current_run_lock = threading.Lock()
+
+def start_run():
+    """
+    (3) Installs a fresh RunRecorder as the process-wide recorder and returns it.
+    """
+    global _current_run
+    with _current_run_lock:
+        _current_run = RunRecorder()
+        return _current_run
+
+def current_run():
+    return _current_run
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _results(results):
+    return {
+        name: ("ok" if error is None else str(error))
+        for name, error in (results or {}).items()
+    }
+
+# 4. Write Run Report Function
+def write_run_report(recorder, report_path, results=None):
+    """
+    (4) Writes the JSON run report: host, start/end, per-target results, per-stage aggregates and every span.
+    `results` is the {target: None | exception} dict returned by `run_restore_targets`.
+    """
+    finished = time.time()
+    report = {
+        "host": socket.gethostname(),
+        "started": datetime.fromtimestamp(recorder.started).isoformat(timespec="seconds"),
+        "finished": datetime.fromtimestamp(finished).isoformat(timespec="seconds"),
+        "seconds": round(finished - recorder.started, 1),
+        "results": _results(results),
+        "stages": recorder.stages(),
+        "spans": [item.to_dict() for item in recorder.snapshot()],
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path + ".tmp", "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2, default=str)
+    os.replace(report_path + ".tmp", report_path)
+    logging.info(f"Run report written to {report_path}")
+    return report
+
+# 5. Write Prometheus Textfile Function
+def write_prometheus_textfile(recorder, textfile_path, results=None):
+    """
+    (5) Writes per-stage and per-target gauges in the Prometheus text format for the node_exporter
+    textfile collector. The file is replaced atomically so the collector never reads a partial file.
+    """
+    lines = [
+        "# HELP eto_restore_stage_seconds Wall-clock seconds spent in a restore stage during the last run.",
+        "# TYPE eto_restore_stage_seconds gauge",
+    ]
+    stages = recorder.stages()
+    for name, stage in sorted(stages.items()):
+        lines.append(f'eto_restore_stage_seconds{{stage="{name}"}} {stage["wall_seconds"]}')
+    lines += [
+        "# HELP eto_restore_stage_bytes Bytes moved by a restore stage during the last run.",
+        "# TYPE eto_restore_stage_bytes gauge",
+    ]
+    for name, stage in sorted(stages.items()):
+        lines.append(f'eto_restore_stage_bytes{{stage="{name}"}} {stage["bytes"]}')
+    lines += [
+        "# HELP eto_restore_stage_errors Failed spans of a restore stage during the last run.",
+        "# TYPE eto_restore_stage_errors gauge",
+    ]
+    for name, stage in sorted(stages.items()):
+        lines.append(f'eto_restore_stage_errors{{stage="{name}"}} {stage["errors"]}')
+    lines += [
+        "# HELP eto_restore_target_success 1 if the target was restored successfully in the last run.",
+        "# TYPE eto_restore_target_success gauge",
+    ]
+    for name, result in sorted(_results(results).items()):
+        lines.append(f'eto_restore_target_success{{target="{_label(name)}"}} {int(result == "ok")}')
+    lines += [
+        "# HELP eto_restore_run_seconds Duration of the last restore run.",
+        "# TYPE eto_restore_run_seconds gauge",
+        f"eto_restore_run_seconds {round(time.time() - recorder.started, 1)}",
+        "# HELP eto_restore_run_timestamp_seconds Unix time the last restore run finished.",
+        "# TYPE eto_restore_run_timestamp_seconds gauge",
+        f"eto_restore_run_timestamp_seconds {int(time.time())}",
+    ]
+
+    os.makedirs(os.path.dirname(os.path.abspath(textfile_path)), exist_ok=True)
+    with open(textfile_path + ".tmp", "w", encoding="utf-8", newline="\n") as textfile:
+        textfile.write("\n".join(lines) + "\n")
+    os.replace(textfile_path + ".tmp", textfile_path)
+    logging.info(f"Prometheus metrics written to {textfile_path}")